@@ -0,0 +1,43 @@
+"""Microbenchmark of message encoders
+
+Reports how many payload bytes fit into one message of the given length
+and how fast each encoder encodes/decodes a full message.
+
+Usage: python bin/benchmark_encoders.py [max_message_length]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.message_encoder.message_encoder_factory import MessageEncoderFactory
+
+ENCODERS = ['base64', 'base85', 'base32768']
+
+
+def benchmark(max_message_length: int, rounds: int = 200) -> None:
+    base_payload = None
+    print(f"Message length limit: {max_message_length} characters")
+    print(f"{'encoder':<12}{'bytes/msg':>10}{'vs base64':>11}{'encode MB/s':>13}{'decode MB/s':>13}")
+
+    for encoder_type in ENCODERS:
+        encoder = MessageEncoderFactory.create_encoder(encoder_type)
+        payload_size = encoder.max_decoded_size(max_message_length)
+        if base_payload is None:
+            base_payload = payload_size
+
+        data = os.urandom(payload_size)
+        encoded = encoder.encode_data(data)
+        assert len(encoded) <= max_message_length
+        assert encoder.decode_data(encoded) == data
+
+        encode_time = timeit.timeit(lambda: encoder.encode_data(data), number=rounds) / rounds
+        decode_time = timeit.timeit(lambda: encoder.decode_data(encoded), number=rounds) / rounds
+
+        print(f"{encoder_type:<12}{payload_size:>10}{payload_size / base_payload:>10.2f}x"
+              f"{payload_size / encode_time / 1e6:>13.1f}{payload_size / decode_time / 1e6:>13.1f}")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 4096)
@@ -0,0 +1,85 @@
+"""Benchmark of the inbound message dispatch path
+
+Compares the old dispatch, which ran every handler call through
+run_in_executor, with the direct event-loop dispatch of MessageTransport.
+Reports per-message latency and CPU time for decoding and unpacking a
+full frame.
+
+Usage: python bin/benchmark_inbound.py [messages]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.message_encoder.message_encoder_factory import MessageEncoderFactory
+from src.message_encoder.packet_framer import PacketFramer
+from src.message_transports.base_message_transport import MessageTransport
+
+
+class BenchmarkMessageTransport(MessageTransport):
+    """Transport that only dispatches messages fed by the benchmark"""
+
+    async def connect(self) -> None:
+        pass
+
+    async def send_data(self, data: bytes) -> None:
+        pass
+
+    async def send_control(self, message: str) -> None:
+        pass
+
+    async def disconnect(self) -> None:
+        pass
+
+    async def receive(self, message: str) -> None:
+        await self._handle_incoming_data(self.encoder.decode_message(message))
+
+    async def receive_via_executor(self, message: str) -> None:
+        # Dispatch as it was done before handlers became event-loop native
+        data = self.encoder.decode_message(message)
+        await asyncio.get_running_loop().run_in_executor(None, self._data_handler, data)
+
+
+async def run(messages: int, via_executor: bool) -> tuple[float, float]:
+    transport = BenchmarkMessageTransport()
+    packets_seen = 0
+
+    def handler(data: bytes) -> None:
+        nonlocal packets_seen
+        packets_seen += len(PacketFramer.unpack(data)[-1])
+
+    transport.set_data_handler(handler)
+    packets = [os.urandom(100)] * (transport.get_max_payload_size() // 102 - 1)
+    message = transport.encoder.encode_message(PacketFramer.pack(0, packets))
+    receive = transport.receive_via_executor if via_executor else transport.receive
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(messages):
+        await receive(message)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    assert packets_seen == messages * len(packets)
+    return wall / messages * 1e6, cpu / messages * 1e6
+
+
+async def main(messages: int) -> None:
+    print(f"{messages} messages of {MessageEncoderFactory.create_encoder().max_payload_size(4096)} bytes")
+    print(f"{'dispatch':<12}{'latency us':>12}{'cpu us':>10}")
+    results = {}
+    for name, via_executor in (('executor', True), ('event loop', False)):
+        results[name] = await run(messages, via_executor)
+        latency, cpu = results[name]
+        print(f"{name:<12}{latency:>12.1f}{cpu:>10.1f}")
+
+    saved_latency = results['executor'][0] - results['event loop'][0]
+    saved_cpu = results['executor'][1] - results['event loop'][1]
+    print(f"saved per message: {saved_latency:.1f} us latency, {saved_cpu:.1f} us cpu")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
@@ -0,0 +1,209 @@
+"""End-to-end tunnel benchmark over in-memory loopback transports
+
+Runs two TunnelManager instances in one process, connected by a loopback
+messenger link with configurable latency, jitter, loss, message size and
+message rate limits. Packets injected into one tunnel are timed until the
+other tunnel writes them out. Reports delivered packets per second,
+goodput, p50/p99 one-way latency and CPU time per packet (both tunnels and
+the link share the process, so CPU covers both ends) for every encoder and
+configuration.
+
+Usage: python bin/benchmark_tunnel.py [--packets 2000] [--size 200] [--latency 0.05]
+       [--message-rate 30] [--encoders base64,base32768] [--configs plain,zlib,fec]
+       [--trace trace.json --trace-sample-rate 0.05] [--codec-executor process --offload-threshold 4096]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.tunnel_manager import TunnelManager
+from src.data_transports.loopback.loopback_data_transport import LoopbackDataTransport
+from src.message_encoder.codec_pipeline import CodecPipeline
+from src.message_encoder.message_encoder_factory import MessageEncoderFactory
+from src.message_transports.base_message_transport import MessageTransport
+from src.message_transports.fec_message_transport import FecMessageTransport
+from src.message_transports.loopback.loopback_message_transport import LoopbackLink, LoopbackMessageTransport
+from src.message_transports.reliable_message_transport import ReliableMessageTransport
+from src.utils.tracer import PacketTracer
+
+ENCODERS = ['base64', 'base85', 'base32768']
+# Configuration name -> compression and the protocol layers of both peers
+CONFIGS = {
+    'plain': {},
+    'zlib': {'compression': 'zlib'},
+    'fec': {'fec': True},
+    'reliable': {'reliable': True},
+    'rate-control': {'rate_control': True},
+}
+
+# Packet id and injection time at the start of every packet
+PACKET_HEADER = struct.Struct('!Id')
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def wrap(transport: MessageTransport, config: dict) -> MessageTransport:
+    """Stack the protocol layers of a configuration, as MessageTransportFactory does"""
+    if config.get('fec'):
+        transport = FecMessageTransport(transport)
+    if config.get('reliable'):
+        transport = ReliableMessageTransport(transport)
+    transport.rate_control = config.get('rate_control', False)
+    return transport
+
+
+def make_packet(index: int, size: int, entropy: float) -> bytes:
+    random_size = int((size - PACKET_HEADER.size) * entropy)
+    filler = os.urandom(random_size) + bytes(size - PACKET_HEADER.size - random_size)
+    return PACKET_HEADER.pack(index, time.perf_counter()) + filler
+
+
+async def run(args: argparse.Namespace, encoder_type: str, config: dict,
+              tracers: list[PacketTracer]) -> dict:
+    link = LoopbackLink(latency=args.latency, jitter=args.jitter, loss=args.loss,
+                        max_message_length=args.max_message_length, rate_limit=args.message_rate, seed=1)
+    encoders = [MessageEncoderFactory.create_encoder(encoder_type, config.get('compression', 'none')) for _ in range(2)]
+    ends = [
+        wrap(LoopbackMessageTransport(link, {
+            'encoder': encoder,
+            'codec': CodecPipeline(encoder, args.codec_executor, args.codec_workers, args.offload_threshold),
+            'send_window': args.send_window,
+            'rate_limit': args.message_rate or args.unlimited_rate,
+            'bulk_threshold': args.bulk_threshold,
+        }), config)
+        for encoder in encoders
+    ]
+
+    latencies: list[float] = []
+    received_bytes = 0
+    last_arrival = 0.0
+    seen: set[int] = set()
+    done = asyncio.Event()
+
+    def sink(packet: bytes) -> None:
+        nonlocal received_bytes, last_arrival
+        index, sent_at = PACKET_HEADER.unpack_from(packet)
+        if index in seen:
+            return
+        seen.add(index)
+        last_arrival = time.perf_counter()
+        latencies.append(last_arrival - sent_at)
+        received_bytes += len(packet)
+        if len(seen) == args.packets:
+            done.set()
+
+    sender = LoopbackDataTransport({'queue_size': 256})
+    receiver = LoopbackDataTransport({}, sink)
+    tunnels = [
+        TunnelManager(end, data_transport, tracers[index] if tracers else None)
+        for index, (end, data_transport) in enumerate(zip(ends, (sender, receiver)))
+    ]
+    tasks = [asyncio.create_task(tunnel.start_tunnel()) for tunnel in tunnels]
+    # Let both "ready" messages arrive before the traffic
+    await asyncio.sleep(args.latency + args.jitter + 0.1)
+
+    cpu_start = time.process_time()
+    started = time.perf_counter()
+    interval = 1.0 / args.packet_rate if args.packet_rate else 0.0
+    for index in range(args.packets):
+        if interval:
+            delay = started + index * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await sender.inject(make_packet(index, args.size, args.entropy))
+    try:
+        await asyncio.wait_for(done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    # Rates up to the last delivered packet, a run with lost packets ends with the timeout
+    elapsed = (last_arrival or time.perf_counter()) - started
+    cpu = time.process_time() - cpu_start
+
+    for tunnel in tunnels:
+        await tunnel.stop_tunnel()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    delivered = len(seen)
+    return {
+        'delivered': delivered,
+        'packets_per_second': delivered / elapsed,
+        'goodput': received_bytes / elapsed,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'cpu_per_packet': cpu / delivered if delivered else 0.0,
+        'messages': link.delivered,
+        'throttled': link.throttled,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(f"{args.packets} packets of {args.size} bytes, link latency {args.latency}s "
+          f"jitter {args.jitter}s loss {args.loss:.0%}, "
+          f"{args.max_message_length} chars/msg, {args.message_rate or 'unlimited'} msgs/s")
+    print(f"{'encoder':<11}{'config':<14}{'delivered':>10}{'pkt/s':>9}{'goodput KB/s':>14}"
+          f"{'p50 ms':>9}{'p99 ms':>9}{'cpu us/pkt':>12}{'msgs':>7}{'throttled':>11}")
+    events = []
+    pids = itertools.count(1)
+    for encoder_type in args.encoders.split(','):
+        for config_name in args.configs.split(','):
+            # Sender and receiver of every run show up as separate processes in one trace
+            tracers = [
+                PacketTracer(None, sample_rate=sample_rate, pid=next(pids), name=f"{encoder_type} {config_name} {peer}")
+                for peer, sample_rate in (('sender', args.trace_sample_rate), ('receiver', 0.0))
+            ] if args.trace else []
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output if not args.verbose else sys.stdout):
+                result = await run(args, encoder_type, CONFIGS[config_name], tracers)
+            for tracer in tracers:
+                events.extend(tracer.events())
+            print(f"{encoder_type:<11}{config_name:<14}{result['delivered']:>10}"
+                  f"{result['packets_per_second']:>9.0f}{result['goodput'] / 1024:>14.1f}"
+                  f"{result['p50'] * 1000:>9.1f}{result['p99'] * 1000:>9.1f}"
+                  f"{result['cpu_per_packet'] * 1e6:>12.1f}{result['messages']:>7}{result['throttled']:>11}")
+    if args.trace:
+        PacketTracer.save(args.trace, events)
+        print(f"Trace written to {args.trace}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packets', type=int, default=2000, help="packets per run")
+    parser.add_argument('--size', type=int, default=200, help="packet size in bytes")
+    parser.add_argument('--entropy', type=float, default=1.0, help="random fraction of packet bytes, rest is zeros")
+    parser.add_argument('--packet-rate', type=float, default=0.0, help="offered packets per second, 0 - as fast as possible")
+    parser.add_argument('--latency', type=float, default=0.05, help="one-way link latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random extra delay up to this many seconds")
+    parser.add_argument('--loss', type=float, default=0.0, help="message loss probability")
+    parser.add_argument('--max-message-length', type=int, default=4096, help="characters per message")
+    parser.add_argument('--message-rate', type=float, default=0.0, help="link messages per second, 0 - unlimited")
+    parser.add_argument('--unlimited-rate', type=float, default=1000.0,
+                        help="send rate of the tunnels when the link is not rate limited")
+    parser.add_argument('--send-window', type=int, default=8, help="messages in flight per tunnel")
+    parser.add_argument('--bulk-threshold', type=int, default=0,
+                        help="queued packets switching to large binary frames, 0 - disabled")
+    parser.add_argument('--codec-executor', choices=CodecPipeline.EXECUTORS, default='inline')
+    parser.add_argument('--codec-workers', type=int, default=0, help="codec pool size, 0 - Python default")
+    parser.add_argument('--offload-threshold', type=int, default=CodecPipeline.DEFAULT_OFFLOAD_THRESHOLD,
+                        help="payload bytes from which codec jobs go to the pool")
+    parser.add_argument('--timeout', type=float, default=30.0, help="seconds to wait for the last packets")
+    parser.add_argument('--encoders', default=','.join(ENCODERS))
+    parser.add_argument('--configs', default=','.join(CONFIGS), help=f"comma separated, of {', '.join(CONFIGS)}")
+    parser.add_argument('--trace', default='', help="write a Chrome trace / Perfetto JSON of sampled frames")
+    parser.add_argument('--trace-sample-rate', type=float, default=0.05, help="share of frames traced")
+    parser.add_argument('--verbose', action='store_true', help="show tunnel output")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,23 @@
+"""Merge Chrome trace files, e.g. of both tunnel peers, into one
+
+Spans carry wall-clock timestamps, so with synchronized clocks the frames
+traced by one peer line up with their receive stages on the other.
+
+Usage: python bin/merge_traces.py peer_a.json peer_b.json -o tunnel.json
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.tracer import PacketTracer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('traces', nargs='+', help="trace files written with general.trace_file")
+    parser.add_argument('-o', '--output', required=True)
+    args = parser.parse_args()
+    PacketTracer.merge(args.traces, args.output)
+    print(f"Merged {len(args.traces)} traces into {args.output}")
@@ -0,0 +1,137 @@
+"""Load test of the real VK or Telegram transport against a local messenger emulator
+
+Two TunnelManager instances talk through VKMessageTransport and the VK API
+emulator (aiohttp, messages.send / execute / Long Poll) or through
+TelegramMessageTransport and the in-process Telegram emulator, with the
+emulated rate limits, FloodWait, errors and delivery delays. Traffic
+follows a profile (steady, interactive, burst, ramp or a YAML file, see
+TrafficProfile) and the run exits with status 1 if the profile
+expectations fail, so messages/s or latency regressions show up in CI.
+
+Usage: python bin/messenger_load_test.py --messenger vk --profile burst [--rate-limit 3]
+       python bin/messenger_load_test.py --messenger telegram --profile my_profile.yml
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.tunnel_manager import TunnelManager
+from src.data_transports.loopback.loopback_data_transport import LoopbackDataTransport
+from src.emulator.traffic_profile import TrafficProfile, run_profile
+from src.message_encoder.message_encoder_factory import MessageEncoderFactory
+from src.message_transports.base_message_transport import MessageTransport
+
+
+def transport_rate(args: argparse.Namespace, default: float) -> float:
+    """Send rate of the transports, a margin below the emulated limit"""
+    if args.transport_rate:
+        return args.transport_rate
+    return args.rate_limit * 0.9 if args.rate_limit else default
+
+
+async def create_vk(args: argparse.Namespace) -> tuple[list[MessageTransport], object]:
+    from src.emulator.vk_api_emulator import VKApiEmulator
+    from src.message_transports.vk.vk_message_transport import VKMessageTransport
+    emulator = VKApiEmulator(
+        args.host, args.port,
+        request_rate=args.rate_limit, flood_limit=args.flood_limit, flood_window=args.flood_window,
+        error_rate=args.error_rate, delivery_delay=args.delivery_delay, delivery_jitter=args.delivery_jitter
+    )
+    await emulator.start()
+    transports = [
+        VKMessageTransport({
+            'access_token': str(user), 'peer_id': peer, 'api_url': emulator.api_url,
+            'request_rate': transport_rate(args, 3),
+            'encoder': MessageEncoderFactory.create_encoder(args.encoder, args.compression),
+        })
+        for user, peer in ((1, 2), (2, 1))
+    ]
+    return transports, emulator
+
+
+async def create_telegram(args: argparse.Namespace) -> tuple[list[MessageTransport], object]:
+    from src.emulator.telegram_emulator import TelegramEmulator
+    from src.message_transports.telegram.telegram_message_transport import TelegramMessageTransport
+    emulator = TelegramEmulator(
+        rate_limit=args.rate_limit, flood_wait=args.flood_wait,
+        delivery_delay=args.delivery_delay, delivery_jitter=args.delivery_jitter
+    )
+    transports = [
+        TelegramMessageTransport({
+            'api_id': 0, 'api_hash': '', 'client_factory': emulator.create_client,
+            'accounts': [{'session_name': name, 'peer_username': peer,
+                          'rate_limit': transport_rate(args, 10)}],
+            'encoder': MessageEncoderFactory.create_encoder(args.encoder, args.compression),
+        })
+        for name, peer in (('peer_a', 'peer_b'), ('peer_b', 'peer_a'))
+    ]
+    return transports, emulator
+
+
+async def main(args: argparse.Namespace) -> int:
+    profile = TrafficProfile.load(args.profile)
+    create = create_vk if args.messenger == 'vk' else create_telegram
+    transports, emulator = await create(args)
+
+    sender = LoopbackDataTransport({'queue_size': 1024})
+    receiver = LoopbackDataTransport({})
+    tunnels = [TunnelManager(transports[0], sender), TunnelManager(transports[1], receiver)]
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output if not args.verbose else sys.stdout):
+        tasks = [asyncio.create_task(tunnel.start_tunnel()) for tunnel in tunnels]
+        # Let both "ready" messages arrive before the traffic
+        await asyncio.sleep(args.delivery_delay + args.delivery_jitter + 1.0)
+        started = time.monotonic()
+        result = await run_profile(profile, sender, receiver, args.drain_timeout)
+        messages = emulator.messages_sent
+        result['messages_per_second'] = messages / max(time.monotonic() - started, 1e-9)
+        result['throttle_events'] = sum(transport.throttle_events for transport in transports)
+        for tunnel in tunnels:
+            await tunnel.stop_tunnel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await emulator.stop()
+
+    print(f"Profile {profile.name} over the {args.messenger} emulator: "
+          f"{result['delivered']}/{result['offered']} packets delivered ({result['delivery_ratio']:.1%})")
+    print(f"  {result['packets_per_second']:.1f} packets/s, {result['goodput'] / 1024:.1f} KiB/s goodput, "
+          f"{result['messages_per_second']:.1f} messages/s")
+    print(f"  latency p50 {result['p50'] * 1000:.0f} ms, p99 {result['p99'] * 1000:.0f} ms, "
+          f"{result['throttle_events']} throttling responses")
+    print(f"  emulator: {emulator.get_summary()}")
+
+    failures = profile.check(result)
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messenger', choices=('vk', 'telegram'), default='vk')
+    parser.add_argument('--profile', default='steady', help=f"{', '.join(TrafficProfile.BUILTIN)} or a YAML file")
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help="emulated limit: VK requests/s per user or Telegram messages/s per account, 0 - none")
+    parser.add_argument('--transport-rate', type=float, default=0.0,
+                        help="VK request_rate or Telegram rate_limit of the transports, "
+                             "defaults to 90%% of the emulated limit")
+    parser.add_argument('--flood-limit', type=int, default=0, help="VK messages per flood window, 0 - unlimited")
+    parser.add_argument('--flood-window', type=float, default=60.0)
+    parser.add_argument('--flood-wait', type=int, default=5, help="Telegram FloodWait seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of VK requests failing with error 10")
+    parser.add_argument('--delivery-delay', type=float, default=0.05)
+    parser.add_argument('--delivery-jitter', type=float, default=0.0)
+    parser.add_argument('--encoder', default='base64')
+    parser.add_argument('--compression', default='none')
+    parser.add_argument('--drain-timeout', type=float, default=15.0, help="seconds to wait for the last packets")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089, help="VK emulator port")
+    parser.add_argument('--verbose', action='store_true', help="show tunnel output")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,97 @@
+"""Load test for a SOCKS5 server: thousands of concurrent connections to a local echo server
+
+Start the server first, e.g. python bin/socks_server.py --port 1080, then
+Usage: python bin/socks_load_test.py [--connections 2000] [--bytes 65536] [--socks-port 1080]
+"""
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.data_transports.socks import socks5_protocol as socks5
+
+
+async def echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while data := await reader.read(65536):
+            writer.write(data)
+            await writer.drain()
+        writer.write_eof()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+async def client(args: argparse.Namespace, echo_port: int, payload: bytes, latencies: list[float]) -> None:
+    started = time.monotonic()
+    reader, writer = await asyncio.open_connection(args.socks_host, args.socks_port)
+    try:
+        writer.write(bytes([socks5.SOCKS_VERSION, 1, socks5.AUTH_NONE]))
+        writer.write(bytes([socks5.SOCKS_VERSION, socks5.CMD_CONNECT, 0])
+                     + socks5.encode_address(args.echo_host, echo_port))
+        await reader.readexactly(2)
+        reply = await reader.readexactly(3)
+        await socks5.read_address(reader)
+        if reply[1] != socks5.REP_SUCCEEDED:
+            raise ConnectionError(f"SOCKS reply {reply[1]}")
+        latencies.append(time.monotonic() - started)
+
+        async def send() -> None:
+            writer.write(payload)
+            await writer.drain()
+            writer.write_eof()
+
+        sender = asyncio.create_task(send())
+        received = await reader.read(-1)
+        await sender
+        if received != payload:
+            raise ValueError(f"echo mismatch: {len(received)} of {len(payload)} bytes")
+    finally:
+        writer.close()
+
+
+async def main(args: argparse.Namespace) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = args.connections * 4 + 256
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+
+    server = await asyncio.start_server(echo, args.echo_host, 0, backlog=args.connections)
+    echo_port = server.sockets[0].getsockname()[1]
+    payload = os.urandom(args.bytes)
+    latencies: list[float] = []
+
+    started = time.monotonic()
+    results = await asyncio.gather(
+        *(client(args, echo_port, payload, latencies) for _ in range(args.connections)),
+        return_exceptions=True
+    )
+    elapsed = time.monotonic() - started
+    server.close()
+
+    errors = [result for result in results if isinstance(result, BaseException)]
+    succeeded = len(results) - len(errors)
+    latencies.sort()
+    print(f"Connections: {succeeded}/{args.connections} ok in {elapsed:.2f}s "
+          f"({args.connections / elapsed:.0f} conn/s)")
+    print(f"Throughput: {succeeded * args.bytes * 2 / elapsed / 1024 / 1024:.1f} MiB/s (both directions)")
+    if latencies:
+        print(f"Connect latency: p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    for error in errors[:5]:
+        print(f"Error: {error!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--socks-host', default='127.0.0.1')
+    parser.add_argument('--socks-port', type=int, default=1080)
+    parser.add_argument('--echo-host', default='127.0.0.1')
+    parser.add_argument('--connections', type=int, default=2000)
+    parser.add_argument('--bytes', type=int, default=64 * 1024, help="payload echoed per connection")
+    asyncio.run(main(parser.parse_args()))
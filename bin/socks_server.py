@@ -1,32 +1,182 @@
-import socket, threading, struct
+"""Standalone asyncio SOCKS5 server (CONNECT over IPv4, IPv6 and domain names)
+
+Usage: python bin/socks_server.py [--port 1080] [--idle-timeout 300] ...
+"""
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import sys
+import time
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.data_transports.socks import socks5_protocol as socks5
+from src.data_transports.socks.dns_cache import DnsCache
+
+
+class SocksServer:
+    """SOCKS5 server on asyncio streams
+
+    Each direction is relayed by one coroutine with backpressure: the
+    reader waits while the other side's write buffer is above the high
+    watermark. Half-close is passed through, a connection is closed once
+    both directions ended or nothing moved for idle_timeout seconds.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.dns = DnsCache(ttl=args.dns_ttl)
+        self.active = 0
+        self.total = 0
+        self.failed = 0
+        self.idle_closed = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+
+    async def serve(self) -> None:
+        server = await asyncio.start_server(
+            self.handle_client, self.args.host, self.args.port, backlog=self.args.backlog
+        )
+        print(f"SOCKS server on {self.args.host}:{self.args.port}")
+        async with server:
+            await self.report_loop()
+
+    async def report_loop(self) -> None:
+        last_up, last_down, last_time = 0, 0, time.monotonic()
+        while True:
+            await asyncio.sleep(self.args.stats_interval)
+            now = time.monotonic()
+            elapsed = now - last_time
+            print(f"Connections: {self.active} active, {self.total} total, {self.failed} failed, "
+                  f"{self.idle_closed} idle-closed | "
+                  f"Up: {(self.bytes_up - last_up) / elapsed / 1024:.1f} KiB/s, "
+                  f"Down: {(self.bytes_down - last_down) / elapsed / 1024:.1f} KiB/s | "
+                  f"DNS: {self.dns.hits} hits, {self.dns.misses} misses")
+            last_up, last_down, last_time = self.bytes_up, self.bytes_down, now
+
+    def _tune(self, writer: asyncio.StreamWriter) -> None:
+        writer.transport.set_write_buffer_limits(high=self.args.high_water, low=self.args.low_water)
+        sock = writer.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.total += 1
+        self.active += 1
+        remote_writer: Optional[asyncio.StreamWriter] = None
+        try:
+            try:
+                host, port = await asyncio.wait_for(
+                    socks5.read_connect_request(reader, writer), self.args.handshake_timeout
+                )
+            except socks5.Socks5Error as e:
+                self.failed += 1
+                writer.write(socks5.build_reply(e.reply_code))
+                return
+            except (ValueError, OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                self.failed += 1
+                return
+
+            try:
+                remote_reader, remote_writer = await asyncio.wait_for(
+                    self.open_upstream(host, port), self.args.connect_timeout
+                )
+            except (OSError, ValueError, asyncio.TimeoutError) as e:
+                # ValueError (UnicodeError) - malformed name from the client
+                self.failed += 1
+                writer.write(socks5.build_reply(socks5.reply_code_for_error(e)))
+                return
+
+            bound_host, bound_port = remote_writer.get_extra_info('sockname')[:2]
+            writer.write(socks5.build_reply(socks5.REP_SUCCEEDED, bound_host, bound_port))
+            self._tune(writer)
+            self._tune(remote_writer)
+            await self.relay(reader, writer, remote_reader, remote_writer)
+        finally:
+            self.active -= 1
+            for stream_writer in (writer, remote_writer):
+                if stream_writer is not None:
+                    stream_writer.close()
+
+    async def open_upstream(self, host: str, port: int):
+        """Connect to the first reachable address of host"""
+        last_error: OSError = OSError(f"Can not connect to {host}:{port}")
+        for _, address in await self.dns.resolve(host, port):
+            try:
+                return await asyncio.open_connection(address, port)
+            except OSError as e:
+                last_error = e
+        raise last_error
+
+    async def relay(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter,
+                    remote_reader: asyncio.StreamReader, remote_writer: asyncio.StreamWriter) -> None:
+        activity = [time.monotonic()]
+        tasks = [
+            asyncio.create_task(self.pipe(client_reader, remote_writer, activity, upstream=True)),
+            asyncio.create_task(self.pipe(remote_reader, client_writer, activity, upstream=False))
+        ]
+        try:
+            while True:
+                done, _ = await asyncio.wait(tasks, timeout=self.args.idle_timeout)
+                if len(done) == len(tasks):
+                    return
+                if time.monotonic() - activity[0] >= self.args.idle_timeout:
+                    self.idle_closed += 1
+                    return
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                   activity: list[float], upstream: bool) -> None:
+        """Copy one direction until EOF, then half-close the other side"""
+        try:
+            while True:
+                data = await reader.read(self.args.buffer_size)
+                if not data:
+                    break
+                activity[0] = time.monotonic()
+                if upstream:
+                    self.bytes_up += len(data)
+                else:
+                    self.bytes_down += len(data)
+                writer.write(data)
+                await writer.drain()
+            if writer.can_write_eof():
+                writer.write_eof()
+        except (ConnectionError, OSError):
+            writer.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=1080)
+    parser.add_argument('--backlog', type=int, default=4096)
+    parser.add_argument('--buffer-size', type=int, default=64 * 1024, help="bytes per read")
+    parser.add_argument('--high-water', type=int, default=256 * 1024, help="write buffer size that pauses reading")
+    parser.add_argument('--low-water', type=int, default=64 * 1024, help="write buffer size that resumes reading")
+    parser.add_argument('--idle-timeout', type=float, default=300.0)
+    parser.add_argument('--handshake-timeout', type=float, default=10.0)
+    parser.add_argument('--connect-timeout', type=float, default=10.0)
+    parser.add_argument('--dns-ttl', type=float, default=300.0)
+    parser.add_argument('--stats-interval', type=float, default=10.0)
+    args = parser.parse_args()
+    if args.low_water > args.high_water:
+        parser.error("--low-water must not exceed --high-water")
+
+    # Two sockets per connection
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
 
-def handle_socks(client):
     try:
-        client.recv(262)
-        client.send(b'\x05\x00')
-        data = client.recv(1024)
-        if data[1] == 1:  # CONNECT
-            if data[3] == 1:  # IPv4
-                addr = socket.inet_ntoa(data[4:8])
-                port = struct.unpack('!H', data[8:10])[0]
-            elif data[3] == 3:  # Domain
-                addr_len = data[4]
-                addr = data[5:5+addr_len].decode()
-                port = struct.unpack('!H', data[5+addr_len:7+addr_len])[0]
-            remote = socket.socket()
-            remote.connect((addr, port))
-            client.send(b'\x05\x00\x00\x01\x00\x00\x00\x00\x00\x00')
-            def forward(s1, s2):
-                while True:
-                    try: s2.send(s1.recv(4096))
-                    except: break
-            threading.Thread(target=forward, args=(client, remote)).start()
-            threading.Thread(target=forward, args=(remote, client)).start()
-    except: pass
-server = socket.socket()
-server.bind(('0.0.0.0', 1080))
-server.listen(5)
-print('SOCKS server on port 1080')
-while True:
-    client, addr = server.accept()
-    threading.Thread(target=handle_socks, args=(client,)).start()
\ No newline at end of file
+        asyncio.run(SocksServer(args).serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Local VK API stand-in for tunnel tests and throughput measurement
+
+Point both peers at it with 'api_url: http://127.0.0.1:8081/method/' and
+use user ids as access tokens (peer A: access_token 1, peer_id 2; peer B:
+access_token 2, peer_id 1). Message rates are printed periodically.
+VK limits can be emulated with --request-rate (error 6) and --flood-limit
+(error 9), network conditions with --delivery-delay and --error-rate.
+
+Usage: python bin/vk_emulator.py [--host 127.0.0.1] [--port 8081] [--request-rate 3]
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.emulator.vk_api_emulator import VKApiEmulator
+
+
+async def main(args: argparse.Namespace) -> None:
+    emulator = VKApiEmulator(
+        args.host, args.port, key_lifetime=args.key_lifetime,
+        request_rate=args.request_rate, flood_limit=args.flood_limit, flood_window=args.flood_window,
+        error_rate=args.error_rate, delivery_delay=args.delivery_delay, delivery_jitter=args.delivery_jitter
+    )
+    await emulator.start()
+    print(f"VK API emulator on {emulator.api_url}")
+    try:
+        while True:
+            await asyncio.sleep(args.report_interval)
+            print(emulator.get_summary())
+    finally:
+        await emulator.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--key-lifetime', type=float, default=0.0, help="seconds before Long Poll keys expire, 0 - never")
+    parser.add_argument('--request-rate', type=float, default=0.0, help="API requests per second per user, 0 - unlimited")
+    parser.add_argument('--flood-limit', type=int, default=0, help="messages per flood window per user, 0 - unlimited")
+    parser.add_argument('--flood-window', type=float, default=60.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests failing with error 10")
+    parser.add_argument('--delivery-delay', type=float, default=0.0, help="seconds before a message reaches Long Poll")
+    parser.add_argument('--delivery-jitter', type=float, default=0.0)
+    parser.add_argument('--report-interval', type=float, default=5.0)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -4,6 +4,8 @@ from src.config.base_config import BaseConfig
 from src.message_transports.message_transport_factory import MessageTransportFactory
 from src.data_transports.data_transport_factory import DataTransportFactory
 from src.core.tunnel_manager import TunnelManager
+from src.utils.metrics_server import MetricsServer
+from src.utils.tracer import PacketTracer
 
 
 async def main():
@@ -17,12 +19,34 @@ async def main():
         message_transport_factory = MessageTransportFactory(config)
         message_transport = message_transport_factory.get_message_transport()
 
+        # Optional sampling frame tracer, written as a Chrome trace on stop
+        tracer = None
+        trace_file = config.get_config_value_safe('general.trace_file', '')
+        if trace_file:
+            tracer = PacketTracer(
+                trace_file,
+                sample_rate=float(config.get_config_value_safe('general.trace_sample_rate', 0.01)),
+                max_events=int(config.get_config_value_safe('general.trace_max_events', 100000)),
+                name=config.get_config_value_safe('general.trace_name', None)
+            )
+
         # Dependency Injection in TunnelManager
         tunnel = TunnelManager(
             message_transport=message_transport,
-            data_transport=data_transport
+            data_transport=data_transport,
+            tracer=tracer
         )
         
+        # Optional Prometheus endpoint on a local port
+        metrics_port = config.get_config_value_safe('general.metrics_port', 0)
+        if metrics_port:
+            metrics_server = MetricsServer(
+                tunnel.stats,
+                host=config.get_config_value_safe('general.metrics_host', '127.0.0.1'),
+                port=int(metrics_port)
+            )
+            await metrics_server.start()
+        
         # Start tunnel
         await tunnel.start_tunnel()
         
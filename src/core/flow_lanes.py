@@ -0,0 +1,48 @@
+from typing import Iterable
+
+
+class FlowLanes:
+    """Keeps the frames of a TCP flow on one lane while earlier ones are unsent
+
+    The lane of a frame follows from its size, but lanes are reordered
+    independently: a small interactive frame could overtake a queued bulk
+    frame of the same flow and the inner TCP would see reordering. A flow
+    with unsent frames therefore keeps their lane. A frame carrying several
+    flows takes the lowest priority lane any of them is pinned to, moving
+    a flow down is safe as the scheduler sends its queued frames first.
+    """
+
+    def __init__(self):
+        # flow -> [lane, unsent frames]
+        self._flows: dict[tuple, list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._flows)
+
+    def lane_for(self, flows: Iterable[tuple], lane: int) -> int:
+        """Lane for a frame of flows that would go to lane by its size"""
+        for flow in flows:
+            entry = self._flows.get(flow)
+            if entry is not None and entry[0] > lane:
+                lane = entry[0]
+        return lane
+
+    def pin(self, flows: Iterable[tuple], lane: int) -> None:
+        """Frame of flows was queued in lane"""
+        for flow in flows:
+            entry = self._flows.get(flow)
+            if entry is None:
+                self._flows[flow] = [lane, 1]
+            else:
+                entry[0] = max(entry[0], lane)
+                entry[1] += 1
+
+    def release(self, flows: Iterable[tuple]) -> None:
+        """Frame of flows was sent or given up"""
+        for flow in flows:
+            entry = self._flows.get(flow)
+            if entry is None:
+                continue
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._flows[flow]
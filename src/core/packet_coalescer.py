@@ -0,0 +1,160 @@
+import asyncio
+import collections
+import time
+from typing import Optional
+from src.message_encoder.packet_framer import PacketFramer
+from src.message_encoder.header_compressor import HeaderCompressor
+from src.core.tcp_packet_info import parse_tcp, seq_after
+from src.utils.statistics import TunnelStatistics
+
+
+class PacketCoalescer:
+    """Outbound packet queue that groups packets into message-sized batches
+
+    A batch is closed when the next packet would not fit into
+    max_payload_size or when flush_deadline seconds passed since
+    the first packet of the batch was queued.
+
+    With thinning enabled the queue looks into TCP headers: a pure ACK
+    replaces the older pure ACK of the same flow that is still waiting,
+    and a retransmitted segment is dropped while its original is queued.
+
+    With a header compressor packets leave the queue compressed, so the
+    batch size accounts for the saved header bytes.
+
+    With stats the time each packet waited in the queue goes to the
+    'read' latency histogram. batch_queued_at is the time the first packet
+    of the last batch was queued, batch_flows the TCP flows in it.
+    """
+
+    def __init__(self, max_payload_size: int, flush_deadline: float, max_queue_size: int = 1024,
+                 thinning: bool = False, stats: Optional[TunnelStatistics] = None,
+                 header_compressor: Optional[HeaderCompressor] = None):
+        self.max_payload_size = max_payload_size
+        self.flush_deadline = flush_deadline
+        self.max_queue_size = max_queue_size
+        self.thinning = thinning
+        self.stats = stats
+        self.header_compressor = header_compressor
+        # Entries are [packet, pure ACK flow, segment key, ACK number, queued at, TCP flow],
+        # mutable so a queued ACK can be replaced in place
+        self._queue: collections.deque[list] = collections.deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._pending_acks: dict[tuple, list] = {}
+        self._queued_segments: set[tuple] = set()
+        self._pending: Optional[bytes] = None
+        self._pending_queued_at = 0.0
+        self._pending_flow: Optional[tuple] = None
+        self._popped_queued_at = 0.0
+        self._popped_flow: Optional[tuple] = None
+        self.batch_queued_at = 0.0
+        self.batch_flows: set[tuple] = set()
+
+    def qsize(self) -> int:
+        """Number of packets waiting to be sent"""
+        return len(self._queue) + (1 if self._pending is not None else 0)
+
+    async def put(self, packet: bytes) -> None:
+        """Queue packet for sending"""
+        ack_flow = segment = None
+        info = parse_tcp(packet)
+        if self.thinning and info is not None:
+            if info.is_pure_ack:
+                entry = self._pending_acks.get(info.flow)
+                # Duplicate ACKs signal loss to the sender, only a newer ACK replaces
+                if entry is not None and seq_after(info.ack, entry[3]):
+                    if self.stats is not None:
+                        self.stats.add_thinned_ack(len(entry[0]))
+                    entry[0], entry[3] = packet, info.ack
+                    return
+                ack_flow = info.flow
+            elif info.payload_length:
+                segment = (info.flow, info.seq, info.payload_length)
+                if segment in self._queued_segments:
+                    if self.stats is not None:
+                        self.stats.add_dropped_retransmit(len(packet))
+                    return
+
+        while len(self._queue) >= self.max_queue_size:
+            self._not_full.clear()
+            await self._not_full.wait()
+
+        if info is not None:
+            entry = [packet, ack_flow, segment, info.ack, time.monotonic(), info.flow]
+        else:
+            entry = [packet, None, None, 0, time.monotonic(), None]
+        if ack_flow is not None:
+            self._pending_acks[ack_flow] = entry
+        if segment is not None:
+            self._queued_segments.add(segment)
+        self._queue.append(entry)
+        self._not_empty.set()
+
+    def _pop(self) -> bytes:
+        packet, ack_flow, segment, _, queued_at, flow = entry = self._queue.popleft()
+        if ack_flow is not None and self._pending_acks.get(ack_flow) is entry:
+            del self._pending_acks[ack_flow]
+        if segment is not None:
+            self._queued_segments.discard(segment)
+        if len(self._queue) < self.max_queue_size:
+            self._not_full.set()
+        self._popped_queued_at = queued_at
+        self._popped_flow = flow
+        if self.stats is not None:
+            self.stats.observe('read', time.monotonic() - queued_at)
+        if self.header_compressor is not None:
+            return self.header_compressor.compress(packet)
+        return packet
+
+    async def _get(self) -> bytes:
+        while not self._queue:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self._pop()
+
+    async def get_batch(self, max_payload_size: Optional[int] = None) -> list[bytes]:
+        """Wait for the next batch of packets, optionally with a larger size limit"""
+        if max_payload_size is None:
+            max_payload_size = self.max_payload_size
+
+        if self._pending is not None:
+            first, self._pending = self._pending, None
+            self.batch_queued_at = self._pending_queued_at
+            flow = self._pending_flow
+        else:
+            first = await self._get()
+            self.batch_queued_at = self._popped_queued_at
+            flow = self._popped_flow
+
+        batch = [first]
+        self.batch_flows = {flow} if flow is not None else set()
+        size = PacketFramer.record_size(first)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_deadline
+
+        while size < max_payload_size:
+            if not self._queue:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    packet = await asyncio.wait_for(self._get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                packet = self._pop()
+
+            packet_size = PacketFramer.record_size(packet)
+            if size + packet_size > max_payload_size:
+                self._pending = packet
+                self._pending_queued_at = self._popped_queued_at
+                self._pending_flow = self._popped_flow
+                break
+            batch.append(packet)
+            if self._popped_flow is not None:
+                self.batch_flows.add(self._popped_flow)
+            size += packet_size
+
+        return batch
@@ -0,0 +1,386 @@
+import asyncio
+import collections
+import math
+import random
+import time
+from typing import Optional
+from src.core.packet_coalescer import PacketCoalescer
+from src.core.token_bucket import TokenBucket
+
+
+class _SentFrame:
+    """Frame waiting for an ack report of the peer"""
+
+    __slots__ = ('index', 'submitted_at', 'sent_at', 'delivered', 'delivered_at', 'app_limited')
+
+    def __init__(self, index: int, app_limited: bool):
+        self.index = index
+        self.submitted_at = time.monotonic()
+        self.sent_at: Optional[float] = None
+        # Peer delivery count when the frame was sent, for the delivery rate sample
+        self.delivered = 0
+        self.delivered_at = 0.0
+        self.app_limited = app_limited
+
+
+class PathEstimator:
+    """RTT and delivery rate of the tunnel path
+
+    RTT samples come from timestamped ping/pong and from ack reports the
+    peer sends every report interval. A report names the frame received
+    last, how long ago it arrived and how many frames the peer received in
+    total, so the sender gets one RTT sample per report without the
+    report delay in it. The delivery rate is sampled like in BBR: frames
+    delivered between sending the reported frame and its report, over the
+    time between them. Rates are in messages per second, the unit of the
+    messenger limits.
+
+    Frames sent before the reported one count as delivered or lost, the
+    rest is in flight.
+    """
+
+    ACK_REPORT = 'rate-ack'
+    # Window of the minimum RTT and of the maximum delivery rate
+    MIN_RTT_WINDOW = 10.0
+    BANDWIDTH_WINDOW = 10.0
+
+    def __init__(self):
+        self.srtt: Optional[float] = None
+        self.min_rtt: Optional[float] = None
+        self.min_rtt_at = 0.0
+        self.rtt_samples = 0
+
+        # Sender state
+        self._frames: collections.OrderedDict[tuple[int, int], _SentFrame] = collections.OrderedDict()
+        self._sent_index = 0
+        self._sent_in_flight = 0
+        self._bandwidth: collections.deque[tuple[float, float]] = collections.deque()
+        self.delivered = 0
+        self.delivered_at = time.monotonic()
+        self.lost_frames = 0
+
+        # Receiver state
+        self._received = 0
+        self._reported = 0
+        self._last_received: Optional[tuple[int, int, float]] = None
+
+    @property
+    def in_flight(self) -> int:
+        """Frames submitted but not covered by an ack report yet"""
+        return len(self._frames)
+
+    @property
+    def sent_frames(self) -> int:
+        """Frames submitted since the start"""
+        return self._sent_index
+
+    @property
+    def bandwidth(self) -> Optional[float]:
+        """Maximum delivery rate within the window, messages per second"""
+        self._expire_bandwidth(time.monotonic())
+        return self._bandwidth[0][1] if self._bandwidth else None
+
+    def reset(self) -> None:
+        """Forget frame state, e.g. after the peer restarted"""
+        self._frames.clear()
+        self._sent_in_flight = 0
+        self.delivered = 0
+        self.delivered_at = time.monotonic()
+        self._received = self._reported = 0
+        self._last_received = None
+
+    def add_rtt_sample(self, rtt: float) -> None:
+        now = time.monotonic()
+        self.rtt_samples += 1
+        self.srtt = rtt if self.srtt is None else 0.875 * self.srtt + 0.125 * rtt
+        if self.min_rtt is None or rtt <= self.min_rtt or now - self.min_rtt_at > self.MIN_RTT_WINDOW:
+            self.min_rtt = rtt
+            self.min_rtt_at = now
+
+    def min_rtt_expired(self) -> bool:
+        """Minimum RTT was not confirmed within its window"""
+        return self.min_rtt is not None and time.monotonic() - self.min_rtt_at > self.MIN_RTT_WINDOW
+
+    def _add_bandwidth_sample(self, rate: float, app_limited: bool) -> None:
+        now = time.monotonic()
+        self._expire_bandwidth(now)
+        # Frames sent without enough data to fill the rate only count if they raise the maximum
+        if app_limited and self._bandwidth and rate < self._bandwidth[0][1]:
+            return
+        # Monotonic deque, the front is the maximum of the window
+        while self._bandwidth and self._bandwidth[-1][1] <= rate:
+            self._bandwidth.pop()
+        self._bandwidth.append((now, rate))
+
+    def _expire_bandwidth(self, now: float) -> None:
+        while self._bandwidth and now - self._bandwidth[0][0] > self.BANDWIDTH_WINDOW:
+            self._bandwidth.popleft()
+
+    def ping_message(self) -> str:
+        """Ping carrying the send time"""
+        return f"ping {time.monotonic():.6f}"
+
+    def on_pong(self, message: str) -> None:
+        """RTT sample from a pong echoing the ping time"""
+        try:
+            sent_at = float(message.split(' ', 1)[1])
+        except (IndexError, ValueError):
+            return
+        rtt = time.monotonic() - sent_at
+        if rtt >= 0:
+            self.add_rtt_sample(rtt)
+
+    def on_submit(self, lane: int, sequence: int, app_limited: bool) -> None:
+        """Frame queued for sending"""
+        self._frames[(lane, sequence)] = _SentFrame(self._sent_index, app_limited)
+        self._sent_index += 1
+
+    def on_send(self, lane: int, sequence: int) -> None:
+        """Frame handed to the messenger"""
+        frame = self._frames.get((lane, sequence))
+        if frame is None:
+            return
+        frame.sent_at = time.monotonic()
+        # After an idle period the rate sample starts with this frame
+        if not self._sent_in_flight:
+            self.delivered_at = frame.sent_at
+        frame.delivered, frame.delivered_at = self.delivered, self.delivered_at
+        self._sent_in_flight += 1
+
+    def on_ack_report(self, message: str) -> Optional[_SentFrame]:
+        """Apply peer ack report, returns the reported frame if it is known"""
+        try:
+            lane, sequence, held_ms, delivered = (int(value) for value in message.split()[1:5])
+        except ValueError:
+            return None
+        now = time.monotonic()
+        if delivered < self.delivered:
+            # Peer restarted its count
+            self.delivered = 0
+        self.delivered, self.delivered_at = delivered, now
+
+        frame = self._frames.get((lane, sequence))
+        if frame is None:
+            return None
+        while True:
+            key, older = self._frames.popitem(last=False)
+            self._forget(older)
+            if key == (lane, sequence):
+                break
+
+        if frame.sent_at is not None:
+            rtt = now - frame.sent_at - held_ms / 1000
+            if rtt > 0:
+                self.add_rtt_sample(rtt)
+            elapsed = now - frame.delivered_at
+            if elapsed > 0:
+                self._add_bandwidth_sample((delivered - frame.delivered) / elapsed, frame.app_limited)
+        return frame
+
+    def expire(self, timeout: float) -> int:
+        """Count frames without a report for timeout seconds as lost"""
+        cutoff = time.monotonic() - timeout
+        expired = 0
+        while self._frames:
+            frame = next(iter(self._frames.values()))
+            if (frame.sent_at or frame.submitted_at) > cutoff:
+                break
+            self._forget(self._frames.popitem(last=False)[1])
+            expired += 1
+        self.lost_frames += expired
+        return expired
+
+    def _forget(self, frame: _SentFrame) -> None:
+        if frame.sent_at is not None:
+            self._sent_in_flight -= 1
+
+    def on_receive(self, lane: int, sequence: int) -> None:
+        """Frame arrived from the peer"""
+        self._received += 1
+        self._last_received = (lane, sequence, time.monotonic())
+
+    def ack_report(self) -> Optional[str]:
+        """Report of the frames received since the last report, None if there were none"""
+        if self._last_received is None or self._received == self._reported:
+            return None
+        self._reported = self._received
+        lane, sequence, received_at = self._last_received
+        held_ms = int((time.monotonic() - received_at) * 1000)
+        return f"{self.ACK_REPORT} {lane} {sequence} {held_ms} {self._received}"
+
+
+class RateController:
+    """BBR-style controller of the send rate, flush deadline and in-flight window
+
+    The path model is the bottleneck rate (maximum delivery rate) and the
+    minimum RTT of a PathEstimator. STARTUP raises the pacing rate by 2/ln2
+    per round until the delivery rate stops growing by 25% for three rounds,
+    DRAIN empties the queue built meanwhile, PROBE_BW cycles the pacing gain
+    (1.25, 0.75, then 1 for six phases of one RTT each) and PROBE_RTT drops
+    the window to MIN_WINDOW when the minimum RTT was not seen for its
+    window. The pacing rate is the token bucket rate, the in-flight window
+    is twice the bandwidth-delay product plus the frames sent during one
+    report interval, and the coalescer flush deadline follows the pacing
+    interval, since a message cannot leave earlier anyway.
+
+    Messenger throttling is the limit a messenger path has instead of a
+    queue: it ends STARTUP and sets a rate ceiling below the throttled rate,
+    which grows back slowly while there is no throttling.
+    """
+
+    STARTUP_GAIN = 2 / math.log(2)
+    PROBE_GAINS = (1.25, 0.75, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0)
+    CWND_GAIN = 2.0
+    MIN_WINDOW = 4
+    FULL_BANDWIDTH_GROWTH = 1.25
+    FULL_BANDWIDTH_ROUNDS = 3
+    PROBE_RTT_DURATION = 0.2
+    THROTTLE_BACKOFF = 0.85
+    # Ceiling growth per second without throttling
+    CEILING_GROWTH = 0.02
+
+    STARTUP = 'startup'
+    DRAIN = 'drain'
+    PROBE_BW = 'probe_bw'
+    PROBE_RTT = 'probe_rtt'
+
+    def __init__(self, estimator: PathEstimator, bucket: TokenBucket, coalescer: PacketCoalescer,
+                 report_interval: float = 1.0):
+        self.estimator = estimator
+        self.bucket = bucket
+        self.coalescer = coalescer
+        self.report_interval = report_interval
+        self.base_rate = bucket.rate
+        self.max_rate = bucket.max_rate
+        self.base_flush_deadline = coalescer.flush_deadline
+        self.state = self.STARTUP
+        self.pacing_rate = bucket.rate
+        self.ceiling = self.max_rate
+        self._ceiling_at = time.monotonic()
+        self._throttle_count = bucket.throttle_count
+
+        self._round = 0
+        self._round_end = 0
+        self._full_bandwidth = 0.0
+        self._full_bandwidth_rounds = 0
+        self._cycle = 0
+        self._cycle_at = time.monotonic()
+        self._probe_rtt_until = 0.0
+        self._window_open = asyncio.Event()
+
+    @property
+    def window(self) -> Optional[int]:
+        """In-flight frame limit, None until the path is measured"""
+        bandwidth, min_rtt = self.estimator.bandwidth, self.estimator.min_rtt
+        if bandwidth is None or min_rtt is None:
+            return None
+        if self.state == self.PROBE_RTT:
+            return self.MIN_WINDOW
+        gain = self.STARTUP_GAIN if self.state == self.STARTUP else self.CWND_GAIN
+        return max(self.MIN_WINDOW, math.ceil(gain * bandwidth * min_rtt + self.pacing_rate * self.report_interval))
+
+    def stall_timeout(self) -> float:
+        """Seconds without an ack report after which a frame counts as lost"""
+        return max(2.0, 4 * (self.estimator.srtt or 1.0) + 2 * self.report_interval)
+
+    async def wait_for_window(self) -> None:
+        """Wait until another frame fits into the in-flight window"""
+        while True:
+            window = self.window
+            if window is None or self.estimator.in_flight < window:
+                return
+            self._window_open.clear()
+            try:
+                await asyncio.wait_for(self._window_open.wait(), self.stall_timeout())
+            except asyncio.TimeoutError:
+                self.estimator.expire(self.stall_timeout())
+
+    def reset(self) -> None:
+        """Start over with measuring, e.g. after the peer restarted"""
+        self.estimator.reset()
+        self.state = self.STARTUP
+        self._full_bandwidth = 0.0
+        self._full_bandwidth_rounds = 0
+        self._window_open.set()
+
+    def on_ack_report(self, message: str) -> None:
+        """Update the path model and the send parameters from an ack report"""
+        frame = self.estimator.on_ack_report(message)
+        if frame is not None and frame.index >= self._round_end:
+            self._round += 1
+            self._round_end = self.estimator.sent_frames
+            if not frame.app_limited:
+                self._check_full_bandwidth()
+        self.update()
+        self._window_open.set()
+
+    def _check_full_bandwidth(self) -> None:
+        """Leave STARTUP once the delivery rate stops growing"""
+        bandwidth = self.estimator.bandwidth
+        if self.state != self.STARTUP or bandwidth is None:
+            return
+        if bandwidth >= self._full_bandwidth * self.FULL_BANDWIDTH_GROWTH:
+            self._full_bandwidth = bandwidth
+            self._full_bandwidth_rounds = 0
+            return
+        self._full_bandwidth_rounds += 1
+        if self._full_bandwidth_rounds >= self.FULL_BANDWIDTH_ROUNDS:
+            self.state = self.DRAIN
+
+    def update(self) -> None:
+        """Advance the state machine and apply pacing rate and flush deadline"""
+        now = time.monotonic()
+        self._update_ceiling(now)
+        bandwidth, min_rtt = self.estimator.bandwidth, self.estimator.min_rtt
+        phase = max(min_rtt or 0.0, self.report_interval)
+
+        if self.state == self.DRAIN and bandwidth is not None and min_rtt is not None:
+            # Frames sent within a report interval are in flight even on an empty path
+            if self.estimator.in_flight <= bandwidth * (min_rtt + self.report_interval):
+                self._enter_probe_bw(now)
+        elif self.state == self.PROBE_BW and now - self._cycle_at >= phase:
+            self._cycle = (self._cycle + 1) % len(self.PROBE_GAINS)
+            self._cycle_at = now
+        elif self.state == self.PROBE_RTT and now >= self._probe_rtt_until:
+            self.estimator.min_rtt_at = now
+            self._enter_probe_bw(now)
+
+        if self.state in (self.PROBE_BW, self.DRAIN) and self.estimator.min_rtt_expired():
+            self.state = self.PROBE_RTT
+            self._probe_rtt_until = now + max(self.PROBE_RTT_DURATION, min_rtt)
+
+        if bandwidth is None:
+            rate = self.base_rate
+        elif self.state == self.STARTUP:
+            rate = self.STARTUP_GAIN * bandwidth
+        elif self.state == self.DRAIN:
+            rate = bandwidth / self.STARTUP_GAIN
+        elif self.state == self.PROBE_BW:
+            rate = self.PROBE_GAINS[self._cycle] * bandwidth
+        else:
+            rate = bandwidth
+        self.pacing_rate = max(self.bucket.min_rate, min(rate, self.ceiling))
+        # The bucket keeps its own probing within the pacing rate
+        self.bucket.rate = self.bucket.max_rate = self.pacing_rate
+
+        deadline = 1.0 / self.pacing_rate
+        if min_rtt is not None:
+            deadline = min(deadline, min_rtt / 4)
+        self.coalescer.flush_deadline = max(self.base_flush_deadline, deadline)
+
+    def _enter_probe_bw(self, now: float) -> None:
+        self.state = self.PROBE_BW
+        # Any phase but the draining one, so probing does not start with a dip
+        self._cycle = random.choice([index for index in range(len(self.PROBE_GAINS)) if index != 1])
+        self._cycle_at = now
+
+    def _update_ceiling(self, now: float) -> None:
+        """Lower the rate ceiling on messenger throttling, raise it slowly otherwise"""
+        if self.bucket.throttle_count != self._throttle_count:
+            self._throttle_count = self.bucket.throttle_count
+            self.ceiling = max(self.bucket.min_rate, self.pacing_rate * self.THROTTLE_BACKOFF)
+            if self.state == self.STARTUP:
+                self.state = self.DRAIN
+        else:
+            self.ceiling = min(self.max_rate, self.ceiling * (1 + self.CEILING_GROWTH * (now - self._ceiling_at)))
+        self._ceiling_at = now
@@ -0,0 +1,101 @@
+import time
+from typing import Any, Optional
+
+
+class ReorderBuffer:
+    """Restores sending order of frames by their sequence numbers
+
+    Frames that arrive ahead of the expected sequence are held back until
+    the gap is filled. If the gap is not filled within gap_timeout seconds
+    or more than capacity frames are held, the missing frames are skipped.
+    Frames older than the expected sequence are dropped as late duplicates.
+
+    The sender numbers frames from 0, so that is the first expected
+    sequence, also after a reset. Until a frame was delivered, an older
+    frame moves the start back instead, for a peer that was already
+    sending when the buffer was created.
+    """
+
+    SEQUENCE_MODULO = 1 << 32
+
+    def __init__(self, capacity: int = 64, gap_timeout: float = 2.0):
+        self.capacity = capacity
+        self.gap_timeout = gap_timeout
+        self._expected = 0
+        self._delivered = False
+        self._held: dict[int, Any] = {}
+        self._gap_since: Optional[float] = None
+        self.late_frames = 0
+        self.skipped_frames = 0
+
+    def __len__(self) -> int:
+        return len(self._held)
+
+    def reset(self) -> None:
+        """Forget sequence state, e.g. after the peer restarted"""
+        self._expected = 0
+        self._delivered = False
+        self._held.clear()
+        self._gap_since = None
+
+    def _distance(self, sequence: int) -> int:
+        """Distance from the expected sequence, negative for late frames"""
+        distance = (sequence - self._expected) % self.SEQUENCE_MODULO
+        if distance >= self.SEQUENCE_MODULO // 2:
+            distance -= self.SEQUENCE_MODULO
+        return distance
+
+    def push(self, sequence: int, item: Any) -> list[Any]:
+        """Add frame, returns frames that are ready for delivery in order"""
+        if not self._delivered and self._distance(sequence) < 0:
+            self._expected = sequence
+
+        distance = self._distance(sequence)
+        if distance < 0 or sequence in self._held:
+            self.late_frames += 1
+            return self.expire()
+
+        self._held[sequence] = item
+        ready = self._pop_ready()
+
+        if len(self._held) > self.capacity:
+            ready.extend(self._skip_gap())
+        return ready + self.expire()
+
+    def expire(self, now: Optional[float] = None) -> list[Any]:
+        """Skip a gap that stayed unfilled longer than gap_timeout"""
+        if self._gap_since is None:
+            return []
+        now = time.monotonic() if now is None else now
+        if now - self._gap_since < self.gap_timeout:
+            return []
+        return self._skip_gap()
+
+    def next_expiry(self) -> Optional[float]:
+        """Monotonic time at which the current gap will be skipped"""
+        if self._gap_since is None:
+            return None
+        return self._gap_since + self.gap_timeout
+
+    def _pop_ready(self) -> list[Any]:
+        ready = []
+        while self._expected in self._held:
+            ready.append(self._held.pop(self._expected))
+            self._expected = (self._expected + 1) % self.SEQUENCE_MODULO
+        if ready:
+            self._delivered = True
+
+        if self._held:
+            if self._gap_since is None or ready:
+                self._gap_since = time.monotonic()
+        else:
+            self._gap_since = None
+        return ready
+
+    def _skip_gap(self) -> list[Any]:
+        if not self._held:
+            return []
+        nearest = min(self._held, key=self._distance)
+        self.skipped_frames += self._distance(nearest)
+        self._expected = nearest
+        return self._pop_ready()
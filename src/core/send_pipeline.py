@@ -0,0 +1,56 @@
+import asyncio
+import inspect
+from typing import Awaitable
+
+
+class SendPipeline:
+    """Keeps up to window message sends in flight at once
+
+    Unbounded sends run outside the window, for small messages that must
+    not wait behind sends blocked on the peer.
+    """
+
+    def __init__(self, window: int):
+        if window < 1:
+            raise ValueError(f"Send window must be at least 1, received: {window}")
+        self.window = window
+        self._slots = asyncio.Semaphore(window)
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of sends currently in progress"""
+        return len(self._tasks)
+
+    @property
+    def full(self) -> bool:
+        """All window slots are taken"""
+        return self._slots.locked()
+
+    async def submit(self, send: Awaitable[None], bounded: bool = True) -> None:
+        """Start send, waits only while the window is full"""
+        if bounded:
+            try:
+                await self._slots.acquire()
+            except asyncio.CancelledError:
+                # Stopped while waiting, the send never starts
+                if inspect.iscoroutine(send):
+                    send.close()
+                raise
+        task = asyncio.create_task(self._run(send, bounded))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, send: Awaitable[None], bounded: bool) -> None:
+        try:
+            await send
+        except Exception as e:
+            print(f"Message transport send error: {e}")
+        finally:
+            if bounded:
+                self._slots.release()
+
+    async def drain(self) -> None:
+        """Wait for all in-flight sends to finish"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
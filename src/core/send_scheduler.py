@@ -0,0 +1,127 @@
+import asyncio
+import itertools
+from typing import Awaitable, Callable, Optional
+from src.core.send_pipeline import SendPipeline
+from src.core.token_bucket import TokenBucket
+from src.message_transports.base_message_transport import RateLimitError
+
+SendJob = Callable[[], Awaitable[None]]
+
+
+class SendScheduler:
+    """Rate-limit-aware priority scheduler between TunnelManager and MessageTransport
+
+    Jobs are sent in priority order (control, interactive, bulk) through a
+    token bucket that learns the messenger rate limit, and up to window
+    of them run at once. A job throttled by the messenger is put back
+    into the queue at its original place and retried after the bucket
+    pause, so it still leaves ahead of the frames queued after it.
+
+    Control jobs are sent outside the send window: data sends of a
+    protocol layer may wait for the peer (e.g. a full ARQ window) and must
+    not hold back the ACKs and retransmissions that let the peer proceed.
+    """
+
+    PRIORITY_CONTROL = 0
+    PRIORITY_INTERACTIVE = 1
+    PRIORITY_BULK = 2
+
+    # Frames up to that size are considered interactive traffic
+    INTERACTIVE_MAX_SIZE = 512
+    # Attempts for one job before it is dropped
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, rate: float, window: int, max_queued: int = 0):
+        self.bucket = TokenBucket(rate, burst=window)
+        self.pipeline = SendPipeline(window)
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        # Backpressure for data jobs, control jobs are never blocked
+        self._data_slots = asyncio.Semaphore(max_queued or window * 2)
+        self._order = itertools.count()
+        # Wakes the dispatcher waiting for a free window slot
+        self._wakeup = asyncio.Event()
+        self._control_queued = 0
+        self._worker: Optional[asyncio.Task] = None
+        self.dropped_jobs = 0
+
+    @classmethod
+    def priority_for(cls, payload_size: int, bulk: bool = False) -> int:
+        """Priority class of a data frame"""
+        if bulk or payload_size > cls.INTERACTIVE_MAX_SIZE:
+            return cls.PRIORITY_BULK
+        return cls.PRIORITY_INTERACTIVE
+
+    def qsize(self) -> int:
+        """Number of jobs waiting for a send slot"""
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        """Start dispatching queued jobs"""
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._dispatch_loop())
+
+    async def submit(self, job: SendJob, priority: int) -> None:
+        """Queue job, waits while too many data jobs are queued"""
+        if priority != self.PRIORITY_CONTROL:
+            await self._data_slots.acquire()
+        self._put(job, priority, next(self._order), attempt=1, holds_slot=priority != self.PRIORITY_CONTROL)
+
+    def submit_nowait(self, job: SendJob, priority: int) -> None:
+        """Queue job of a protocol layer without backpressure
+
+        For messages a layer sends on its own (ACKs, retransmissions,
+        parity) from within a running send, which must not wait for the
+        data jobs queued behind it.
+        """
+        self._put(job, priority, next(self._order), attempt=1, holds_slot=False)
+
+    def _put(self, job: SendJob, priority: int, order: int, attempt: int, holds_slot: bool) -> None:
+        self._queue.put_nowait((priority, order, attempt, job, holds_slot))
+        if priority == self.PRIORITY_CONTROL:
+            self._control_queued += 1
+            self._wakeup.set()
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            # Data jobs wait for a window slot, control jobs never do
+            while self.pipeline.full and not self._control_queued:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            priority, order, attempt, job, holds_slot = await self._queue.get()
+            if priority == self.PRIORITY_CONTROL:
+                self._control_queued -= 1
+            await self.bucket.acquire()
+            await self.pipeline.submit(
+                self._run(job, priority, order, attempt, holds_slot),
+                bounded=priority != self.PRIORITY_CONTROL
+            )
+
+    async def _run(self, job: SendJob, priority: int, order: int, attempt: int, holds_slot: bool) -> None:
+        try:
+            await job()
+            self.bucket.on_success()
+        except RateLimitError as e:
+            self.bucket.on_throttled(e.retry_after)
+            if attempt < self.MAX_ATTEMPTS:
+                self._put(job, priority, order, attempt + 1, holds_slot)
+                return
+            self.dropped_jobs += 1
+            print(f"Dropping message after {attempt} throttled attempts")
+        except Exception as e:
+            print(f"Message transport send error: {e}")
+        finally:
+            self._wakeup.set()
+
+        if holds_slot:
+            self._data_slots.release()
+
+    async def close(self) -> None:
+        """Stop dispatching and wait for in-flight sends"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self.pipeline.drain()
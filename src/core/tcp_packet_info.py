@@ -0,0 +1,95 @@
+import struct
+from typing import NamedTuple, Optional
+
+# TUN packet information header: 2 bytes flags, 2 bytes EtherType
+PACKET_INFO = struct.Struct('!HH')
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+PROTOCOL_TCP = 6
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+TCP_URG = 0x20
+TCP_ECE = 0x40
+TCP_CWR = 0x80
+# Flags that make a segment more than a plain acknowledgement
+TCP_NOT_PURE_ACK = TCP_FIN | TCP_SYN | TCP_RST | TCP_URG | TCP_ECE | TCP_CWR
+
+TCP_HEADER = struct.Struct('!HHIIBBH')
+
+
+class TcpPacketInfo(NamedTuple):
+    """TCP fields of one tunneled packet that matter for queue decisions"""
+    flow: tuple
+    seq: int
+    ack: int
+    flags: int
+    window: int
+    payload_length: int
+
+    @property
+    def is_pure_ack(self) -> bool:
+        """Segment without data that only acknowledges"""
+        return self.payload_length == 0 and bool(self.flags & TCP_ACK) and not self.flags & TCP_NOT_PURE_ACK
+
+
+def ip_offset(packet: bytes) -> Optional[int]:
+    """Offset of the IP header: 0 for raw IP, 4 after a TUN packet information header"""
+    if len(packet) < 20:
+        return None
+    version = packet[0] >> 4
+    if version in (4, 6):
+        return 0
+    if packet[0] == 0:
+        _, ethertype = PACKET_INFO.unpack_from(packet)
+        if ethertype in (ETHERTYPE_IPV4, ETHERTYPE_IPV6):
+            return PACKET_INFO.size
+    return None
+
+
+def parse_tcp(packet: bytes) -> Optional[TcpPacketInfo]:
+    """TCP fields of an IPv4/IPv6 packet, None for anything else
+
+    Fragments and IPv6 extension headers are not parsed, such packets
+    are treated as non-TCP.
+    """
+    offset = ip_offset(packet)
+    if offset is None:
+        return None
+
+    version = packet[offset] >> 4
+    if version == 4:
+        header_length = (packet[offset] & 0x0F) * 4
+        total_length = struct.unpack_from('!H', packet, offset + 2)[0]
+        fragment = struct.unpack_from('!H', packet, offset + 6)[0]
+        if packet[offset + 9] != PROTOCOL_TCP or fragment & 0x3FFF or header_length < 20:
+            return None
+        source, destination = packet[offset + 12:offset + 16], packet[offset + 16:offset + 20]
+        end = offset + total_length
+    elif version == 6:
+        if len(packet) < offset + 40 or packet[offset + 6] != PROTOCOL_TCP:
+            return None
+        header_length = 40
+        end = offset + header_length + struct.unpack_from('!H', packet, offset + 4)[0]
+        source, destination = packet[offset + 8:offset + 24], packet[offset + 24:offset + 40]
+    else:
+        return None
+
+    tcp_offset = offset + header_length
+    if end > len(packet) or tcp_offset + TCP_HEADER.size > end:
+        return None
+    source_port, destination_port, seq, ack, data_offset, flags, window = TCP_HEADER.unpack_from(packet, tcp_offset)
+    payload_length = end - tcp_offset - (data_offset >> 4) * 4
+    if payload_length < 0:
+        return None
+
+    return TcpPacketInfo(
+        (source, source_port, destination, destination_port), seq, ack, flags, window, payload_length
+    )
+
+
+def seq_after(a: int, b: int) -> bool:
+    """a is after b in 32-bit sequence space"""
+    return 0 < (a - b) % (1 << 32) < (1 << 31)
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Send rate limiter that learns the messenger limit from throttling
+
+    The rate grows additively with every successful send (about +1 msg/s
+    per second of traffic at the current rate) and is cut multiplicatively
+    when the messenger reports throttling, like TCP congestion control.
+    Throttling reported for sends that were already in flight during a
+    pause is one congestion event and only extends the pause.
+    """
+
+    DECREASE_FACTOR = 0.7
+
+    def __init__(self, rate: float, burst: float = 1.0, min_rate: float = 0.2, max_rate: float = 0.0):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.min_rate = min_rate
+        self.max_rate = max_rate or self.rate * 4
+        self.tokens = self.burst
+        self.paused_until = 0.0
+        self.throttle_count = 0
+        self.throttle_time = 0.0
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self) -> None:
+        """Wait for a send token"""
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            self._refill(now)
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    def on_success(self) -> None:
+        """Probe for a higher rate after a successful send"""
+        self.rate = min(self.max_rate, self.rate + 1.0 / self.rate)
+
+    def on_throttled(self, retry_after: float) -> None:
+        """Back off after the messenger reported too many requests"""
+        now = time.monotonic()
+        self.throttle_count += 1
+        self.throttle_time += retry_after
+        if now >= self.paused_until:
+            self.rate = max(self.min_rate, self.rate * self.DECREASE_FACTOR)
+        self.paused_until = max(self.paused_until, now + retry_after)
+        self.tokens = 0.0
+        self._updated_at = now
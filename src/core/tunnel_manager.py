@@ -1,22 +1,108 @@
 import asyncio
-from src.message_transports.base_message_transport import MessageTransport
+import functools
+import time
+from typing import Awaitable, Callable, Optional
+from src.message_transports.base_message_transport import MessageTransport, RateLimitError
 from src.data_transports.base_data_transport import BaseDataTransport
+from src.message_encoder.packet_framer import PacketFramer
+from src.message_encoder.header_compressor import HeaderCompressor
 from src.utils.statistics import TunnelStatistics
+from src.utils.tracer import PacketTracer
+from src.core.packet_coalescer import PacketCoalescer
+from src.core.flow_lanes import FlowLanes
+from src.core.reorder_buffer import ReorderBuffer
+from src.core.send_scheduler import SendScheduler
+from src.core.rate_controller import PathEstimator, RateController
+from src.core.write_queue import DataWriteQueue
 
 class TunnelManager:
     """Universal tunnel manager - works with ANY MessageTransport"""
     
     def __init__(self, message_transport: MessageTransport, 
-                 data_transport: BaseDataTransport):
+                 data_transport: BaseDataTransport, tracer: Optional[PacketTracer] = None):
         # Dependency Injection - we get ready objects
+        if message_transport.bulk_threshold and not message_transport.supports_bulk:
+            raise ValueError(f"{type(message_transport).__name__} has no bulk channel, bulk_threshold must be 0")
         self.message_transport = message_transport
         self.data_transport = data_transport
         self.stats = TunnelStatistics()
+        # Sampling frame tracer, None when tracing is off
+        self.tracer = tracer
+        self.frame_header_size = PacketFramer.header_size(traced=tracer is not None)
+        self.header_compressor = HeaderCompressor() if data_transport.header_compression else None
+        self.coalescer = PacketCoalescer(
+            max_payload_size=message_transport.get_max_payload_size() - self.frame_header_size,
+            flush_deadline=message_transport.flush_deadline,
+            thinning=data_transport.thinning,
+            stats=self.stats,
+            header_compressor=self.header_compressor
+        )
+        self.send_scheduler = SendScheduler(
+            rate=message_transport.rate_limit,
+            window=message_transport.send_window
+        )
+        self.write_queue = DataWriteQueue(
+            data_transport, self.stats,
+            max_size=data_transport.write_queue_size,
+            drop_policy=data_transport.drop_policy,
+            tracer=tracer
+        )
+        message_transport.encoder.stats = self.stats
+        message_transport.encoder.tracer = tracer
+        message_transport.tracer = tracer
+        message_transport.scheduler = self.send_scheduler
+        # RTT and delivery rate, with rate control they set the send parameters
+        self.path = PathEstimator()
+        self.rate_controller = RateController(
+            self.path, self.send_scheduler.bucket, self.coalescer,
+            report_interval=message_transport.rate_report_interval
+        ) if message_transport.rate_control else None
+        # Sequence numbering and reordering per lane (priority class)
+        self.reorder_buffers: dict[int, ReorderBuffer] = {}
+        self._next_sequence: dict[int, int] = {}
+        # TCP flows stay on the lane of their unsent frames
+        self.flow_lanes = FlowLanes()
+        # (lane, sequence) -> throttled attempts of frames the scheduler retries
+        self._throttled_frames: dict[tuple[int, int], int] = {}
+        self._reorder_timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         self.running = False
+        self._add_gauges()
+    
+    def _add_gauges(self) -> None:
+        """Queue depths and send rate state for the metrics endpoint"""
+        bucket = self.send_scheduler.bucket
+        gauges = [
+            ('outbound_queue_packets', "Packets waiting to be coalesced into messages", self.coalescer.qsize),
+            ('send_queue_jobs', "Messages waiting for a send slot", self.send_scheduler.qsize),
+            ('send_in_flight', "Message sends in progress", lambda: self.send_scheduler.pipeline.in_flight),
+            ('write_queue_packets', "Packets waiting to be written to the data transport", lambda: len(self.write_queue)),
+            ('reorder_held_frames', "Frames held back behind a sequence gap",
+             lambda: sum(len(buffer) for buffer in self.reorder_buffers.values())),
+            ('send_rate_limit', "Current messages per second of the send token bucket", lambda: bucket.rate),
+            ('throttle_events', "Throttling responses of the messenger",
+             lambda: self.message_transport.throttle_events),
+            ('throttle_seconds', "Wait time requested by messenger throttling",
+             lambda: self.message_transport.throttle_seconds),
+            ('rtt_seconds', "Smoothed round-trip time of the tunnel path", lambda: self.path.srtt or 0.0),
+            ('min_rtt_seconds', "Minimum round-trip time of the tunnel path", lambda: self.path.min_rtt or 0.0),
+            ('delivery_rate', "Maximum delivered messages per second", lambda: self.path.bandwidth or 0.0),
+            ('flush_deadline_seconds', "Seconds the coalescer waits for more packets",
+             lambda: self.coalescer.flush_deadline),
+        ]
+        if self.rate_controller is not None:
+            gauges.extend([
+                ('in_flight_frames', "Frames sent without an ack report", lambda: self.path.in_flight),
+                ('in_flight_window', "In-flight frame limit of the rate controller",
+                 lambda: self.rate_controller.window or 0),
+            ])
+        for name, description, read in gauges:
+            self.stats.add_gauge(name, description, read)
     
     async def start_tunnel(self) -> None:
         """Start tunnel - universal logic"""
         self.running = True
+        self._loop = asyncio.get_running_loop()
         
         # Setup handlers
         self.message_transport.set_data_handler(self._handle_message_data)
@@ -27,13 +113,18 @@ class TunnelManager:
         await self.message_transport.connect()
         
         # Send ready signal
-        await self.message_transport.send_control("ready")
+        self.write_queue.start()
+        self.send_scheduler.start()
+        await self._send_control("ready")
         
         # Start main loop
         tasks = [
+            asyncio.create_task(self._data_read_loop()),
             asyncio.create_task(self._data_to_message_loop()),
             asyncio.create_task(self._heartbeat_loop())
         ]
+        if self.rate_controller is not None:
+            tasks.append(asyncio.create_task(self._ack_report_loop()))
         
         try:
             await asyncio.gather(*tasks)
@@ -46,43 +137,220 @@ class TunnelManager:
             return
         
         try:
-            # Write to data transport (TUN, SOCKS, etc.)
-            asyncio.create_task(self.data_transport.write_data(data))
-            self.stats.add_received(len(data))
-        except Exception as e:
-            print(f"Error writing to data transport: {e}")
+            lane, sequence, trace_id, packets = PacketFramer.unpack(data)
+        except ValueError as e:
+            print(f"Error unpacking message data: {e}")
+            return
+        self.path.on_receive(lane, sequence)
+        if trace_id is not None and self.tracer is not None:
+            # Download and decoding marks of the message carrying the frame
+            self.tracer.claim(trace_id, {'lane': lane, 'sequence': sequence, 'packets': len(packets)})
+        
+        # Pass frame through the reorder buffer of its lane
+        reorder_buffer = self.reorder_buffers.get(lane)
+        if reorder_buffer is None:
+            reorder_buffer = ReorderBuffer(capacity=self.message_transport.send_window * 8)
+            self.reorder_buffers[lane] = reorder_buffer
+        
+        self._write_frames(reorder_buffer.push(sequence, (time.monotonic(), trace_id, packets)))
+        self._schedule_reorder_expiry()
+    
+    def _schedule_reorder_expiry(self) -> None:
+        """Make sure a gap in the sequence is skipped even without new frames"""
+        if self._reorder_timer is not None:
+            self._reorder_timer.cancel()
+            self._reorder_timer = None
+        
+        expiries = [
+            expiry for expiry in (buffer.next_expiry() for buffer in self.reorder_buffers.values())
+            if expiry is not None
+        ]
+        if expiries:
+            expiry = min(expiries)
+            self._reorder_timer = self._loop.call_later(
+                max(0.0, expiry - time.monotonic()), self._expire_reorder_buffer
+            )
+    
+    def _expire_reorder_buffer(self) -> None:
+        """Deliver frames held behind a gap that timed out"""
+        self._reorder_timer = None
+        for reorder_buffer in self.reorder_buffers.values():
+            self._write_frames(reorder_buffer.expire())
+        self._schedule_reorder_expiry()
+    
+    def _write_frames(self, frames: list[tuple[float, Optional[int], list[bytes]]]) -> None:
+        """Write packets of in-order frames to data transport"""
+        now = time.monotonic()
+        for received_at, trace_id, packets in frames:
+            self.stats.observe('receive', now - received_at)
+            if trace_id is not None and self.tracer is not None:
+                self.tracer.span(trace_id, 'reorder', received_at, now)
+            self.stats.add_received(sum(len(packet) for packet in packets), len(packets))
+            # Written to data transport (TUN, SOCKS, etc.) by the queue writer
+            for packet in packets:
+                if self.header_compressor is None:
+                    self.write_queue.put(packet, trace_id)
+                    continue
+                # A full record also releases the records that overtook it
+                for restored in self.header_compressor.decompress(packet):
+                    self.write_queue.put(restored, trace_id)
     
     def _handle_control_message(self, message: str) -> None:
         """Processing control messages - PURE LOGIC"""
         if message == "ready":
             print("Peer is ready")
-        elif message == "ping":
-            asyncio.create_task(self.message_transport.send_control("pong"))
+            # Peer (re)started, its frame numbering starts over
+            self.reorder_buffers.clear()
+            if self.header_compressor is not None:
+                self.header_compressor.reset()
+            if self.rate_controller is not None:
+                self.rate_controller.reset()
+            else:
+                self.path.reset()
+        elif message == "ping" or message.startswith("ping "):
+            # Echo the ping time, if any, for the peer RTT sample
+            asyncio.create_task(self._send_control("pong" + message[4:]))
+        elif message.startswith("pong "):
+            self.path.on_pong(message)
+        elif message.startswith(PathEstimator.ACK_REPORT + " "):
+            if self.rate_controller is not None:
+                self.rate_controller.on_ack_report(message)
         elif message == "disconnect":
             asyncio.create_task(self.stop_tunnel())
     
-    async def _data_to_message_loop(self) -> None:
-        """Data transfer loop from DataTransport to MessageTransport"""
+    async def _data_read_loop(self) -> None:
+        """Reading loop from DataTransport into the outbound queue"""
         while self.running:
             try:
                 data = await self.data_transport.read_data()
                 if data:
-                    await self.message_transport.send_data(data)
-                    self.stats.add_sent(len(data))
+                    await self.coalescer.put(data)
             except Exception as e:
                 print(f"Data transport read error: {e}")
                 await asyncio.sleep(0.1)
     
+    async def _data_to_message_loop(self) -> None:
+        """Data transfer loop from the outbound queue to MessageTransport"""
+        while self.running:
+            try:
+                if self.rate_controller is not None:
+                    # Packets keep coalescing while the in-flight window is full
+                    await self.rate_controller.wait_for_window()
+                bulk_threshold = self.message_transport.bulk_threshold
+                if bulk_threshold and self.coalescer.qsize() >= bulk_threshold:
+                    # Deep queue - drain it into one large frame for the bulk channel
+                    packets = await self.coalescer.get_batch(
+                        self.message_transport.bulk_max_size - self.frame_header_size
+                    )
+                    send = self.message_transport.send_bulk
+                    bulk = True
+                else:
+                    packets = await self.coalescer.get_batch()
+                    send = self.message_transport.send_data
+                    bulk = False
+                
+                payload_size = sum(PacketFramer.record_size(packet) for packet in packets)
+                flows = frozenset(self.coalescer.batch_flows)
+                lane = self.flow_lanes.lane_for(flows, SendScheduler.priority_for(payload_size, bulk))
+                
+                sequence = self._next_sequence.get(lane, 0)
+                self._next_sequence[lane] = (sequence + 1) % ReorderBuffer.SEQUENCE_MODULO
+                trace_id = self.tracer.sample() if self.tracer is not None else None
+                payload = PacketFramer.pack(sequence, packets, lane, trace_id)
+                submitted_at = time.monotonic()
+                if trace_id is not None:
+                    self.tracer.span(trace_id, 'coalesce', self.coalescer.batch_queued_at, submitted_at, {
+                        'lane': lane, 'sequence': sequence, 'packets': len(packets), 'bytes': len(payload)
+                    })
+                if self.rate_controller is not None:
+                    self.path.on_submit(lane, sequence, app_limited=self.coalescer.qsize() == 0)
+                self.flow_lanes.pin(flows, lane)
+                await self.send_scheduler.submit(
+                    functools.partial(
+                        self._send_frame, send, lane, sequence, payload, packets, submitted_at, trace_id, flows
+                    ),
+                    lane
+                )
+            except Exception as e:
+                print(f"Message transport send error: {e}")
+                await asyncio.sleep(0.1)
+    
+    async def _send_frame(self, send: Callable[[bytes], Awaitable[None]], lane: int, sequence: int,
+                          payload: bytes, packets: list[bytes], submitted_at: float,
+                          trace_id: Optional[int] = None, flows: frozenset = frozenset()) -> None:
+        """Send one frame, runs concurrently inside the send window"""
+        self.path.on_send(lane, sequence)
+        if trace_id is not None:
+            started = time.monotonic()
+            self.tracer.span(trace_id, 'schedule', submitted_at, started)
+            # Encoding and the API call of this task are marked for the frame
+            self.tracer.enter(trace_id)
+        try:
+            await send(payload)
+        except RateLimitError:
+            # The scheduler retries the frame, its flows stay pinned until the last attempt
+            attempts = self._throttled_frames.get((lane, sequence), 0) + 1
+            if attempts < SendScheduler.MAX_ATTEMPTS:
+                self._throttled_frames[(lane, sequence)] = attempts
+            else:
+                self._release_frame(lane, sequence, flows)
+            raise
+        except BaseException:
+            self._release_frame(lane, sequence, flows)
+            raise
+        self._release_frame(lane, sequence, flows)
+        if trace_id is not None:
+            self.tracer.span(trace_id, 'send', started)
+        self.stats.observe('send', time.monotonic() - submitted_at)
+        self.stats.add_sent(sum(len(packet) for packet in packets), len(packets))
+    
+    def _release_frame(self, lane: int, sequence: int, flows: frozenset) -> None:
+        """Frame is sent or given up, its flows may change lanes again"""
+        self._throttled_frames.pop((lane, sequence), None)
+        self.flow_lanes.release(flows)
+    
+    async def _send_control(self, message: str) -> None:
+        """Queue control message ahead of all data"""
+        await self.send_scheduler.submit(
+            functools.partial(self.message_transport.send_control, message),
+            SendScheduler.PRIORITY_CONTROL
+        )
+    
+    async def _send_ping(self) -> None:
+        """Ping stamped when it is actually sent, not when it was queued"""
+        await self.message_transport.send_control(self.path.ping_message())
+    
     async def _heartbeat_loop(self) -> None:
         """Connection maintenance"""
         while self.running:
             await asyncio.sleep(30)
             if self.running:  # Проверяем еще раз
-                await self.message_transport.send_control("ping")
+                await self.send_scheduler.submit(self._send_ping, SendScheduler.PRIORITY_CONTROL)
+    
+    async def _ack_report_loop(self) -> None:
+        """Report received frames to the peer rate controller"""
+        while self.running:
+            await asyncio.sleep(self.message_transport.rate_report_interval)
+            report = self.path.ack_report()
+            if report is not None and self.running:
+                await self._send_control(report)
     
     async def stop_tunnel(self) -> None:
         """Stop tunnel"""
         self.running = False
+        if self._reorder_timer is not None:
+            self._reorder_timer.cancel()
+        await self.send_scheduler.close()
+        await self.write_queue.close()
         await self.data_transport.cleanup()
         await self.message_transport.disconnect()
-        print(f"Tunnel stopped. {self.stats.get_summary()}")
\ No newline at end of file
+        summary = self.stats.get_summary()
+        if self.header_compressor is not None:
+            summary += (f", Header compression: {self.header_compressor.bytes_saved} bytes saved, "
+                        f"{self.header_compressor.context_misses} context misses")
+        print(f"Tunnel stopped. {summary}")
+        if self.tracer is not None:
+            try:
+                self.tracer.export()
+            except OSError as e:
+                print(f"Error writing trace file: {e}")
\ No newline at end of file
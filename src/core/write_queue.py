@@ -0,0 +1,94 @@
+import asyncio
+import collections
+import time
+from typing import Optional
+from src.data_transports.base_data_transport import BaseDataTransport
+from src.utils.statistics import TunnelStatistics
+from src.utils.tracer import PacketTracer
+
+
+class DataWriteQueue:
+    """Bounded, ordered inbound queue drained by a single writer coroutine
+
+    Packets are written in the order they were queued, every wakeup of the
+    writer hands all queued packets to the data transport as one batch.
+    When the queue is full the drop policy decides which packet is lost:
+    'tail_drop' drops the new packet, 'drop_oldest' the oldest queued one.
+    With a tracer, packets of traced frames get a 'write' span from
+    queueing until their batch is written.
+    """
+
+    DROP_POLICIES = ('tail_drop', 'drop_oldest')
+
+    def __init__(self, data_transport: BaseDataTransport, stats: TunnelStatistics,
+                 max_size: int = 1024, drop_policy: str = 'tail_drop', tracer: Optional[PacketTracer] = None):
+        if drop_policy not in self.DROP_POLICIES:
+            raise ValueError(f"Unsupported drop policy: {drop_policy}")
+        if max_size < 1:
+            raise ValueError(f"Write queue size must be at least 1, received: {max_size}")
+        self.data_transport = data_transport
+        self.stats = stats
+        self.max_size = max_size
+        self.drop_policy = drop_policy
+        self.tracer = tracer
+        self._queue: collections.deque[bytes] = collections.deque()
+        self._ready = asyncio.Event()
+        # Trace ID -> queue time of traced frames waiting in the queue
+        self._traced: dict[int, float] = {}
+        self._writer: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def put(self, packet: bytes, trace_id: Optional[int] = None) -> bool:
+        """Queue packet for writing, returns False if a packet was dropped"""
+        dropped = False
+        if len(self._queue) >= self.max_size:
+            if self.drop_policy == 'tail_drop':
+                self.stats.add_write_drop(len(packet))
+                return False
+            self.stats.add_write_drop(len(self._queue.popleft()))
+            dropped = True
+
+        self._queue.append(packet)
+        if trace_id is not None and self.tracer is not None:
+            self._traced.setdefault(trace_id, time.monotonic())
+        self.stats.update_write_queue_high_water(len(self._queue))
+        self._ready.set()
+        return not dropped
+
+    def start(self) -> None:
+        """Start the writer coroutine"""
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+
+    async def _write_loop(self) -> None:
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+
+            while self._queue:
+                batch = list(self._queue)
+                self._queue.clear()
+                traced, self._traced = self._traced, {}
+                started = time.monotonic()
+                try:
+                    await self.data_transport.write_batch(batch)
+                except Exception as e:
+                    print(f"Error writing to data transport: {e}")
+                ended = time.monotonic()
+                self.stats.observe('write', ended - started)
+                for trace_id, queued_at in traced.items():
+                    self.tracer.span(trace_id, 'write', queued_at, ended, {'batch_packets': len(batch)})
+
+    async def close(self) -> None:
+        """Stop the writer, queued packets are discarded"""
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        self._queue.clear()
+        self._traced.clear()
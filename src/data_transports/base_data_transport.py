@@ -5,10 +5,20 @@ from typing import Any, Callable, Optional
 class BaseDataTransport(ABC):
     """Abstract base class for all data transport types"""
 
+    DEFAULT_WRITE_QUEUE_SIZE = 1024
+    DEFAULT_DROP_POLICY = 'tail_drop'
+
     def __init__(self, config: dict[str, Any]):
         self.config: dict[str, Any] = config
         self.running: bool = False
         self._read_callback: Optional[Callable[[bytes], Any]] = None
+        # Inbound write queue settings used by TunnelManager
+        self.write_queue_size: int = config.get('write_queue_size', self.DEFAULT_WRITE_QUEUE_SIZE)
+        self.drop_policy: str = config.get('drop_policy', self.DEFAULT_DROP_POLICY)
+        # Outbound ACK thinning and retransmit dedup, for transports carrying IP packets
+        self.thinning: bool = config.get('thinning', False)
+        # IP/TCP header compression between tunnel peers, both sides must enable it
+        self.header_compression: bool = config.get('header_compression', False)
 
     @abstractmethod
     async def setup(self) -> None:
@@ -25,6 +35,11 @@ class BaseDataTransport(ABC):
         """Write data to transport"""
         pass
 
+    async def write_batch(self, packets: list[bytes]) -> None:
+        """Write several packets in order, transports may do it in one go"""
+        for packet in packets:
+            await self.write_data(packet)
+
     @abstractmethod
     async def cleanup(self) -> None:
         """Cleanup resources"""
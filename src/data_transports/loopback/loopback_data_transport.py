@@ -0,0 +1,42 @@
+import asyncio
+from typing import Any, Callable, Optional
+from ..base_data_transport import BaseDataTransport
+
+
+class LoopbackDataTransport(BaseDataTransport):
+    """In-memory data transport, for tests and benchmarks
+
+    Packets given to inject are read by TunnelManager as if they came
+    from a TUN device or SOCKS client, packets TunnelManager writes go
+    to the sink callback.
+    """
+
+    def __init__(self, config: dict[str, Any], sink: Optional[Callable[[bytes], None]] = None):
+        super().__init__(config)
+        self.sink = sink
+        self._inbound: asyncio.Queue[bytes] = asyncio.Queue(config.get('queue_size', 0))
+        self.packets_written = 0
+
+    async def setup(self) -> None:
+        """Nothing to set up, packets stay in memory"""
+        self.running = True
+
+    async def inject(self, packet: bytes) -> None:
+        """Queue packet for TunnelManager to read, waits while the queue is full"""
+        await self._inbound.put(packet)
+
+    async def read_data(self) -> bytes:
+        """Next injected packet"""
+        return await self._inbound.get()
+
+    async def write_data(self, data: bytes) -> None:
+        """Pass packet to the sink"""
+        self.packets_written += 1
+        if self.sink is not None:
+            self.sink(data)
+
+    async def cleanup(self) -> None:
+        """Drop injected packets that were not read"""
+        self.running = False
+        while not self._inbound.empty():
+            self._inbound.get_nowait()
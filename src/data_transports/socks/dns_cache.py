@@ -0,0 +1,99 @@
+import asyncio
+import ipaddress
+import socket
+import time
+
+
+class DnsCache:
+    """Async resolver with a TTL cache
+
+    Names are resolved with the event loop getaddrinfo, concurrent lookups
+    of the same name share one query. Failures are cached for a shorter
+    time so a dead name does not flood the resolver.
+    """
+
+    def __init__(self, ttl: float = 300.0, negative_ttl: float = 10.0, max_entries: int = 4096):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # host -> (expires at, addresses or the error)
+        self._cache: dict[str, tuple[float, object]] = {}
+        self._pending: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, host: str, port: int) -> list[tuple[int, str]]:
+        """Address family and address for host, IP literals are returned as is
+
+        Raises:
+          OSError: If the name does not resolve
+          ValueError: If host is not a valid name
+        """
+        try:
+            address = ipaddress.ip_address(host)
+            return [(socket.AF_INET if address.version == 4 else socket.AF_INET6, host)]
+        except ValueError:
+            pass
+
+        entry = self._cache.get(host)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > time.monotonic():
+                self.hits += 1
+                if isinstance(result, OSError):
+                    raise result
+                return result
+            del self._cache[host]
+
+        pending = self._pending.get(host)
+        while pending is not None:
+            self.hits += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # The task doing the lookup was cancelled, the next waiter takes over
+            pending = self._pending.get(host)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[host] = future
+        try:
+            result = await self._lookup(host, port)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            if isinstance(e, OSError):
+                self._store(host, e, self.negative_ttl)
+            # Malformed names fail in idna with UnicodeError, waiters get that too
+            future.set_exception(e)
+            # Retrieved here, waiters get it via the shield
+            future.exception()
+            raise
+        finally:
+            del self._pending[host]
+
+        self._store(host, result, self.ttl)
+        future.set_result(result)
+        return result
+
+    async def _lookup(self, host: str, port: int) -> list[tuple[int, str]]:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host, port, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP
+        )
+        addresses = []
+        for family, _, _, _, sockaddr in infos:
+            address = (family, sockaddr[0])
+            if address not in addresses:
+                addresses.append(address)
+        if not addresses:
+            raise OSError(f"No addresses for {host}")
+        return addresses
+
+    def _store(self, host: str, result: object, ttl: float) -> None:
+        if len(self._cache) >= self.max_entries:
+            # Drop the oldest entry, dicts keep insertion order
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[host] = (time.monotonic() + ttl, result)
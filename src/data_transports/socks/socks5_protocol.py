@@ -0,0 +1,145 @@
+import asyncio
+import errno
+import ipaddress
+import struct
+from typing import Tuple
+
+SOCKS_VERSION = 5
+AUTH_NONE = 0
+AUTH_NO_ACCEPTABLE = 0xFF
+CMD_CONNECT = 1
+
+ATYP_IPV4 = 1
+ATYP_DOMAIN = 3
+ATYP_IPV6 = 4
+
+REP_SUCCEEDED = 0
+REP_GENERAL_FAILURE = 1
+REP_NETWORK_UNREACHABLE = 3
+REP_HOST_UNREACHABLE = 4
+REP_CONNECTION_REFUSED = 5
+REP_TTL_EXPIRED = 6
+REP_COMMAND_NOT_SUPPORTED = 7
+REP_ADDRESS_TYPE_NOT_SUPPORTED = 8
+
+PORT = struct.Struct('!H')
+
+
+class Socks5Error(Exception):
+    """SOCKS5 request that has to be answered with an error reply"""
+
+    def __init__(self, reply_code: int, message: str):
+        super().__init__(message)
+        self.reply_code = reply_code
+
+
+def encode_address(host: str, port: int) -> bytes:
+    """SOCKS5 address: ATYP, address and port"""
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        encoded_host = host.encode('idna')
+        if len(encoded_host) > 255:
+            raise Socks5Error(REP_ADDRESS_TYPE_NOT_SUPPORTED, f"Domain name too long: {host}")
+        return bytes([ATYP_DOMAIN, len(encoded_host)]) + encoded_host + PORT.pack(port)
+
+    atyp = ATYP_IPV4 if address.version == 4 else ATYP_IPV6
+    return bytes([atyp]) + address.packed + PORT.pack(port)
+
+
+def decode_address(data: bytes, offset: int = 0) -> Tuple[str, int, int]:
+    """Parse SOCKS5 address at offset, returns host, port and end offset
+
+    Raises:
+      Socks5Error: If the address type is unknown
+      ValueError: If data is truncated
+    """
+    if offset >= len(data):
+        raise ValueError("Truncated SOCKS5 address")
+    atyp = data[offset]
+    if atyp == ATYP_IPV4:
+        start, end = offset + 1, offset + 5
+        host = str(ipaddress.IPv4Address(data[start:end])) if end <= len(data) else ''
+    elif atyp == ATYP_IPV6:
+        start, end = offset + 1, offset + 17
+        host = str(ipaddress.IPv6Address(data[start:end])) if end <= len(data) else ''
+    elif atyp == ATYP_DOMAIN:
+        if offset + 1 >= len(data):
+            raise ValueError("Truncated SOCKS5 address")
+        start, end = offset + 2, offset + 2 + data[offset + 1]
+        host = data[start:end].decode('idna') if end <= len(data) else ''
+    else:
+        raise Socks5Error(REP_ADDRESS_TYPE_NOT_SUPPORTED, f"Unsupported address type: {atyp}")
+
+    if end + PORT.size > len(data):
+        raise ValueError("Truncated SOCKS5 address")
+    return host, PORT.unpack_from(data, end)[0], end + PORT.size
+
+
+async def read_address(reader: asyncio.StreamReader) -> Tuple[str, int]:
+    """Read SOCKS5 address from stream"""
+    atyp = (await reader.readexactly(1))[0]
+    if atyp == ATYP_IPV4:
+        host = str(ipaddress.IPv4Address(await reader.readexactly(4)))
+    elif atyp == ATYP_IPV6:
+        host = str(ipaddress.IPv6Address(await reader.readexactly(16)))
+    elif atyp == ATYP_DOMAIN:
+        length = (await reader.readexactly(1))[0]
+        host = (await reader.readexactly(length)).decode('idna')
+    else:
+        raise Socks5Error(REP_ADDRESS_TYPE_NOT_SUPPORTED, f"Unsupported address type: {atyp}")
+    port = PORT.unpack(await reader.readexactly(PORT.size))[0]
+    return host, port
+
+
+async def read_connect_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Tuple[str, int]:
+    """Negotiate no authentication and read CONNECT request, returns target host and port
+
+    Raises:
+      Socks5Error: If the request is valid SOCKS5 but can not be served
+      ValueError: If the client does not speak SOCKS5
+      asyncio.IncompleteReadError: If the client disconnected
+    """
+    version, methods_count = await reader.readexactly(2)
+    if version != SOCKS_VERSION:
+        raise ValueError(f"Unsupported SOCKS version: {version}")
+    methods = await reader.readexactly(methods_count)
+    if AUTH_NONE not in methods:
+        writer.write(bytes([SOCKS_VERSION, AUTH_NO_ACCEPTABLE]))
+        raise ValueError("Client does not support connecting without authentication")
+    writer.write(bytes([SOCKS_VERSION, AUTH_NONE]))
+
+    version, command, _ = await reader.readexactly(3)
+    if version != SOCKS_VERSION:
+        raise ValueError(f"Unsupported SOCKS version: {version}")
+    host, port = await read_address(reader)
+    if command != CMD_CONNECT:
+        raise Socks5Error(REP_COMMAND_NOT_SUPPORTED, f"Unsupported SOCKS command: {command}")
+    return host, port
+
+
+def build_reply(reply_code: int, host: str = '0.0.0.0', port: int = 0) -> bytes:
+    """SOCKS5 reply with bound address"""
+    return bytes([SOCKS_VERSION, reply_code, 0]) + encode_address(host, port)
+
+
+def reply_code_for_error(error: BaseException) -> int:
+    """SOCKS5 reply code for a failed upstream connection"""
+    if isinstance(error, Socks5Error):
+        return error.reply_code
+    if isinstance(error, asyncio.TimeoutError):
+        return REP_TTL_EXPIRED
+    if isinstance(error, UnicodeError):
+        # Name idna can not encode (empty or too long label), it can not resolve
+        return REP_HOST_UNREACHABLE
+    if isinstance(error, ConnectionRefusedError):
+        return REP_CONNECTION_REFUSED
+    if isinstance(error, OSError):
+        if error.errno == errno.ENETUNREACH:
+            return REP_NETWORK_UNREACHABLE
+        if error.errno in (errno.EHOSTUNREACH, errno.ETIMEDOUT):
+            return REP_HOST_UNREACHABLE
+        # socket.gaierror - the name does not resolve
+        if error.errno is not None and error.errno < 0:
+            return REP_HOST_UNREACHABLE
+    return REP_GENERAL_FAILURE
@@ -1,10 +1,10 @@
-from typing import Any, Callable, Optional
+from typing import Any
 from .socks_data_transport import SocksTransport
 from src.config.base_config import BaseConfig
 
 
 class SocksDataTransportFactory():
-    """Factory for creating SOCKS transport for incoming request processing"""
+    """Factory for creating multiplexed SOCKS5 transport"""
 
     def __init__(self, base_config: BaseConfig):
         self.base_config = base_config
@@ -17,16 +17,17 @@ class SocksDataTransportFactory():
         """Safe getting of configuration value by key"""
         return self.base_config.get_config_value_safe('data_transport.socks.' + key, default_value)
 
-    def create_transport(self, request_handler: Optional[Callable] = None) -> SocksTransport:
-        """Creates SocksTransport for processing incoming requests"""
+    def create_transport(self) -> SocksTransport:
+        """Creates SocksTransport: SOCKS5 listener (client) or upstream connector (server)"""
         config = {
-            'proxy_host': self.get_config_value_safe("proxy_host", "127.0.0.1"),
-            'proxy_port': self.get_config_value_safe("proxy_port", 9050),
-            'request_handler': request_handler  # Пользовательский обработчик запросов
+            'mode': self.get_config_value_safe("mode", "client"),
+            'listen_host': self.get_config_value_safe("listen_host", "127.0.0.1"),
+            'listen_port': self.get_config_value_safe("listen_port", 1080),
+            'stream_window': self.get_config_value_safe("stream_window", SocksTransport.DEFAULT_STREAM_WINDOW),
+            'max_chunk_size': self.get_config_value_safe("max_chunk_size", SocksTransport.DEFAULT_MAX_CHUNK_SIZE),
+            'connect_timeout': self.get_config_value_safe("connect_timeout", SocksTransport.DEFAULT_CONNECT_TIMEOUT),
+            'write_queue_size': self.get_config_value_safe("write_queue_size", 1024),
+            'drop_policy': self.get_config_value_safe("drop_policy", "tail_drop")
         }
         
         return SocksTransport(config)
-
-    def create_test_transport(self) -> SocksTransport:
-        """Creates SocksTransport with built-in test request handler"""
-        return self.create_transport(request_handler=SocksTransport.test_request_handler)
\ No newline at end of file
@@ -0,0 +1,54 @@
+import struct
+from typing import Tuple
+
+
+class StreamFrame:
+    """Framing of multiplexed TCP streams into tunnel packets
+
+    Packet layout: [1 byte type][4 bytes big-endian stream id]
+    [4 bytes big-endian value][body]. The value depends on the type:
+    byte offset of the body for DATA, byte offset of the end of stream
+    for CLOSE, absolute receive limit for WINDOW, reply code for
+    OPEN_REPLY. Offsets and limits wrap at 2^32. Type bytes never
+    collide with the first byte of an IP packet or a TUN packet
+    information header, so frames can share a path with raw packets.
+    """
+
+    HEADER = struct.Struct('!BII')
+    VALUE_MODULO = 1 << 32
+
+    OPEN = 1          # body - SOCKS5 address of the target
+    OPEN_REPLY = 2    # value - SOCKS5 reply code
+    DATA = 3          # body - stream bytes at value offset
+    WINDOW = 4        # value - sender may send up to this offset
+    CLOSE = 5         # no more data after value offset
+    RESET = 6         # stream aborted
+    WINDOW_PROBE = 7  # sender is blocked, receiver repeats WINDOW
+
+    TYPES = (OPEN, OPEN_REPLY, DATA, WINDOW, CLOSE, RESET, WINDOW_PROBE)
+
+    @classmethod
+    def is_stream_frame(cls, packet: bytes) -> bool:
+        return bool(packet) and packet[0] in cls.TYPES
+
+    @classmethod
+    def pack(cls, frame_type: int, stream_id: int, value: int = 0, body: bytes = b'') -> bytes:
+        return cls.HEADER.pack(frame_type, stream_id, value % cls.VALUE_MODULO) + body
+
+    @classmethod
+    def unpack(cls, packet: bytes) -> Tuple[int, int, int, bytes]:
+        """Split packet into type, stream id, value and body"""
+        if len(packet) < cls.HEADER.size:
+            raise ValueError("Truncated stream frame header")
+        frame_type, stream_id, value = cls.HEADER.unpack_from(packet)
+        if frame_type not in cls.TYPES:
+            raise ValueError(f"Unknown stream frame type: {frame_type}")
+        return frame_type, stream_id, value, packet[cls.HEADER.size:]
+
+    @classmethod
+    def unwrap(cls, value: int, reference: int) -> int:
+        """Absolute offset of a wrapped value closest to reference"""
+        delta = (value - reference) % cls.VALUE_MODULO
+        if delta >= cls.VALUE_MODULO // 2:
+            delta -= cls.VALUE_MODULO
+        return reference + delta
@@ -0,0 +1,340 @@
+import asyncio
+import collections
+from typing import Callable, Optional, Tuple
+from src.data_transports.socks import socks5_protocol as socks5
+from .stream_frame import StreamFrame
+
+
+class MuxStream:
+    """State of one multiplexed TCP connection"""
+
+    def __init__(self, stream_id: int, window: int):
+        self.stream_id = stream_id
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.established = False
+        # Outbound direction: bytes sent and the limit granted by the peer
+        self.send_offset = 0
+        self.send_limit = window
+        self.credit = asyncio.Event()
+        self.local_eof = False
+        # Inbound direction: next expected offset, out-of-order chunks,
+        # in-order chunks waiting for the local socket
+        self.recv_offset = 0
+        self.recv_pending: dict[int, bytes] = {}
+        self.recv_chunks: collections.deque[bytes] = collections.deque()
+        self.recv_ready = asyncio.Event()
+        self.consumed = 0
+        self.granted = 0
+        self.remote_eof: Optional[int] = None
+        self.remote_eof_done = False
+        self.opened: Optional[asyncio.Future] = None
+        self.gap_timer: Optional[asyncio.TimerHandle] = None
+        self.tasks: list[asyncio.Task] = []
+
+
+class StreamMultiplexer:
+    """Many TCP streams carried as tunnel packets
+
+    The opening side announces a stream with an OPEN frame carrying the
+    target address, the accepting side connects to it and answers with
+    OPEN_REPLY. Stream bytes travel in DATA frames with byte offsets, so
+    frames reordered by the messenger are put back in order. Every stream
+    has its own flow-control window and streams are served round-robin,
+    one large download can not starve the others.
+
+    Outbound frames are taken with pop_frame(), notify is called whenever
+    new ones are queued. Received frames are passed to handle_frame().
+    When both sides open streams they use stream ids of opposite parity.
+    """
+
+    DEFAULT_STREAM_WINDOW = 256 * 1024
+    DEFAULT_MAX_CHUNK_SIZE = 1024
+    DEFAULT_CONNECT_TIMEOUT = 30.0
+    # Missing stream bytes are given up after that many seconds
+    GAP_TIMEOUT = 10.0
+    # Blocked sender asks for the window again after that many seconds
+    WINDOW_PROBE_INTERVAL = 2.0
+
+    def __init__(self, notify: Callable[[], None], accept_open: bool = False, stream_id_parity: int = 1,
+                 stream_window: int = DEFAULT_STREAM_WINDOW,
+                 max_chunk_size: int = DEFAULT_MAX_CHUNK_SIZE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT):
+        self.notify = notify
+        self.accept_open = accept_open
+        self.stream_window = stream_window
+        self.max_chunk_size = max_chunk_size
+        self.connect_timeout = connect_timeout
+        self.streams: dict[int, MuxStream] = {}
+        self._stream_id_parity = stream_id_parity % 2
+        self._next_stream_id = 2 - self._stream_id_parity
+        # Outbound frames: control first, then DATA round-robin over streams
+        self._control: collections.deque[bytes] = collections.deque()
+        self._outbound: dict[int, collections.deque[bytes]] = {}
+        self._active: collections.deque[int] = collections.deque()
+        self.streams_opened = 0
+        self.streams_reset = 0
+
+    def pop_frame(self) -> Optional[bytes]:
+        """Next outbound frame, None if there is nothing to send"""
+        if self._control:
+            return self._control.popleft()
+        while self._active:
+            stream_id = self._active.popleft()
+            queue = self._outbound.get(stream_id)
+            if not queue:
+                continue
+            frame = queue.popleft()
+            if queue:
+                self._active.append(stream_id)
+            else:
+                stream = self.streams.get(stream_id)
+                if stream is not None:
+                    self._maybe_finish(stream)
+            return frame
+        return None
+
+    def handle_frame(self, packet: bytes) -> None:
+        """Dispatch frame received from the peer"""
+        try:
+            frame_type, stream_id, value, body = StreamFrame.unpack(packet)
+        except ValueError as e:
+            print(f"Error unpacking stream frame: {e}")
+            return
+
+        if frame_type == StreamFrame.OPEN:
+            self._handle_open(stream_id, body)
+            return
+
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            if frame_type == StreamFrame.DATA:
+                # Peer still sends on a stream we forgot, make it forget it too
+                self._send_control(StreamFrame.RESET, stream_id)
+            return
+
+        if frame_type == StreamFrame.DATA:
+            self._handle_stream_data(stream, value, body)
+        elif frame_type == StreamFrame.WINDOW:
+            limit = StreamFrame.unwrap(value, stream.send_offset)
+            if limit > stream.send_limit:
+                stream.send_limit = limit
+                stream.credit.set()
+        elif frame_type == StreamFrame.WINDOW_PROBE:
+            self._send_window(stream)
+        elif frame_type == StreamFrame.CLOSE:
+            stream.remote_eof = StreamFrame.unwrap(value, stream.recv_offset)
+            stream.recv_ready.set()
+        elif frame_type == StreamFrame.OPEN_REPLY:
+            if stream.opened is not None and not stream.opened.done():
+                stream.opened.set_result(value)
+        elif frame_type == StreamFrame.RESET:
+            self._close_stream(stream)
+
+    async def open_stream(self, host: str, port: int) -> Tuple[int, Optional[MuxStream]]:
+        """Ask the peer to connect to host:port
+
+        Returns the SOCKS5 reply code and, on success, the stream to pass
+        to establish() together with the local connection.
+        """
+        stream_id = self._next_stream_id
+        self._next_stream_id = (stream_id + 2) % StreamFrame.VALUE_MODULO or 2 - self._stream_id_parity
+        stream = self._new_stream(stream_id)
+        stream.opened = asyncio.get_running_loop().create_future()
+        self._send_control(StreamFrame.OPEN, stream_id, body=socks5.encode_address(host, port))
+
+        try:
+            reply_code = await asyncio.wait_for(stream.opened, self.connect_timeout)
+        except asyncio.TimeoutError:
+            # The peer may still connect, it has to drop the stream
+            self._close_stream(stream)
+            return socks5.REP_TTL_EXPIRED, None
+
+        if reply_code != socks5.REP_SUCCEEDED or stream_id not in self.streams:
+            self._close_stream(stream, notify=False)
+            return reply_code or socks5.REP_GENERAL_FAILURE, None
+        return reply_code, stream
+
+    def establish(self, stream: MuxStream, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Start moving bytes between the local connection and the tunnel"""
+        if stream.stream_id not in self.streams:
+            # Reset by the peer meanwhile
+            writer.close()
+            return
+        stream.reader, stream.writer = reader, writer
+        stream.established = True
+        stream.tasks = [
+            asyncio.create_task(self._stream_read_loop(stream)),
+            asyncio.create_task(self._stream_write_loop(stream))
+        ]
+
+    def close(self) -> None:
+        """Reset all streams"""
+        for stream in list(self.streams.values()):
+            self._close_stream(stream)
+
+    def _send_control(self, frame_type: int, stream_id: int, value: int = 0, body: bytes = b'') -> None:
+        self._control.append(StreamFrame.pack(frame_type, stream_id, value, body))
+        self.notify()
+
+    def _send_window(self, stream: MuxStream) -> None:
+        stream.granted = stream.consumed
+        self._send_control(StreamFrame.WINDOW, stream.stream_id, stream.consumed + self.stream_window)
+
+    def _queue_data(self, stream: MuxStream, data: bytes) -> None:
+        queue = self._outbound.setdefault(stream.stream_id, collections.deque())
+        if not queue:
+            self._active.append(stream.stream_id)
+        queue.append(StreamFrame.pack(StreamFrame.DATA, stream.stream_id, stream.send_offset, data))
+        stream.send_offset += len(data)
+        self.notify()
+
+    def _new_stream(self, stream_id: int) -> MuxStream:
+        stream = MuxStream(stream_id, self.stream_window)
+        self.streams[stream_id] = stream
+        self.streams_opened += 1
+        return stream
+
+    def _handle_open(self, stream_id: int, body: bytes) -> None:
+        if not self.accept_open or stream_id in self.streams:
+            self._send_control(StreamFrame.OPEN_REPLY, stream_id, socks5.REP_GENERAL_FAILURE)
+            return
+        try:
+            host, port, _ = socks5.decode_address(body)
+        except (ValueError, socks5.Socks5Error) as e:
+            self._send_control(StreamFrame.OPEN_REPLY, stream_id, socks5.reply_code_for_error(e))
+            return
+
+        # DATA may arrive before the connection is up, the stream buffers it
+        stream = self._new_stream(stream_id)
+        stream.tasks = [asyncio.create_task(self._connect_upstream(stream, host, port))]
+
+    async def _connect_upstream(self, stream: MuxStream, host: str, port: int) -> None:
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.connect_timeout)
+        except Exception as e:
+            print(f"Stream {stream.stream_id}: can not connect to {host}:{port}: {e}")
+            self._send_control(StreamFrame.OPEN_REPLY, stream.stream_id, socks5.reply_code_for_error(e))
+            self._close_stream(stream, notify=False)
+            return
+
+        if stream.stream_id not in self.streams:
+            writer.close()
+            return
+        self._send_control(StreamFrame.OPEN_REPLY, stream.stream_id, socks5.REP_SUCCEEDED)
+        self.establish(stream, reader, writer)
+
+    async def _stream_read_loop(self, stream: MuxStream) -> None:
+        """Local socket -> DATA frames, within the window granted by the peer"""
+        try:
+            while True:
+                while stream.send_limit <= stream.send_offset:
+                    stream.credit.clear()
+                    try:
+                        await asyncio.wait_for(stream.credit.wait(), self.WINDOW_PROBE_INTERVAL)
+                    except asyncio.TimeoutError:
+                        # WINDOW may have been lost on the way
+                        self._send_control(StreamFrame.WINDOW_PROBE, stream.stream_id)
+
+                data = await stream.reader.read(min(self.max_chunk_size, stream.send_limit - stream.send_offset))
+                if not data:
+                    break
+                self._queue_data(stream, data)
+        except (ConnectionError, OSError) as e:
+            print(f"Stream {stream.stream_id}: read error: {e}")
+            self._close_stream(stream)
+            return
+
+        stream.local_eof = True
+        self._send_control(StreamFrame.CLOSE, stream.stream_id, stream.send_offset)
+        self._maybe_finish(stream)
+
+    async def _stream_write_loop(self, stream: MuxStream) -> None:
+        """In-order stream bytes -> local socket, window is granted as they drain"""
+        try:
+            while True:
+                await stream.recv_ready.wait()
+                stream.recv_ready.clear()
+
+                while stream.recv_chunks:
+                    data = stream.recv_chunks.popleft()
+                    stream.writer.write(data)
+                    await stream.writer.drain()
+                    stream.consumed += len(data)
+                    if stream.consumed - stream.granted >= self.stream_window // 2:
+                        self._send_window(stream)
+
+                if stream.remote_eof is not None and stream.recv_offset >= stream.remote_eof:
+                    if stream.writer.can_write_eof():
+                        stream.writer.write_eof()
+                    stream.remote_eof_done = True
+                    self._maybe_finish(stream)
+                    return
+        except (ConnectionError, OSError) as e:
+            print(f"Stream {stream.stream_id}: write error: {e}")
+            self._close_stream(stream)
+
+    def _handle_stream_data(self, stream: MuxStream, value: int, body: bytes) -> None:
+        offset = StreamFrame.unwrap(value, stream.recv_offset)
+        end = offset + len(body)
+        if end <= stream.recv_offset:
+            return  # Duplicate
+        if end > stream.consumed + self.stream_window:
+            print(f"Stream {stream.stream_id}: peer exceeded the flow-control window")
+            self._close_stream(stream)
+            return
+
+        if offset > stream.recv_offset:
+            stream.recv_pending[offset] = body
+            if stream.gap_timer is None:
+                stream.gap_timer = asyncio.get_running_loop().call_later(
+                    self.GAP_TIMEOUT, self._gap_expired, stream
+                )
+            return
+
+        stream.recv_chunks.append(body[stream.recv_offset - offset:])
+        stream.recv_offset = end
+        while stream.recv_pending:
+            next_offset = min(stream.recv_pending)
+            if next_offset > stream.recv_offset:
+                break
+            chunk = stream.recv_pending.pop(next_offset)
+            if next_offset + len(chunk) > stream.recv_offset:
+                stream.recv_chunks.append(chunk[stream.recv_offset - next_offset:])
+                stream.recv_offset = next_offset + len(chunk)
+
+        if not stream.recv_pending and stream.gap_timer is not None:
+            stream.gap_timer.cancel()
+            stream.gap_timer = None
+        stream.recv_ready.set()
+
+    def _gap_expired(self, stream: MuxStream) -> None:
+        """Stream bytes were lost in the tunnel, the stream can not continue"""
+        stream.gap_timer = None
+        if stream.recv_pending:
+            print(f"Stream {stream.stream_id}: data lost in the tunnel, resetting")
+            self._close_stream(stream)
+
+    def _maybe_finish(self, stream: MuxStream) -> None:
+        """Forget stream once both directions ended and its frames were sent"""
+        if stream.local_eof and stream.remote_eof_done and not self._outbound.get(stream.stream_id):
+            self._close_stream(stream, notify=False)
+
+    def _close_stream(self, stream: MuxStream, notify: bool = True) -> None:
+        """Close local socket and forget the stream, notify=True resets it on the peer"""
+        if self.streams.pop(stream.stream_id, None) is None:
+            return
+        if notify:
+            self.streams_reset += 1
+            self._send_control(StreamFrame.RESET, stream.stream_id)
+        self._outbound.pop(stream.stream_id, None)
+        if stream.gap_timer is not None:
+            stream.gap_timer.cancel()
+        if stream.opened is not None and not stream.opened.done():
+            stream.opened.set_result(socks5.REP_GENERAL_FAILURE)
+        current = asyncio.current_task()
+        for task in stream.tasks:
+            if task is not current:
+                task.cancel()
+        if stream.writer is not None:
+            stream.writer.close()
@@ -1,16 +1,61 @@
+import asyncio
+import collections
+import ipaddress
+import os
+import socket
+import struct
 import subprocess
 from typing import Any, Optional
 from pytun_pmd3 import TunTapDevice
 from ..base_data_transport import BaseDataTransport
+from ..stream_mux.stream_frame import StreamFrame
+from ..stream_mux.stream_multiplexer import StreamMultiplexer
 
 
 class TunDataTransport(BaseDataTransport):
-    """TUN interface for IP packet tunneling"""
+    """TUN interface for IP packet tunneling
+
+    The TUN fd is non-blocking and driven by the event loop: on every
+    readiness event all queued packets are read until EAGAIN. Writes go
+    out until EAGAIN and then wait for writability, the caller's write
+    queue holds the rest.
+
+    In PEP mode (performance-enhancing proxy) TCP connections routed into
+    the interface are redirected by iptables to a local listener and
+    terminated here. Only their byte streams cross the messenger, as
+    multiplexed streams that the peer turns into fresh TCP connections,
+    so TCP throughput no longer depends on the messenger round trip.
+    Other IP traffic still goes through as packets.
+    """
+
+    # Packet information header the kernel prepends without IFF_NO_PI
+    PACKET_INFO_SIZE = 4
+    # Packets read ahead of the consumer before reading is paused
+    MAX_READ_QUEUE = 1024
+    # getsockopt option of the destination before iptables REDIRECT
+    SO_ORIGINAL_DST = 80
+    SOCKADDR_IN = struct.Struct('!2xH4s8x')
 
     def __init__(self, config: dict[str, Any]):
         super().__init__(config)
         self.tun: Optional[TunTapDevice] = None
         self.interface_name = config.get("interface_name", "teletun")
+        self._fd: Optional[int] = None
+        self._read_size = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._read_queue: collections.deque[bytes] = collections.deque()
+        self._read_ready = asyncio.Event()
+        self._read_error: Optional[OSError] = None
+        self._reading = False
+        self._writable: Optional[asyncio.Future] = None
+        self.pep = config.get("pep", False)
+        self.pep_port = config.get("pep_port", 12345)
+        # REDIRECT in OUTPUT delivers to 127.0.0.1, other hosts must not reach the listener
+        self.pep_address = config.get("pep_address", "127.0.0.1")
+        self.mux: Optional[StreamMultiplexer] = None
+        self._pep_server: Optional[asyncio.AbstractServer] = None
+        self._pep_rule: Optional[list[str]] = None
+        self._prefer_streams = False
 
     async def setup(self) -> None:
         """Setup TUN interface"""
@@ -70,29 +115,178 @@ class TunDataTransport(BaseDataTransport):
         except Exception as e:
             raise RuntimeError(f"Error setting up TUN interface: {e}")
 
+        self._start_io(mtu)
+        if self.pep:
+            await self._start_pep(src_ip, dst_ip)
+
+    def _start_io(self, mtu: int) -> None:
+        """Switch TUN fd to non-blocking mode and register it with the event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._fd = self.tun.fileno()
+        self._read_size = mtu + self.PACKET_INFO_SIZE
+        os.set_blocking(self._fd, False)
+        self._resume_reading()
+
+    def _resume_reading(self) -> None:
+        if not self._reading and self._fd is not None:
+            self._loop.add_reader(self._fd, self._on_readable)
+            self._reading = True
+
+    def _pause_reading(self) -> None:
+        if self._reading:
+            self._loop.remove_reader(self._fd)
+            self._reading = False
+
+    def _on_readable(self) -> None:
+        """Read every queued packet until EAGAIN in one wakeup"""
+        while len(self._read_queue) < self.MAX_READ_QUEUE:
+            try:
+                packet = os.read(self._fd, self._read_size)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                self._read_error = e
+                self._pause_reading()
+                break
+            if not packet:
+                break
+            self._read_queue.append(packet)
+        else:
+            # Consumer is behind, let the kernel queue hold the rest
+            self._pause_reading()
+
+        if self._read_queue or self._read_error:
+            self._read_ready.set()
+
+    async def _start_pep(self, src_ip: str, dst_ip: str) -> None:
+        """Terminate TCP routed into the interface at a local listener"""
+        self.mux = StreamMultiplexer(
+            self._read_ready.set,
+            accept_open=True,
+            # Both sides open streams, the address order splits the id space
+            stream_id_parity=1 if ipaddress.ip_address(src_ip) < ipaddress.ip_address(dst_ip) else 0,
+            stream_window=self.config.get("pep_stream_window", StreamMultiplexer.DEFAULT_STREAM_WINDOW),
+            max_chunk_size=self.config.get("pep_max_chunk_size", StreamMultiplexer.DEFAULT_MAX_CHUNK_SIZE),
+            connect_timeout=self.config.get("pep_connect_timeout", StreamMultiplexer.DEFAULT_CONNECT_TIMEOUT)
+        )
+        self._pep_server = await asyncio.start_server(self._handle_pep_connection, self.pep_address, self.pep_port)
+
+        rule = ["OUTPUT", "-o", self.interface_name, "-p", "tcp", "-j", "REDIRECT", "--to-ports", str(self.pep_port)]
+        try:
+            subprocess.run(["sudo", "iptables", "-t", "nat", "-A", *rule], check=True, capture_output=True)
+            self._pep_rule = rule
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"Failed to add iptables REDIRECT rule, TCP is not terminated locally: {e}")
+        print(f"TCP termination on {self.pep_address}:{self.pep_port}")
+
+    def _original_destination(self, writer: asyncio.StreamWriter) -> tuple[str, int]:
+        sock = writer.get_extra_info('socket')
+        port, address = self.SOCKADDR_IN.unpack(
+            sock.getsockopt(socket.SOL_IP, self.SO_ORIGINAL_DST, self.SOCKADDR_IN.size)
+        )
+        return socket.inet_ntoa(address), port
+
+    async def _handle_pep_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Carry a redirected TCP connection as a stream to its original destination"""
+        try:
+            host, port = self._original_destination(writer)
+        except OSError as e:
+            print(f"Can not get original destination of a redirected connection: {e}")
+            writer.close()
+            return
+
+        _, stream = await self.mux.open_stream(host, port)
+        if stream is None:
+            # The far side could not connect, refuse like the target would
+            writer.transport.abort()
+            return
+        self.mux.establish(stream, reader, writer)
+
+    def _on_writable(self) -> None:
+        self._loop.remove_writer(self._fd)
+        if self._writable is not None and not self._writable.done():
+            self._writable.set_result(None)
+
+    async def _wait_writable(self) -> None:
+        """Wait until the kernel accepts writes again"""
+        self._writable = self._loop.create_future()
+        self._loop.add_writer(self._fd, self._on_writable)
+        try:
+            await self._writable
+        finally:
+            self._writable = None
+
     async def read_data(self) -> bytes:
         """Reading data from TUN interface"""
         if not self.tun or not self.running:
             return b""
 
-        try:
-            return self.tun.read(self.tun.mtu)
-        except (OSError, IOError) as e:
-            self.running = False
-            raise ConnectionError(f"Error reading data from TUN interface: {e}")
+        while True:
+            if self.mux is not None:
+                # Alternate between packets and stream frames, neither starves the other
+                self._prefer_streams = not self._prefer_streams
+                if self._prefer_streams or not self._read_queue:
+                    frame = self.mux.pop_frame()
+                    if frame is not None:
+                        return frame
+            if self._read_queue:
+                break
+            if not self.running:
+                return b""
+            if self._read_error:
+                self.running = False
+                raise ConnectionError(f"Error reading data from TUN interface: {self._read_error}")
+            self._read_ready.clear()
+            await self._read_ready.wait()
+
+        packet = self._read_queue.popleft()
+        if not self._reading and len(self._read_queue) < self.MAX_READ_QUEUE // 2:
+            self._resume_reading()
+        return packet
 
     async def write_data(self, data: bytes) -> None:
         """Writing data to TUN interface"""
-        if self.tun and self.running:
-            try:
-                self.tun.write(data)
-            except (OSError, IOError) as e:
-                self.running = False
-                raise ConnectionError(f"Error writing data to TUN interface: {e}")
+        await self.write_batch([data])
+
+    async def write_batch(self, packets: list[bytes]) -> None:
+        """Write packets back to back, waiting for writability only on EAGAIN"""
+        if not (self.tun and self.running):
+            return
+
+        for packet in packets:
+            if self.mux is not None and StreamFrame.is_stream_frame(packet):
+                self.mux.handle_frame(packet)
+                continue
+            while True:
+                try:
+                    os.write(self._fd, packet)
+                    break
+                except (BlockingIOError, InterruptedError):
+                    await self._wait_writable()
+                    if not self.running:
+                        return
+                except OSError as e:
+                    self.running = False
+                    raise ConnectionError(f"Error writing data to TUN interface: {e}")
 
     async def cleanup(self) -> None:
         """Cleanup resources"""
         self.running = False
+        if self._pep_rule is not None:
+            subprocess.run(["sudo", "iptables", "-t", "nat", "-D", *self._pep_rule], capture_output=True)
+            self._pep_rule = None
+        if self._pep_server is not None:
+            self._pep_server.close()
+            self._pep_server = None
+        if self.mux is not None:
+            self.mux.close()
+        if self._fd is not None and self._loop is not None:
+            self._pause_reading()
+            self._loop.remove_writer(self._fd)
+            self._fd = None
+        if self._writable is not None and not self._writable.done():
+            self._writable.set_result(None)
+        self._read_ready.set()
         if self.tun:
             try:
                 self.tun.close()
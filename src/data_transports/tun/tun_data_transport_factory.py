@@ -24,7 +24,17 @@ class TunDataTransportFactory():
             'dst_ip': self.get_config_value("dst_ip"),
             'mask': self.get_config_value("mask"),
             'mtu': self.get_config_value("mtu"),
-            'interface_name': self.get_config_value("interface_name")
+            'interface_name': self.get_config_value("interface_name"),
+            'write_queue_size': self.get_config_value_safe("write_queue_size", 1024),
+            'drop_policy': self.get_config_value_safe("drop_policy", "tail_drop"),
+            'thinning': self.get_config_value_safe("thinning", True),
+            'header_compression': self.get_config_value_safe("header_compression", False),
+            'pep': self.get_config_value_safe("pep", False),
+            'pep_port': self.get_config_value_safe("pep_port", 12345),
+            'pep_address': self.get_config_value_safe("pep_address", "127.0.0.1"),
+            'pep_stream_window': self.get_config_value_safe("pep_stream_window", 256 * 1024),
+            'pep_max_chunk_size': self.get_config_value_safe("pep_max_chunk_size", 1024),
+            'pep_connect_timeout': self.get_config_value_safe("pep_connect_timeout", 30)
         }
         
         return TunDataTransport(config)
\ No newline at end of file
@@ -0,0 +1,146 @@
+import asyncio
+import collections
+import io
+import random
+import time
+from types import SimpleNamespace
+from typing import Any, Optional
+from pyrogram.errors import FloodWait, MessageTooLong, PeerIdInvalid
+
+
+class TelegramEmulator:
+    """In-process stand-in for Telegram, shared by FakeTelegramClient instances
+
+    Every client is an account named by its session_name. Messages and
+    documents sent to a username reach the handlers of that account after
+    delivery_delay plus up to delivery_jitter seconds. Like Telegram, an
+    account sending more than rate_limit messages within one second gets
+    FloodWait of flood_wait seconds and every send within that time fails
+    with the remaining wait, texts longer than max_message_length fail with
+    MessageTooLong. Limits are off with 0.
+
+    Pass create_client as 'client_factory' in the TelegramMessageTransport
+    config to run the real transport against the emulator.
+    """
+
+    def __init__(self, rate_limit: float = 0.0, flood_wait: int = 5, max_message_length: int = 4096,
+                 delivery_delay: float = 0.0, delivery_jitter: float = 0.0, seed: Optional[int] = None):
+        self.rate_limit = rate_limit
+        self.flood_wait = flood_wait
+        self.max_message_length = max_message_length
+        self.delivery_delay = delivery_delay
+        self.delivery_jitter = delivery_jitter
+        self._random = random.Random(seed)
+        self.clients: dict[str, 'FakeTelegramClient'] = {}
+        self._next_message_id = 1
+        self._deliveries: set[asyncio.Task] = set()
+        self.messages_sent = 0
+        self.documents_sent = 0
+        self.bytes_sent = 0
+        self.flood_waits = 0
+        self.started_at = time.monotonic()
+
+    def create_client(self, account_config: dict[str, Any]) -> 'FakeTelegramClient':
+        """Client of the account named by session_name"""
+        client = FakeTelegramClient(self, account_config.get('session_name', 'telegram_transport'))
+        self.clients[client.username] = client
+        return client
+
+    def get_summary(self) -> str:
+        uptime = max(time.monotonic() - self.started_at, 1e-9)
+        return (f"Sent: {self.messages_sent} msgs ({self.messages_sent / uptime:.1f} msg/s, "
+                f"{self.bytes_sent / uptime / 1024:.1f} KiB/s), {self.documents_sent} documents, "
+                f"FloodWait: {self.flood_waits}")
+
+    def send(self, sender: 'FakeTelegramClient', peer_username: str, text: Optional[str] = None,
+             content: Optional[bytes] = None) -> SimpleNamespace:
+        """Check limits and schedule delivery of a text or document"""
+        now = time.monotonic()
+        if now < sender.flood_until:
+            raise FloodWait(value=int(sender.flood_until - now) + 1)
+        if self.rate_limit:
+            while sender.sends and now - sender.sends[0] >= 1.0:
+                sender.sends.popleft()
+            if len(sender.sends) >= self.rate_limit:
+                self.flood_waits += 1
+                sender.flood_until = now + self.flood_wait
+                raise FloodWait(value=self.flood_wait)
+            sender.sends.append(now)
+        if text is not None and len(text) > self.max_message_length:
+            raise MessageTooLong()
+        peer = self.clients.get(peer_username)
+        if peer is None:
+            raise PeerIdInvalid()
+
+        message = SimpleNamespace(
+            id=self._next_message_id,
+            from_user=SimpleNamespace(username=sender.username),
+            text=text,
+            document=SimpleNamespace(file_size=len(content)) if content is not None else None,
+            content=content
+        )
+        self._next_message_id += 1
+        if content is not None:
+            self.documents_sent += 1
+            self.bytes_sent += len(content)
+        else:
+            self.messages_sent += 1
+            self.bytes_sent += len(text.encode('utf-8'))
+
+        delay = self.delivery_delay + (self._random.uniform(0.0, self.delivery_jitter) if self.delivery_jitter else 0.0)
+        task = asyncio.create_task(peer.deliver(message, delay))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+        return message
+
+    async def stop(self) -> None:
+        """Drop messages still on their way"""
+        for task in list(self._deliveries):
+            task.cancel()
+
+
+class FakeTelegramClient:
+    """The part of the pyrogram Client API used by TelegramMessageTransport"""
+
+    def __init__(self, emulator: TelegramEmulator, username: str):
+        self.emulator = emulator
+        self.username = username
+        self.handlers: list[Any] = []
+        self.is_connected = False
+        self.sends: collections.deque[float] = collections.deque()
+        self.flood_until = 0.0
+
+    async def start(self) -> 'FakeTelegramClient':
+        self.is_connected = True
+        return self
+
+    async def stop(self) -> 'FakeTelegramClient':
+        self.is_connected = False
+        return self
+
+    async def get_me(self) -> SimpleNamespace:
+        return SimpleNamespace(username=self.username)
+
+    def add_handler(self, handler: Any, group: int = 0) -> None:
+        self.handlers.append(handler)
+
+    async def send_message(self, chat_id: str, text: str, **kwargs: Any) -> SimpleNamespace:
+        return self.emulator.send(self, chat_id, text=text)
+
+    async def send_document(self, chat_id: str, document: io.BytesIO, **kwargs: Any) -> SimpleNamespace:
+        return self.emulator.send(self, chat_id, content=document.getvalue())
+
+    async def download_media(self, message: SimpleNamespace, in_memory: bool = False, **kwargs: Any) -> io.BytesIO:
+        return io.BytesIO(message.content)
+
+    async def deliver(self, message: SimpleNamespace, delay: float) -> None:
+        """Message of another account arrived"""
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if not self.is_connected:
+            return
+        for handler in self.handlers:
+            try:
+                await handler.callback(self, message)
+            except Exception as e:
+                print(f"Telegram emulator handler error: {e}")
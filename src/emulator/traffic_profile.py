@@ -0,0 +1,158 @@
+import asyncio
+import os
+import struct
+import time
+from typing import Any, NamedTuple, Optional
+import yaml
+from src.data_transports.loopback.loopback_data_transport import LoopbackDataTransport
+
+
+class TrafficPhase(NamedTuple):
+    """Offered load for duration seconds"""
+    duration: float
+    packet_rate: float
+    size: int
+
+
+class TrafficProfile:
+    """Scripted load test: phases of offered load and the expected results
+
+    A profile is a built-in name or a YAML file of the form
+      phases:
+        - {duration: 10, packet_rate: 50, size: 200}
+      expect:
+        min_packets_per_second: 40
+        max_p99: 2.0
+    Expectations are min_<result> or max_<result> for any key of the result
+    of run_profile, so a drop in messages/s or a rise in latency fails the
+    run.
+    """
+
+    BUILTIN = {
+        'steady': {
+            'phases': [{'duration': 20, 'packet_rate': 50, 'size': 200}],
+        },
+        'interactive': {
+            'phases': [{'duration': 20, 'packet_rate': 5, 'size': 100}],
+        },
+        'burst': {
+            'phases': [
+                {'duration': 5, 'packet_rate': 20, 'size': 200},
+                {'duration': 3, 'packet_rate': 400, 'size': 1200},
+                {'duration': 10, 'packet_rate': 20, 'size': 200},
+            ],
+        },
+        'ramp': {
+            'phases': [{'duration': 5, 'packet_rate': rate, 'size': 500} for rate in (10, 25, 50, 100, 200)],
+        },
+    }
+
+    def __init__(self, name: str, phases: list[TrafficPhase], expect: Optional[dict[str, float]] = None):
+        if not phases:
+            raise ValueError(f"Traffic profile {name} has no phases")
+        self.name = name
+        self.phases = phases
+        self.expect = expect or {}
+
+    @classmethod
+    def from_dict(cls, name: str, config: dict[str, Any]) -> 'TrafficProfile':
+        phases = [
+            TrafficPhase(float(phase['duration']), float(phase['packet_rate']), int(phase.get('size', 200)))
+            for phase in config.get('phases', [])
+        ]
+        return cls(name, phases, config.get('expect'))
+
+    @classmethod
+    def load(cls, source: str) -> 'TrafficProfile':
+        """Built-in profile by name or profile from a YAML file"""
+        if source in cls.BUILTIN:
+            return cls.from_dict(source, cls.BUILTIN[source])
+        try:
+            with open(source, 'r', encoding='utf-8') as f:
+                config = yaml.safe_load(f) or {}
+        except FileNotFoundError:
+            raise ValueError(f"Unknown traffic profile {source}, built-in: {', '.join(cls.BUILTIN)}")
+        return cls.from_dict(os.path.basename(source), config)
+
+    def check(self, result: dict[str, float]) -> list[str]:
+        """Expectations the result does not meet"""
+        failures = []
+        for key, limit in self.expect.items():
+            bound, _, metric = key.partition('_')
+            if bound not in ('min', 'max') or metric not in result:
+                failures.append(f"unknown expectation {key}")
+            elif bound == 'min' and result[metric] < limit:
+                failures.append(f"{metric} {result[metric]:.3f} below {limit}")
+            elif bound == 'max' and result[metric] > limit:
+                failures.append(f"{metric} {result[metric]:.3f} above {limit}")
+        return failures
+
+
+# Packet id and injection time at the start of every packet
+PACKET_HEADER = struct.Struct('!Id')
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_profile(profile: TrafficProfile, sender: LoopbackDataTransport, receiver: LoopbackDataTransport,
+                      drain_timeout: float = 10.0) -> dict[str, float]:
+    """Inject the profile traffic into sender and time it until receiver writes it
+
+    Latencies are one-way in seconds, rates are up to the last delivered packet.
+    """
+    latencies: list[float] = []
+    seen: set[int] = set()
+    received_bytes = 0
+    last_arrival = 0.0
+    offered = 0
+    all_sent = False
+    done = asyncio.Event()
+
+    def sink(packet: bytes) -> None:
+        nonlocal received_bytes, last_arrival
+        index, sent_at = PACKET_HEADER.unpack_from(packet)
+        if index in seen:
+            return
+        seen.add(index)
+        last_arrival = time.perf_counter()
+        latencies.append(last_arrival - sent_at)
+        received_bytes += len(packet)
+        if all_sent and len(seen) == offered:
+            done.set()
+
+    receiver.sink = sink
+    started = time.perf_counter()
+    phase_start = started
+    for phase in profile.phases:
+        count = int(phase.duration * phase.packet_rate)
+        for index in range(count):
+            delay = phase_start + index / phase.packet_rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            size = max(phase.size, PACKET_HEADER.size)
+            await sender.inject(PACKET_HEADER.pack(offered, time.perf_counter()) + os.urandom(size - PACKET_HEADER.size))
+            offered += 1
+        phase_start += phase.duration
+
+    all_sent = True
+    if len(seen) < offered:
+        try:
+            await asyncio.wait_for(done.wait(), drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+    elapsed = max((last_arrival or time.perf_counter()) - started, 1e-9)
+    return {
+        'offered': offered,
+        'delivered': len(seen),
+        'delivery_ratio': len(seen) / offered if offered else 0.0,
+        'packets_per_second': len(seen) / elapsed,
+        'goodput': received_bytes / elapsed,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'elapsed': elapsed,
+    }
@@ -0,0 +1,349 @@
+import asyncio
+import collections
+import html
+import json
+import random
+import re
+import secrets
+import time
+from typing import Any, Optional
+from aiohttp import web
+
+
+class VKApiError(Exception):
+    """API method failed with a VK error code"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class VKUserState:
+    """Long Poll event log of one emulated VK user"""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.key = secrets.token_hex(16)
+        self.key_issued_at = time.monotonic()
+        # Long Poll ts of events[0], older events are trimmed
+        self.first_ts = 1
+        self.events: list[list[Any]] = []
+        self.changed = asyncio.Condition()
+        # (peer_id, random_id) -> message_id of recently sent messages
+        self.sent_random_ids: collections.OrderedDict[tuple[int, int], int] = collections.OrderedDict()
+        # Monotonic times of recent API requests and sent messages, for the limits
+        self.requests: collections.deque[float] = collections.deque()
+        self.sends: collections.deque[float] = collections.deque()
+
+    @property
+    def ts(self) -> int:
+        """ts of the next event"""
+        return self.first_ts + len(self.events)
+
+
+class VKApiEmulator:
+    """Local stand-in for the VK API: messages.send, execute and user Long Poll
+
+    Access tokens are user ids ("1", "2", ...) or arbitrary strings that
+    get an id on first use. Every sent message becomes a Long Poll event
+    (code 4) for the sender (with the outbox flag) and for the recipient.
+    Like VK, a message with a random_id already used for the same peer
+    (0 included) is not sent again. execute understands code of the form
+    'return [API.method({...}), ...];' with JSON arguments.
+    Counters of sent and delivered messages make the emulator usable for
+    throughput measurement.
+
+    Limits are off by default. With request_rate a user making more API
+    requests per second gets error 6 (an execute request counts once), with
+    flood_limit a messages.send above flood_limit messages per flood_window
+    seconds fails with error 9, inside execute as a false result with an
+    execute_errors entry. error_rate answers that share of requests with
+    error 10, and delivery_delay plus up to delivery_jitter seconds pass
+    before a sent message shows up in Long Poll.
+    """
+
+    LONG_POLL_PATH = '/lp'
+    FLAG_UNREAD = 1
+    FLAG_OUTBOX = 2
+    EXECUTE_MAX_CALLS = 25
+    RANDOM_ID_MEMORY = 10000
+    EXECUTE_CALL = re.compile(r'API\.([\w.]+)\(')
+    ERROR_TOO_MANY_REQUESTS = 6
+    ERROR_FLOOD_CONTROL = 9
+    ERROR_INTERNAL = 10
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8081,
+                 key_lifetime: float = 0.0, max_events: int = 10000,
+                 request_rate: float = 0.0, flood_limit: int = 0, flood_window: float = 60.0,
+                 error_rate: float = 0.0, delivery_delay: float = 0.0, delivery_jitter: float = 0.0,
+                 seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        # Long Poll keys expire after that many seconds, 0 - never
+        self.key_lifetime = key_lifetime
+        self.max_events = max_events
+        self.request_rate = request_rate
+        self.flood_limit = flood_limit
+        self.flood_window = flood_window
+        self.error_rate = error_rate
+        self.delivery_delay = delivery_delay
+        self.delivery_jitter = delivery_jitter
+        self._random = random.Random(seed)
+        self._deliveries: set[asyncio.Task] = set()
+        self.users: dict[int, VKUserState] = {}
+        self._token_users: dict[str, int] = {}
+        self._next_message_id = 1
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.events_delivered = 0
+        self.requests = 0
+        self.duplicates = 0
+        self.throttled_requests = 0
+        self.flood_errors = 0
+        self.internal_errors = 0
+        self.started_at = time.monotonic()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def api_url(self) -> str:
+        """Value for the VK transport 'api_url' setting"""
+        return f"http://{self.host}:{self.port}/method/"
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route('*', '/method/{method}', self._handle_method)
+        app.router.add_route('*', self.LONG_POLL_PATH, self._handle_long_poll)
+        return app
+
+    async def start(self) -> None:
+        """Start serving on host:port"""
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self) -> None:
+        for task in list(self._deliveries):
+            task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def get_summary(self) -> str:
+        uptime = max(time.monotonic() - self.started_at, 1e-9)
+        return (f"Requests: {self.requests} ({self.requests / uptime:.1f}/s), "
+                f"Sent: {self.messages_sent} msgs ({self.messages_sent / uptime:.1f} msg/s, "
+                f"{self.bytes_sent / uptime / 1024:.1f} KiB/s), Duplicates: {self.duplicates}, "
+                f"Delivered: {self.events_delivered} events ({self.events_delivered / uptime:.1f}/s), "
+                f"Errors: {self.throttled_requests} too many requests, {self.flood_errors} flood control, "
+                f"{self.internal_errors} internal")
+
+    def _user(self, user_id: int) -> VKUserState:
+        if user_id not in self.users:
+            self.users[user_id] = VKUserState(user_id)
+        return self.users[user_id]
+
+    def _user_by_token(self, token: Optional[str]) -> Optional[VKUserState]:
+        if not token:
+            return None
+        if token.isdigit():
+            return self._user(int(token))
+        if token not in self._token_users:
+            self._token_users[token] = 1000000 + len(self._token_users)
+        return self._user(self._token_users[token])
+
+    @staticmethod
+    def _error_body(code: int, message: str) -> dict:
+        return {'error_code': code, 'error_msg': message}
+
+    @classmethod
+    def _error(cls, code: int, message: str) -> web.Response:
+        return web.json_response({'error': cls._error_body(code, message)})
+
+    async def _params(self, request: web.Request) -> dict[str, str]:
+        params = dict(request.query)
+        if request.method == 'POST':
+            params.update(await request.post())
+        return params
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        user = self._user_by_token(params.get('access_token'))
+        if user is None:
+            return self._error(5, "User authorization failed: no access_token passed.")
+
+        self.requests += 1
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.internal_errors += 1
+            return self._error(self.ERROR_INTERNAL, "Internal server error")
+        if self._over_limit(user.requests, self.request_rate, 1.0):
+            self.throttled_requests += 1
+            return self._error(self.ERROR_TOO_MANY_REQUESTS, "Too many requests per second")
+        method = request.match_info['method']
+        if method == 'execute':
+            return await self._execute(user, params.get('code', ''))
+        handler = self._method_handler(method)
+        if handler is None:
+            return self._error(3, "Unknown method passed.")
+        try:
+            return web.json_response({'response': await handler(user, params)})
+        except VKApiError as e:
+            return self._error(e.code, e.message)
+        except (KeyError, ValueError) as e:
+            return self._error(100, f"One of the parameters specified was missing or invalid: {e}")
+
+    @staticmethod
+    def _over_limit(times: collections.deque, limit: float, window: float) -> bool:
+        """Record an action, True if it is one too many within the window"""
+        if not limit:
+            return False
+        now = time.monotonic()
+        while times and now - times[0] >= window:
+            times.popleft()
+        if len(times) >= limit:
+            return True
+        times.append(now)
+        return False
+
+    def _method_handler(self, method: str):
+        return getattr(self, '_method_' + method.replace('.', '_'), None)
+
+    def _parse_execute_code(self, code: str) -> list[tuple[str, dict]]:
+        """Calls of 'return [API.method({...}), ...];'"""
+        decoder = json.JSONDecoder()
+        calls = []
+        position = 0
+        while True:
+            match = self.EXECUTE_CALL.search(code, position)
+            if match is None:
+                return calls
+            params, end = decoder.raw_decode(code, match.end())
+            if not isinstance(params, dict) or code[end] != ')':
+                raise ValueError(f"unsupported call of {match.group(1)}")
+            calls.append((match.group(1), {key: str(value) for key, value in params.items()}))
+            position = end + 1
+
+    async def _execute(self, user: VKUserState, code: str) -> web.Response:
+        """Run calls one by one, a failed call returns false and adds to execute_errors"""
+        try:
+            calls = self._parse_execute_code(code)
+        except (ValueError, IndexError) as e:
+            return self._error(12, f"Unable to compile code: {e}")
+        if len(calls) > self.EXECUTE_MAX_CALLS:
+            return self._error(13, "Runtime error occurred during code invocation: too many API calls")
+
+        responses = []
+        errors = []
+        for method, params in calls:
+            handler = self._method_handler(method)
+            if handler is None:
+                responses.append(False)
+                errors.append({'method': method, **self._error_body(3, "Unknown method passed.")})
+                continue
+            try:
+                responses.append(await handler(user, params))
+            except VKApiError as e:
+                responses.append(False)
+                errors.append({'method': method, **self._error_body(e.code, e.message)})
+            except (KeyError, ValueError) as e:
+                responses.append(False)
+                errors.append({'method': method, **self._error_body(
+                    100, f"One of the parameters specified was missing or invalid: {e}"
+                )})
+
+        result: dict[str, Any] = {'response': responses}
+        if errors:
+            result['execute_errors'] = errors
+        return web.json_response(result)
+
+    async def _method_messages_send(self, user: VKUserState, params: dict[str, str]) -> int:
+        peer = self._user(int(params['peer_id']))
+        text = params.get('message', '')
+        dedup_key = (peer.user_id, int(params.get('random_id', 0)))
+        if dedup_key in user.sent_random_ids:
+            self.duplicates += 1
+            return user.sent_random_ids[dedup_key]
+        if self._over_limit(user.sends, self.flood_limit, self.flood_window):
+            self.flood_errors += 1
+            raise VKApiError(self.ERROR_FLOOD_CONTROL, "Flood control")
+
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        user.sent_random_ids[dedup_key] = message_id
+        if len(user.sent_random_ids) > self.RANDOM_ID_MEMORY:
+            user.sent_random_ids.popitem(last=False)
+        self.messages_sent += 1
+        self.bytes_sent += len(text.encode('utf-8'))
+
+        timestamp = int(time.time())
+        # Long Poll delivers text HTML-escaped, like VK does
+        text = html.escape(text).replace('\n', '<br>')
+        await self._push_event(user, [4, message_id, self.FLAG_OUTBOX, peer.user_id, timestamp, text, {}, {}])
+        if peer is not user:
+            event = [4, message_id, self.FLAG_UNREAD, user.user_id, timestamp, text, {}, {}]
+            delay = self.delivery_delay + (self._random.uniform(0.0, self.delivery_jitter) if self.delivery_jitter else 0.0)
+            if delay > 0:
+                task = asyncio.create_task(self._push_event_later(peer, event, delay))
+                self._deliveries.add(task)
+                task.add_done_callback(self._deliveries.discard)
+            else:
+                await self._push_event(peer, event)
+        return message_id
+
+    async def _push_event_later(self, user: VKUserState, event: list[Any], delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self._push_event(user, event)
+
+    async def _method_messages_getLongPollServer(self, user: VKUserState, params: dict[str, str]) -> dict:
+        user.key = secrets.token_hex(16)
+        user.key_issued_at = time.monotonic()
+        return {
+            'key': user.key,
+            'server': f"http://{self.host}:{self.port}{self.LONG_POLL_PATH}",
+            'ts': user.ts
+        }
+
+    async def _push_event(self, user: VKUserState, event: list[Any]) -> None:
+        async with user.changed:
+            user.events.append(event)
+            if len(user.events) > self.max_events:
+                trimmed = len(user.events) - self.max_events
+                del user.events[:trimmed]
+                user.first_ts += trimmed
+            user.changed.notify_all()
+
+    def _find_user_by_key(self, key: str) -> Optional[VKUserState]:
+        for user in self.users.values():
+            if user.key == key:
+                return user
+        return None
+
+    async def _handle_long_poll(self, request: web.Request) -> web.Response:
+        params = await self._params(request)
+        user = self._find_user_by_key(params.get('key', ''))
+        if user is None or (self.key_lifetime and time.monotonic() - user.key_issued_at > self.key_lifetime):
+            return web.json_response({'failed': 2})
+
+        try:
+            ts = int(params['ts'])
+        except (KeyError, ValueError):
+            return web.json_response({'failed': 1, 'ts': user.ts})
+        if ts > user.ts:
+            return web.json_response({'failed': 3})
+        if ts < user.first_ts:
+            # Events were trimmed, the client has to continue from the new ts
+            return web.json_response({'failed': 1, 'ts': user.ts})
+
+        wait = min(int(params.get('wait', 25)), 90)
+        async with user.changed:
+            if ts == user.ts:
+                try:
+                    await asyncio.wait_for(user.changed.wait_for(lambda: user.ts > ts), wait)
+                except asyncio.TimeoutError:
+                    pass
+            if ts < user.first_ts:
+                return web.json_response({'failed': 1, 'ts': user.ts})
+            updates = user.events[ts - user.first_ts:]
+
+        self.events_delivered += len(updates)
+        return web.json_response({'ts': ts + len(updates), 'updates': updates})
@@ -0,0 +1,99 @@
+from .default_message_encoder import DefaultMessageEncoder
+
+
+def _build_alphabet(ranges: list[tuple[int, int]]) -> str:
+    return ''.join(chr(code) for start, end in ranges for code in range(start, end))
+
+
+# 32768 + 128 letters from the BMP: CJK Extension A, CJK Unified Ideographs
+# and Hangul Syllables. All of them are single UTF-16 code units and stay
+# unchanged under NFC/NFKC normalization, so messengers keep them intact.
+_ALPHABET = _build_alphabet([(0x3400, 0x4DB6), (0x4E00, 0x9FA6), (0xAC00, 0xD7A4)])
+_ALPHABET_15 = _ALPHABET[:1 << 15]
+_ALPHABET_7 = _ALPHABET[1 << 15:(1 << 15) + (1 << 7)]
+_DECODE_15 = {char: value for value, char in enumerate(_ALPHABET_15)}
+_DECODE_7 = {char: value for value, char in enumerate(_ALPHABET_7)}
+
+# 15 bytes are exactly 8 characters of 15 bits
+_BLOCK_BYTES = 15
+_BLOCK_CHARS = 8
+
+
+class Base32768MessageEncoder(DefaultMessageEncoder):
+    """Unicode-dense encoding: 15 bits per character
+
+    Messengers limit message length in characters, not bytes, so one
+    character from a 32768-letter alphabet carries 15 bits of data
+    against 6 bits for base64. The tail is padded with 1 bits; when it
+    has 7 bits or less, a letter from a separate 128-letter alphabet is
+    used, so padding never reaches a full byte.
+    """
+
+    @staticmethod
+    def encode_data(data: bytes) -> str:
+        """Encoding data to base32768"""
+        chars = []
+        full_length = len(data) - len(data) % _BLOCK_BYTES
+
+        for offset in range(0, full_length, _BLOCK_BYTES):
+            block = int.from_bytes(data[offset:offset + _BLOCK_BYTES], 'big')
+            for shift in range(105, -1, -15):
+                chars.append(_ALPHABET_15[(block >> shift) & 0x7FFF])
+
+        tail = data[full_length:]
+        if tail:
+            value = int.from_bytes(tail, 'big')
+            bits = len(tail) * 8
+            while bits > 7:
+                pad = max(0, 15 - bits)
+                chunk = ((value << pad) | ((1 << pad) - 1)) >> max(0, bits - 15)
+                chars.append(_ALPHABET_15[chunk & 0x7FFF])
+                bits -= 15
+            if bits > 0:
+                pad = 7 - bits
+                chunk = ((value & ((1 << bits) - 1)) << pad) | ((1 << pad) - 1)
+                chars.append(_ALPHABET_7[chunk])
+
+        return ''.join(chars)
+
+    @staticmethod
+    def decode_data(encoded_data: str) -> bytes:
+        """Decoding data from base32768"""
+        parts = []
+        full_length = len(encoded_data) - len(encoded_data) % _BLOCK_CHARS
+        if full_length == len(encoded_data) and full_length and encoded_data[-1] in _DECODE_7:
+            full_length -= _BLOCK_CHARS
+
+        try:
+            for offset in range(0, full_length, _BLOCK_CHARS):
+                block = 0
+                for char in encoded_data[offset:offset + _BLOCK_CHARS]:
+                    block = (block << 15) | _DECODE_15[char]
+                parts.append(block.to_bytes(_BLOCK_BYTES, 'big'))
+
+            value = 0
+            bits = 0
+            tail = encoded_data[full_length:]
+            for index, char in enumerate(tail):
+                if char in _DECODE_15:
+                    value = (value << 15) | _DECODE_15[char]
+                    bits += 15
+                elif index == len(tail) - 1:
+                    value = (value << 7) | _DECODE_7[char]
+                    bits += 7
+                else:
+                    raise KeyError(char)
+        except KeyError as e:
+            raise ValueError(f"Invalid base32768 character: {e}")
+
+        pad = bits % 8
+        if value & ((1 << pad) - 1) != (1 << pad) - 1:
+            raise ValueError("Invalid base32768 padding")
+        if bits >= 8:
+            parts.append((value >> pad).to_bytes(bits // 8, 'big'))
+        return b''.join(parts)
+
+    @staticmethod
+    def max_decoded_size(encoded_length: int) -> int:
+        """Maximum number of data bytes that fit into encoded_length characters"""
+        return (encoded_length * 15) // 8
@@ -0,0 +1,26 @@
+import base64
+from .default_message_encoder import DefaultMessageEncoder
+
+# '-' is part of the base85 alphabet and would clash with the control
+# message prefix, so it is sent as '.', which base85 does not use
+_TO_MESSAGE = str.maketrans('-', '.')
+_FROM_MESSAGE = str.maketrans('.', '-')
+
+
+class Base85MessageEncoder(DefaultMessageEncoder):
+    """Base85 encoding: 4 bytes per 5 characters"""
+    
+    @staticmethod
+    def encode_data(data: bytes) -> str:
+        """Encoding data to base85"""
+        return base64.b85encode(data).decode('ascii').translate(_TO_MESSAGE)
+    
+    @staticmethod
+    def decode_data(encoded_data: str) -> bytes:
+        """Decoding data from base85"""
+        return base64.b85decode(encoded_data.translate(_FROM_MESSAGE))
+    
+    @staticmethod
+    def max_decoded_size(encoded_length: int) -> int:
+        """Maximum number of data bytes that fit into encoded_length characters"""
+        return (encoded_length // 5) * 4 + max(0, encoded_length % 5 - 1)
@@ -0,0 +1,143 @@
+import asyncio
+import concurrent.futures
+import functools
+import time
+from typing import Any, Callable, Optional, Union
+from .default_message_encoder import DefaultMessageEncoder
+from .payload_compressor import PayloadCompressor
+
+# Encoder of a process pool worker, created once per process by _init_worker
+_worker_encoder: Optional[DefaultMessageEncoder] = None
+
+
+def _init_worker(encoder_class: type, algorithm: str, level: int) -> None:
+    global _worker_encoder
+    _worker_encoder = encoder_class(PayloadCompressor(algorithm, level))
+
+
+def _call_worker_encoder(operation: str, *args: Any) -> Any:
+    return getattr(_worker_encoder, operation)(*args)
+
+
+class CodecPipeline:
+    """Runs encoder jobs of a message transport inline or on a worker pool
+
+    Compression and text encoding run on the event loop thread by default.
+    With executor 'thread' or 'process', jobs on payloads of at least
+    offload_threshold bytes go to a pool of workers: threads pay off for
+    codecs that release the GIL (zlib, lzma, bz2), processes for pure
+    Python work such as base32768 or Reed-Solomon parity. Smaller payloads
+    stay inline, the pool round trip would cost more than the job.
+
+    Results of encode jobs and of decode jobs are returned in the order
+    the jobs were submitted, even when a later small job finishes inline
+    first, so messages leave and arrive in frame order. Job times go to
+    the 'encode' and 'decode' stages of the encoder stats and tracer, pool
+    queueing included. Compression counters of process workers stay in the
+    workers.
+    """
+
+    EXECUTORS = ('inline', 'thread', 'process')
+    DEFAULT_OFFLOAD_THRESHOLD = 16 * 1024
+
+    def __init__(self, encoder: DefaultMessageEncoder, executor: str = 'inline', workers: int = 0,
+                 offload_threshold: int = DEFAULT_OFFLOAD_THRESHOLD):
+        if executor not in self.EXECUTORS:
+            raise ValueError(f"Unsupported codec executor: {executor}")
+        if offload_threshold < 0:
+            raise ValueError(f"Codec offload threshold must not be negative, received: {offload_threshold}")
+        self.encoder = encoder
+        self.executor = executor
+        self.offload_threshold = offload_threshold
+        self._pool: Optional[concurrent.futures.Executor] = None
+        # Encoder copy without stats and tracer, shared by the pool threads
+        self._thread_encoder: Optional[DefaultMessageEncoder] = None
+        if executor == 'thread':
+            self._thread_encoder = type(encoder)(encoder.compressor)
+            self._pool = concurrent.futures.ThreadPoolExecutor(workers or None, thread_name_prefix='codec')
+        elif executor == 'process':
+            compressor = encoder.compressor
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                workers or None, initializer=_init_worker,
+                initargs=(type(encoder), compressor.algorithm, compressor.level)
+            )
+        # Completion of the last submitted job per stage, the next one returns after it
+        self._last_done: dict[str, asyncio.Event] = {}
+        self.offloaded_jobs = 0
+
+    async def encode_message(self, data: bytes) -> str:
+        """Compress and encode message payload"""
+        return await self._run('encode', 'encode_message', len(data), data)
+
+    async def decode_message(self, message: str) -> bytes:
+        """Decode and decompress message payload"""
+        return await self._run('decode', 'decode_message', len(message), message)
+
+    async def encode_document(self, data: bytes) -> bytes:
+        """Prepare payload sent as a binary document"""
+        return await self._run('encode', 'encode_document', len(data), data)
+
+    async def decode_document(self, document: bytes, max_size: int) -> bytes:
+        """Restore payload received as a binary document"""
+        return await self._run('decode', 'decode_document', len(document), document, max_size)
+
+    async def encode_batch(self, payloads: list[bytes]) -> list[str]:
+        """Encode several message payloads at once, results in payload order"""
+        return await asyncio.gather(*(self.encode_message(data) for data in payloads))
+
+    async def decode_batch(self, messages: list[str]) -> list[Union[bytes, Exception]]:
+        """Decode several messages at once, results in message order
+
+        A message that fails to decode gets its exception in the result
+        instead of failing the batch.
+        """
+        return await asyncio.gather(*(self.decode_message(message) for message in messages), return_exceptions=True)
+
+    async def run(self, function: Callable[..., Any], *args: Any, size: int = 0) -> Any:
+        """Run another codec function, on the pool when size reaches the threshold
+
+        For process pools function and arguments must be picklable. The
+        result is not ordered against other jobs.
+        """
+        if self._pool is None or size < self.offload_threshold:
+            return function(*args)
+        self.offloaded_jobs += 1
+        return await asyncio.get_running_loop().run_in_executor(self._pool, functools.partial(function, *args))
+
+    async def _run(self, stage: str, operation: str, size: int, *args: Any) -> Any:
+        previous = self._last_done.get(stage)
+        if self._pool is None or size < self.offload_threshold:
+            if previous is None:
+                # Nothing in flight: plain inline call, timed by the encoder itself
+                return getattr(self.encoder, operation)(*args)
+            job = None
+        else:
+            self.offloaded_jobs += 1
+            if self._thread_encoder is not None:
+                call = functools.partial(getattr(self._thread_encoder, operation), *args)
+            else:
+                call = functools.partial(_call_worker_encoder, operation, *args)
+            job = asyncio.get_running_loop().run_in_executor(self._pool, call)
+
+        done = asyncio.Event()
+        self._last_done[stage] = done
+        try:
+            if job is None:
+                result = getattr(self.encoder, operation)(*args)
+            else:
+                started = time.perf_counter()
+                result = await job
+                self.encoder.observe(stage, started)
+            if previous is not None:
+                await previous.wait()
+            return result
+        finally:
+            done.set()
+            if self._last_done.get(stage) is done:
+                del self._last_done[stage]
+
+    def close(self) -> None:
+        """Stop the workers, jobs not started yet are cancelled"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,134 @@
+from typing import Optional
+
+
+def _build_tables() -> tuple[list[int], list[int]]:
+    """Exponent and logarithm tables of GF(256) with polynomial 0x11D"""
+    exp = [0] * 512
+    log = [0] * 256
+    value = 1
+    for power in range(255):
+        exp[power] = value
+        log[value] = power
+        value <<= 1
+        if value & 0x100:
+            value ^= 0x11D
+    for power in range(255, 512):
+        exp[power] = exp[power - 255]
+    return exp, log
+
+
+_EXP, _LOG = _build_tables()
+
+
+def _mul(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def _div(a: int, b: int) -> int:
+    if b == 0:
+        raise ZeroDivisionError("division by zero in GF(256)")
+    if a == 0:
+        return 0
+    return _EXP[_LOG[a] - _LOG[b] + 255]
+
+
+class ErasureCode:
+    """Systematic Reed-Solomon erasure code over GF(256)
+
+    Parity block j is the sum over data blocks i of coefficient(j, i) * block i,
+    with a Cauchy matrix whose columns are scaled so that parity block 0 is the
+    plain XOR of the data. Any count data blocks out of data and parity
+    rebuild the rest. Blocks are processed whole: multiplication by a constant
+    is one bytes.translate with a 256-byte table, addition is an XOR of the
+    blocks as big integers, so no Python loop runs per byte.
+
+    Up to MAX_DATA data blocks and MAX_PARITY parity blocks per group.
+    """
+
+    MAX_DATA = 128
+    MAX_PARITY = 128
+
+    _tables: dict[int, bytes] = {}
+
+    @staticmethod
+    def coefficient(parity_index: int, data_index: int) -> int:
+        """Coefficient of data block data_index in parity block parity_index"""
+        # Cauchy matrix 1 / (x_j + y_i) with x_j = j, y_i = MAX_PARITY + i, column i
+        # scaled by 1 / entry of row 0, which keeps every square submatrix invertible
+        y = ErasureCode.MAX_PARITY + data_index
+        return _div(y, parity_index ^ y)
+
+    @classmethod
+    def _scale(cls, block: bytes, factor: int) -> int:
+        """block multiplied by factor, as an integer for XOR"""
+        if factor != 1:
+            table = cls._tables.get(factor)
+            if table is None:
+                table = cls._tables[factor] = bytes(_mul(factor, value) for value in range(256))
+            block = block.translate(table)
+        return int.from_bytes(block, 'big')
+
+    @classmethod
+    def encode(cls, blocks: list[bytes], parity_count: int) -> list[bytes]:
+        """Parity blocks for data blocks of equal length"""
+        if len(blocks) > cls.MAX_DATA or parity_count > cls.MAX_PARITY:
+            raise ValueError(f"Too many blocks for erasure code: {len(blocks)} data, {parity_count} parity")
+        length = len(blocks[0]) if blocks else 0
+        parity = []
+        for parity_index in range(parity_count):
+            value = 0
+            for data_index, block in enumerate(blocks):
+                value ^= cls._scale(block, cls.coefficient(parity_index, data_index))
+            parity.append(value.to_bytes(length, 'big'))
+        return parity
+
+    @classmethod
+    def decode(cls, count: int, blocks: dict[int, bytes], parity: dict[int, bytes]) -> Optional[dict[int, bytes]]:
+        """Missing data blocks by index, None if fewer than count blocks are known
+
+        blocks and parity map indices to blocks of equal length.
+        """
+        missing = [index for index in range(count) if index not in blocks]
+        if not missing:
+            return {}
+        if len(parity) < len(missing):
+            return None
+        rows = sorted(parity)[:len(missing)]
+        length = len(parity[rows[0]])
+
+        # Parity minus the known data leaves the missing blocks times the coefficients
+        syndromes = []
+        for row in rows:
+            value = int.from_bytes(parity[row], 'big')
+            for data_index, block in blocks.items():
+                value ^= cls._scale(block, cls.coefficient(row, data_index))
+            syndromes.append(value.to_bytes(length, 'big'))
+
+        inverse = cls._invert([[cls.coefficient(row, index) for index in missing] for row in rows])
+        recovered = {}
+        for position, index in enumerate(missing):
+            value = 0
+            for row_position, syndrome in enumerate(syndromes):
+                factor = inverse[position][row_position]
+                if factor:
+                    value ^= cls._scale(syndrome, factor)
+            recovered[index] = value.to_bytes(length, 'big')
+        return recovered
+
+    @staticmethod
+    def _invert(matrix: list[list[int]]) -> list[list[int]]:
+        """Inverse of a square matrix over GF(256), Gauss-Jordan elimination"""
+        size = len(matrix)
+        rows = [row[:] + [1 if i == j else 0 for j in range(size)] for i, row in enumerate(matrix)]
+        for column in range(size):
+            pivot = next(i for i in range(column, size) if rows[i][column])
+            rows[column], rows[pivot] = rows[pivot], rows[column]
+            factor = rows[column][column]
+            rows[column] = [_div(value, factor) for value in rows[column]]
+            for i in range(size):
+                if i != column and rows[i][column]:
+                    scale = rows[i][column]
+                    rows[i] = [value ^ _mul(scale, pivot_value) for value, pivot_value in zip(rows[i], rows[column])]
+        return [row[size:] for row in rows]
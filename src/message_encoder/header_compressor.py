@@ -0,0 +1,380 @@
+import struct
+import time
+from typing import Optional
+from src.core.tcp_packet_info import ip_offset, PROTOCOL_TCP, TCP_HEADER
+
+# TCP header without options, TCP_HEADER stops before checksum and urgent pointer
+TCP_FIXED_HEADER_LENGTH = 20
+
+
+def _checksum(data: bytes) -> int:
+    """Internet checksum"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def _encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _decode_varint(data: bytes, offset: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+class _FlowContext:
+    """Reference header of one TCP flow, shared by both peers"""
+
+    def __init__(self, cid: int, generation: int, packet: bytes, offset: int, version: int, ip_header_length: int):
+        self.cid = cid
+        self.generation = generation
+        # Packet information header, IP header and fixed TCP header
+        self.prefix_length = offset
+        self.ip_header_length = ip_header_length
+        self.version = version
+        tcp_offset = offset + ip_header_length
+        self.header = packet[:tcp_offset + TCP_FIXED_HEADER_LENGTH]
+        _, _, self.seq, self.ack, _, self.flags, self.window = TCP_HEADER.unpack_from(packet, tcp_offset)
+        self.ip_id = struct.unpack_from('!H', packet, offset + 4)[0] if version == 4 else 0
+        self.static = HeaderCompressor.static_part(packet, offset, version)
+        self.packets = 0
+        self.created_at = time.monotonic()
+
+
+class HeaderCompressor:
+    """Van Jacobson style IP/TCP header compression between tunnel peers
+
+    Packets of a TCP flow are sent as records of the packet framer. The
+    first packet of a flow goes in full, prefixed with a context id and
+    generation, and both sides keep its headers as the flow reference.
+    Later packets only carry deltas against that reference: sequence, ack
+    and IP ID increments, window and flags when they changed, TCP options
+    and the TCP checksum. The receiver rebuilds lengths and the IPv4 header
+    checksum. Deltas are taken against the reference rather than the
+    previous packet, so lost or reordered messages do not corrupt later
+    packets. The reference is resent when deltas grow, static fields change,
+    and periodically, which repairs a context the receiver lost. Packets
+    referring to an unknown context are dropped and TCP retransmits them.
+
+    Records of one context may travel in different tunnel lanes, which are
+    only ordered within themselves. The receiver therefore keeps the
+    previous reference of a context for records sent before a refresh, and
+    holds records that overtook their full record until it arrives.
+
+    Records start with 0xC1 (full) or 0xC2 (compressed). IP packets, TUN
+    packet information headers and stream frames never start with these
+    bytes, so other records pass through unchanged.
+    """
+
+    FULL = 0xC1
+    COMPRESSED = 0xC2
+    RECORD_HEADER = struct.Struct('!BBB')
+    MAX_CONTEXTS = 256
+    GENERATION_MODULO = 256
+    # Compressed records waiting for their full record, over all contexts
+    MAX_HELD_RECORDS = 256
+    # Deltas up to 3 varint bytes, larger ones refresh the reference
+    MAX_DELTA = 1 << 21
+    REFRESH_PACKETS = 64
+    REFRESH_INTERVAL = 2.0
+
+    FIELD_SEQ = 0x01
+    FIELD_ACK = 0x02
+    FIELD_IP_ID = 0x04
+    FIELD_WINDOW = 0x08
+    FIELD_FLAGS = 0x10
+    FIELD_OPTIONS = 0x20
+
+    def __init__(self):
+        self._send_contexts: dict[tuple, _FlowContext] = {}
+        self._send_cids: list[Optional[tuple]] = [None] * self.MAX_CONTEXTS
+        self._generations = [0] * self.MAX_CONTEXTS
+        self._next_cid = 0
+        self._receive_contexts: dict[int, _FlowContext] = {}
+        # Reference a context had before its latest full record
+        self._previous_contexts: dict[int, _FlowContext] = {}
+        # Compressed records by context id and generation, in arrival order
+        self._held: dict[tuple[int, int], list[bytes]] = {}
+        self._held_count = 0
+        self.bytes_saved = 0
+        self.context_misses = 0
+
+    def reset(self) -> None:
+        """Forget all contexts, the peer restarted"""
+        self._send_contexts.clear()
+        self._send_cids = [None] * self.MAX_CONTEXTS
+        self._receive_contexts.clear()
+        self._previous_contexts.clear()
+        self._held.clear()
+        self._held_count = 0
+
+    @staticmethod
+    def static_part(packet: bytes, offset: int, version: int) -> bytes:
+        """Header bytes that must match the reference for a compressed packet"""
+        ip_header = packet[offset:offset + (20 if version == 4 else 40)]
+        if version == 4:
+            # Without total length, IP ID and header checksum
+            ip_static = ip_header[0:2] + ip_header[6:10] + ip_header[12:20]
+        else:
+            # Without payload length
+            ip_static = ip_header[0:4] + ip_header[6:40]
+        return packet[:offset] + ip_static
+
+    @staticmethod
+    def _parse(packet: bytes) -> Optional[tuple[int, int, int, int]]:
+        """Offset, IP version, IP header length and TCP header length of a compressible packet"""
+        offset = ip_offset(packet)
+        if offset is None:
+            return None
+        version = packet[offset] >> 4
+        if version == 4:
+            if packet[offset] != 0x45 or packet[offset + 9] != PROTOCOL_TCP:
+                return None
+            if struct.unpack_from('!H', packet, offset + 6)[0] & 0x3FFF:
+                return None  # Fragment
+            if struct.unpack_from('!H', packet, offset + 2)[0] != len(packet) - offset:
+                return None
+            ip_header_length = 20
+        else:
+            if len(packet) < offset + 40 or packet[offset + 6] != PROTOCOL_TCP:
+                return None
+            if struct.unpack_from('!H', packet, offset + 4)[0] != len(packet) - offset - 40:
+                return None
+            ip_header_length = 40
+
+        tcp_offset = offset + ip_header_length
+        if len(packet) < tcp_offset + TCP_FIXED_HEADER_LENGTH:
+            return None
+        data_offset = packet[tcp_offset + 12]
+        tcp_header_length = (data_offset >> 4) * 4
+        # Reserved bits and the urgent pointer are not carried
+        if data_offset & 0x0F or tcp_header_length < TCP_FIXED_HEADER_LENGTH or len(packet) < tcp_offset + tcp_header_length:
+            return None
+        if struct.unpack_from('!H', packet, tcp_offset + 18)[0]:
+            return None
+        return offset, version, ip_header_length, tcp_header_length
+
+    def compress(self, packet: bytes) -> bytes:
+        """Record for packet: full with a new reference, compressed, or the packet as is"""
+        parsed = self._parse(packet)
+        if parsed is None:
+            return packet
+        offset, version, ip_header_length, tcp_header_length = parsed
+        tcp_offset = offset + ip_header_length
+        ports = packet[tcp_offset:tcp_offset + 4]
+        flow = (packet[offset + (12 if version == 4 else 8):offset + (20 if version == 4 else 40)], ports)
+
+        context = self._send_contexts.get(flow)
+        if context is not None:
+            record = self._compress_against(context, packet, offset, version, tcp_offset, tcp_header_length)
+            if record is not None:
+                context.packets += 1
+                self.bytes_saved += len(packet) - len(record)
+                return record
+
+        # New reference for the flow
+        cid = context.cid if context is not None else self._allocate_cid(flow)
+        self._generations[cid] = (self._generations[cid] + 1) % 256
+        context = _FlowContext(cid, self._generations[cid], packet, offset, version, ip_header_length)
+        self._send_contexts[flow] = context
+        return self.RECORD_HEADER.pack(self.FULL, cid, context.generation) + packet
+
+    def _allocate_cid(self, flow: tuple) -> int:
+        cid = self._next_cid
+        self._next_cid = (cid + 1) % self.MAX_CONTEXTS
+        old_flow = self._send_cids[cid]
+        if old_flow is not None:
+            self._send_contexts.pop(old_flow, None)
+        self._send_cids[cid] = flow
+        return cid
+
+    def _compress_against(self, context: _FlowContext, packet: bytes, offset: int, version: int,
+                          tcp_offset: int, tcp_header_length: int) -> Optional[bytes]:
+        if context.packets >= self.REFRESH_PACKETS or time.monotonic() - context.created_at > self.REFRESH_INTERVAL:
+            return None
+        if self.static_part(packet, offset, version) != context.static:
+            return None
+
+        _, _, seq, ack, _, flags, window = TCP_HEADER.unpack_from(packet, tcp_offset)
+        seq_delta = (seq - context.seq) % (1 << 32)
+        ack_delta = (ack - context.ack) % (1 << 32)
+        if seq_delta >= self.MAX_DELTA or ack_delta >= self.MAX_DELTA:
+            return None
+
+        mask = 0
+        fields = []
+        if seq_delta:
+            mask |= self.FIELD_SEQ
+            fields.append(_encode_varint(seq_delta))
+        if ack_delta:
+            mask |= self.FIELD_ACK
+            fields.append(_encode_varint(ack_delta))
+        if version == 4:
+            ip_id_delta = (struct.unpack_from('!H', packet, offset + 4)[0] - context.ip_id) % (1 << 16)
+            if ip_id_delta:
+                mask |= self.FIELD_IP_ID
+                fields.append(_encode_varint(ip_id_delta))
+        if window != context.window:
+            mask |= self.FIELD_WINDOW
+            fields.append(struct.pack('!H', window))
+        if flags != context.flags:
+            mask |= self.FIELD_FLAGS
+            fields.append(bytes([flags]))
+        if tcp_header_length > TCP_FIXED_HEADER_LENGTH:
+            mask |= self.FIELD_OPTIONS
+            fields.append(bytes([tcp_header_length - TCP_FIXED_HEADER_LENGTH]))
+            fields.append(packet[tcp_offset + TCP_FIXED_HEADER_LENGTH:tcp_offset + tcp_header_length])
+
+        return b''.join([
+            self.RECORD_HEADER.pack(self.COMPRESSED, context.cid, context.generation),
+            bytes([mask]),
+            *fields,
+            packet[tcp_offset + 16:tcp_offset + 18],  # TCP checksum
+            packet[tcp_offset + tcp_header_length:]
+        ])
+
+    @classmethod
+    def _is_newer(cls, generation: int, than: int) -> bool:
+        return 0 < (generation - than) % cls.GENERATION_MODULO < cls.GENERATION_MODULO // 2
+
+    def decompress(self, record: bytes) -> list[bytes]:
+        """Packets for record
+
+        Empty while the record waits for its full record or refers to an
+        unknown context, a full record also returns the records held for it.
+        """
+        if not record or record[0] not in (self.FULL, self.COMPRESSED):
+            return [record]
+        if len(record) < self.RECORD_HEADER.size:
+            return []
+        marker, cid, generation = self.RECORD_HEADER.unpack_from(record)
+
+        if marker == self.FULL:
+            packet = record[self.RECORD_HEADER.size:]
+            parsed = self._parse(packet)
+            if parsed is None:
+                return []
+            offset, version, ip_header_length, _ = parsed
+            context = _FlowContext(cid, generation, packet, offset, version, ip_header_length)
+            current = self._receive_contexts.get(cid)
+            if current is None or self._is_newer(generation, current.generation):
+                if current is not None:
+                    self._previous_contexts[cid] = current
+                self._receive_contexts[cid] = context
+                self._drop_held(cid, generation)
+            elif current.generation != generation:
+                # Late full record, overtaken by a refresh
+                previous = self._previous_contexts.get(cid)
+                if previous is None or self._is_newer(generation, previous.generation):
+                    self._previous_contexts[cid] = context
+            packets = [packet]
+            for held in self._pop_held(cid, generation):
+                packet = self._rebuild_record(held, context)
+                if packet is not None:
+                    packets.append(packet)
+            return packets
+
+        context = self._receive_contexts.get(cid)
+        if context is None or self._is_newer(generation, context.generation):
+            self._hold(cid, generation, record)
+            return []
+        if context.generation != generation:
+            context = self._previous_contexts.get(cid)
+            if context is None or context.generation != generation:
+                self.context_misses += 1
+                return []
+        packet = self._rebuild_record(record, context)
+        return [] if packet is None else [packet]
+
+    def _rebuild_record(self, record: bytes, context: _FlowContext) -> Optional[bytes]:
+        try:
+            return self._rebuild(context, record)
+        except (IndexError, struct.error):
+            return None
+
+    def _hold(self, cid: int, generation: int, record: bytes) -> None:
+        """Keep a record until its full record arrives, the oldest ones are dropped"""
+        self._held.setdefault((cid, generation), []).append(record)
+        self._held_count += 1
+        while self._held_count > self.MAX_HELD_RECORDS:
+            key = next(iter(self._held))
+            self.context_misses += len(self._held[key])
+            self._held_count -= len(self._held.pop(key))
+
+    def _pop_held(self, cid: int, generation: int) -> list[bytes]:
+        records = self._held.pop((cid, generation), [])
+        self._held_count -= len(records)
+        return records
+
+    def _drop_held(self, cid: int, generation: int) -> None:
+        """Records older than the previous reference will find no full record anymore"""
+        previous = (generation - 1) % self.GENERATION_MODULO
+        for key in [key for key in self._held if key[0] == cid and self._is_newer(previous, key[1])]:
+            self.context_misses += len(self._held[key])
+            self._held_count -= len(self._held.pop(key))
+
+    def _rebuild(self, context: _FlowContext, record: bytes) -> bytes:
+        position = self.RECORD_HEADER.size
+        mask = record[position]
+        position += 1
+
+        seq, ack, ip_id = context.seq, context.ack, context.ip_id
+        window, flags, options = context.window, context.flags, b''
+        if mask & self.FIELD_SEQ:
+            delta, position = _decode_varint(record, position)
+            seq = (seq + delta) % (1 << 32)
+        if mask & self.FIELD_ACK:
+            delta, position = _decode_varint(record, position)
+            ack = (ack + delta) % (1 << 32)
+        if mask & self.FIELD_IP_ID:
+            delta, position = _decode_varint(record, position)
+            ip_id = (ip_id + delta) % (1 << 16)
+        if mask & self.FIELD_WINDOW:
+            window = struct.unpack_from('!H', record, position)[0]
+            position += 2
+        if mask & self.FIELD_FLAGS:
+            flags = record[position]
+            position += 1
+        if mask & self.FIELD_OPTIONS:
+            length = record[position]
+            options = record[position + 1:position + 1 + length]
+            if len(options) != length:
+                raise IndexError("truncated TCP options")
+            position += 1 + length
+        checksum = record[position:position + 2]
+        if len(checksum) != 2:
+            raise IndexError("truncated TCP checksum")
+        payload = record[position + 2:]
+
+        header = context.header
+        offset = context.prefix_length
+        tcp_offset = offset + context.ip_header_length
+        tcp_length = TCP_FIXED_HEADER_LENGTH + len(options) + len(payload)
+
+        ip_header = bytearray(header[offset:tcp_offset])
+        if context.version == 4:
+            struct.pack_into('!HH', ip_header, 2, context.ip_header_length + tcp_length, ip_id)
+            struct.pack_into('!H', ip_header, 10, 0)
+            struct.pack_into('!H', ip_header, 10, _checksum(bytes(ip_header)))
+        else:
+            struct.pack_into('!H', ip_header, 4, tcp_length)
+
+        tcp_header = header[tcp_offset:tcp_offset + 4] + struct.pack(
+            '!IIBBH', seq, ack, (5 + len(options) // 4) << 4, flags, window
+        ) + checksum + b'\x00\x00'
+        return header[:offset] + bytes(ip_header) + tcp_header + options + payload
@@ -0,0 +1,23 @@
+from .default_message_encoder import DefaultMessageEncoder
+from .payload_compressor import PayloadCompressor
+
+
+class MessageEncoderFactory:
+    """Factory for creating message encoders"""
+    
+    @staticmethod
+    def create_encoder(encoder_type: str = 'base64', compression: str = 'none',
+                       compression_level: int = 6) -> DefaultMessageEncoder:
+        """Creates encoder by its name from configuration"""
+        compressor = PayloadCompressor(compression, compression_level)
+        
+        if encoder_type == 'base64':
+            return DefaultMessageEncoder(compressor)
+        elif encoder_type == 'base85':
+            from .base85_message_encoder import Base85MessageEncoder
+            return Base85MessageEncoder(compressor)
+        elif encoder_type == 'base32768':
+            from .base32768_message_encoder import Base32768MessageEncoder
+            return Base32768MessageEncoder(compressor)
+        
+        raise ValueError(f"Unsupported message encoder type: {encoder_type}")
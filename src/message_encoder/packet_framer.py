@@ -0,0 +1,77 @@
+import struct
+from typing import Iterable, Optional, Tuple
+
+
+class PacketFramer:
+    """Length-prefixed framing of several packets into one message payload
+
+    Payload layout: [1 byte lane][4 bytes big-endian frame sequence number]
+    followed by records, each record is [2 bytes big-endian packet length]
+    [packet bytes]. Every lane has its own sequence space, so frames of
+    different priority classes do not wait for each other on the receiver.
+
+    A frame sampled for tracing has TRACE_FLAG set in the lane byte and a
+    4 byte trace ID after the sequence number.
+    """
+
+    FRAME_HEADER = struct.Struct('!BI')
+    TRACE_HEADER = struct.Struct('!I')
+    TRACE_FLAG = 0x80
+    RECORD_HEADER = struct.Struct('!H')
+    MAX_PACKET_SIZE = 0xFFFF
+
+    @classmethod
+    def record_size(cls, packet: bytes) -> int:
+        """Size of the packet once framed as a record"""
+        return cls.RECORD_HEADER.size + len(packet)
+
+    @classmethod
+    def header_size(cls, traced: bool = False) -> int:
+        """Frame header size, with the trace ID of sampled frames"""
+        return cls.FRAME_HEADER.size + (cls.TRACE_HEADER.size if traced else 0)
+
+    @classmethod
+    def pack(cls, sequence: int, packets: Iterable[bytes], lane: int = 0,
+             trace_id: Optional[int] = None) -> bytes:
+        """Pack packets into one payload"""
+        if trace_id is None:
+            parts = [cls.FRAME_HEADER.pack(lane, sequence)]
+        else:
+            parts = [cls.FRAME_HEADER.pack(lane | cls.TRACE_FLAG, sequence), cls.TRACE_HEADER.pack(trace_id)]
+        for packet in packets:
+            if len(packet) > cls.MAX_PACKET_SIZE:
+                raise ValueError(f"Packet too large for framing: {len(packet)} bytes")
+            parts.append(cls.RECORD_HEADER.pack(len(packet)))
+            parts.append(packet)
+        return b''.join(parts)
+
+    @classmethod
+    def unpack(cls, payload: bytes) -> Tuple[int, int, Optional[int], list[bytes]]:
+        """Split payload back into lane, sequence number, trace ID (None if not traced) and packets"""
+        if len(payload) < cls.FRAME_HEADER.size:
+            raise ValueError("Truncated frame header in payload")
+        lane, sequence = cls.FRAME_HEADER.unpack_from(payload)
+        offset = cls.FRAME_HEADER.size
+        trace_id = None
+        if lane & cls.TRACE_FLAG:
+            if len(payload) < offset + cls.TRACE_HEADER.size:
+                raise ValueError("Truncated trace ID in payload")
+            (trace_id,) = cls.TRACE_HEADER.unpack_from(payload, offset)
+            lane &= ~cls.TRACE_FLAG
+            offset += cls.TRACE_HEADER.size
+
+        packets = []
+        view = memoryview(payload)
+        header_size = cls.RECORD_HEADER.size
+
+        while offset < len(view):
+            if offset + header_size > len(view):
+                raise ValueError("Truncated record header in payload")
+            (length,) = cls.RECORD_HEADER.unpack_from(view, offset)
+            offset += header_size
+            if offset + length > len(view):
+                raise ValueError("Truncated record in payload")
+            packets.append(bytes(view[offset:offset + length]))
+            offset += length
+
+        return lane, sequence, trace_id, packets
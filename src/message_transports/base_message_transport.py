@@ -1,15 +1,72 @@
 from abc import ABC, abstractmethod
-from typing import Callable, Optional
-import asyncio
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional, Union
+import inspect
+from src.message_encoder.codec_pipeline import CodecPipeline
+from src.message_encoder.default_message_encoder import DefaultMessageEncoder
+from src.utils.tracer import PacketTracer
+
+if TYPE_CHECKING:
+    from src.core.send_scheduler import SendScheduler
+
+
+class RateLimitError(Exception):
+    """Messenger rejected a send because of its rate limits"""
+    
+    def __init__(self, retry_after: float, message: str = "Too many requests"):
+        super().__init__(f"{message}, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+DataHandler = Callable[[bytes], Union[None, Awaitable[None]]]
+ControlHandler = Callable[[str], Union[None, Awaitable[None]]]
 
 
 class MessageTransport(ABC):
-    """Abstract base class for message transport"""
+    """Abstract base class for message transport
+
+    Handlers are called on the event loop thread right where the message
+    was received. They may be plain functions or coroutine functions and
+    must not block.
+    """
+    
+    DEFAULT_MAX_MESSAGE_LENGTH = 4096
+    DEFAULT_FLUSH_DEADLINE = 0.02
+    DEFAULT_SEND_WINDOW = 4
+    DEFAULT_BULK_MAX_SIZE = 4 * 1024 * 1024
+    DEFAULT_RATE_LIMIT = 10.0
+    
+    # Throttling reported by the messenger (FloodWait, too many requests)
+    throttle_events: int = 0
+    throttle_seconds: float = 0.0
+    # Set by TunnelManager when tracing is on: API calls and message arrival
+    # are marked for the traced frame (see PacketTracer)
+    tracer: Optional[PacketTracer] = None
+    # Set by TunnelManager: protocol layers queue their own messages (ACKs,
+    # retransmissions, parity) in it, so they obey the messenger rate limit
+    scheduler: Optional['SendScheduler'] = None
+    # Transports overriding send_bulk set it, bulk_threshold needs it
+    supports_bulk: bool = False
     
     def __init__(self):
-        self._data_handler: Optional[Callable[[bytes], None]] = None
-        self._control_handler: Optional[Callable[[str], None]] = None
+        self._data_handler: Optional[DataHandler] = None
+        self._control_handler: Optional[ControlHandler] = None
         self.running = False
+        self.encoder: DefaultMessageEncoder = DefaultMessageEncoder()
+        # Runs the encoder jobs, transports replacing the encoder create their own
+        self.codec: CodecPipeline = CodecPipeline(self.encoder)
+        # Limits used by TunnelManager to coalesce packets into messages
+        self.max_message_length: int = self.DEFAULT_MAX_MESSAGE_LENGTH
+        self.flush_deadline: float = self.DEFAULT_FLUSH_DEADLINE
+        # Number of sends TunnelManager keeps in flight at once
+        self.send_window: int = self.DEFAULT_SEND_WINDOW
+        # Initial messages per second, the send scheduler adapts it to throttling
+        self.rate_limit: float = self.DEFAULT_RATE_LIMIT
+        # Outbound queue depth (packets) switching to send_bulk, 0 - no bulk channel
+        self.bulk_threshold: int = 0
+        self.bulk_max_size: int = self.DEFAULT_BULK_MAX_SIZE
+        # Rate controller driven by RTT and delivery rate, peers exchange ack reports
+        self.rate_control: bool = False
+        self.rate_report_interval: float = 1.0
     
     @abstractmethod
     async def connect(self) -> None:
@@ -18,9 +75,21 @@ class MessageTransport(ABC):
     
     @abstractmethod
     async def send_data(self, data: bytes) -> None:
-        """Send data (automatic encoding)"""
+        """Send data (automatic encoding)
+
+        Raises:
+          RateLimitError: If the messenger throttled the send
+        """
         pass
     
+    async def send_bulk(self, data: bytes) -> None:
+        """Send large payload over a bulk channel (binary document, file, etc.)
+
+        Raises:
+          ConnectionError: If the transport has no bulk channel (supports_bulk)
+        """
+        raise ConnectionError(f"{type(self).__name__} has no bulk channel")
+    
     @abstractmethod
     async def send_control(self, message: str) -> None:
         """Send control message"""
@@ -31,24 +100,33 @@ class MessageTransport(ABC):
         """Disconnect from service"""
         pass
     
-    def set_data_handler(self, handler: Callable[[bytes], None]) -> None:
+    def record_throttle(self, seconds: float) -> None:
+        """Count messenger throttling and the wait it asked for"""
+        self.throttle_events += 1
+        self.throttle_seconds += seconds
+    
+    def get_max_payload_size(self) -> int:
+        """Maximum number of data bytes that fit into one message"""
+        return self.encoder.max_payload_size(self.max_message_length)
+    
+    def set_data_handler(self, handler: DataHandler) -> None:
         """Setup handler for data"""
         self._data_handler = handler
     
-    def set_control_handler(self, handler: Callable[[str], None]) -> None:
+    def set_control_handler(self, handler: ControlHandler) -> None:
         """Setup handler for control messages"""
         self._control_handler = handler
     
     async def _handle_incoming_data(self, data: bytes) -> None:
         """Internal method for processing data"""
         if self._data_handler:
-            await asyncio.get_event_loop().run_in_executor(
-                None, self._data_handler, data
-            )
+            result = self._data_handler(data)
+            if inspect.isawaitable(result):
+                await result
     
     async def _handle_incoming_control(self, message: str) -> None:
         """Internal method for processing control messages"""
         if self._control_handler:
-            await asyncio.get_event_loop().run_in_executor(
-                None, self._control_handler, message
-            )
+            result = self._control_handler(message)
+            if inspect.isawaitable(result):
+                await result
@@ -0,0 +1,303 @@
+import asyncio
+import collections
+import functools
+import math
+import struct
+import time
+from typing import Optional
+from src.core.send_scheduler import SendScheduler
+from src.message_encoder.erasure_code import ErasureCode
+from .base_message_transport import MessageTransport, RateLimitError
+from .layered_message_transport import LayeredMessageTransport
+
+
+class _ReceiveGroup:
+    """Data and parity of one FEC group seen by the receiver"""
+
+    __slots__ = ('blocks', 'parity', 'count', 'arrived', 'highest_index', 'created_at', 'counted', 'complete')
+
+    def __init__(self):
+        self.blocks: dict[int, bytes] = {}
+        self.parity: dict[int, bytes] = {}
+        # Number of data frames, known once a parity frame arrived
+        self.count: Optional[int] = None
+        # Data frames that arrived, rebuilt ones included if they arrived later
+        self.arrived: set[int] = set()
+        self.highest_index = -1
+        self.created_at = time.monotonic()
+        self.counted = False
+        self.complete = False
+
+
+class FecMessageTransport(LayeredMessageTransport):
+    """Forward error correction layer over another message transport
+
+    Data frames are sent as they come and grouped by group_size, after each
+    group parity frames of the erasure code follow, so the receiver rebuilds
+    up to parity lost frames of a group without a retransmission. A group
+    that does not fill up within group_timeout seconds is closed early.
+    Header: [1 byte type][4 bytes sender epoch][4 bytes group][1 byte index]
+    [1 byte data frames][1 byte parity frames], the counts are only set in
+    parity frames. The epoch is the sender start time, a restarted peer
+    numbers its groups from 0 again. Parity covers each frame with a 4 byte
+    length prefix, padded to the longest frame of the group, and is queued
+    in the send scheduler behind data. Bulk frames are sent without FEC.
+
+    The receiver delivers data frames on arrival and rebuilt frames as soon
+    as the group has enough frames, so frames may reach the upper layer out
+    of order but never twice. It reports the data frame loss rate with a
+    control message, in adaptive mode the sender sets parity to cover twice
+    the measured loss, up to max_parity.
+    """
+
+    HEADER = struct.Struct('!BIIBBB')
+    LENGTH = struct.Struct('!I')
+    TYPE_DATA = 1
+    TYPE_PARITY = 2
+    TYPE_PLAIN = 3
+    GROUP_MODULO = 1 << 32
+    EPOCH_MODULO = 1 << 32
+    # Received groups kept for late frames, older ones are dropped
+    GROUP_HISTORY = 64
+    REPORT_INTERVAL = 5.0
+    LOSS_REPORT = 'fec-loss'
+
+    def __init__(self, transport: MessageTransport, group_size: int = 8, parity: int = 1,
+                 adaptive: bool = False, max_parity: int = 4, group_timeout: float = 0.1):
+        super().__init__(transport, self.HEADER.size + self.LENGTH.size)
+        if not 1 <= group_size <= ErasureCode.MAX_DATA:
+            raise ValueError(f"FEC group size must be between 1 and {ErasureCode.MAX_DATA}, received: {group_size}")
+        self.group_size = group_size
+        self.parity = parity
+        self.adaptive = adaptive
+        self.max_parity = min(max_parity, ErasureCode.MAX_PARITY)
+        self.group_timeout = group_timeout
+
+        # Sender state
+        self._epoch = int(time.time() * 1000) % self.EPOCH_MODULO or 1
+        self._group = 0
+        self._frames: list[bytes] = []
+        self._group_timer: Optional[asyncio.TimerHandle] = None
+        self._parity_tasks: set[asyncio.Task] = set()
+
+        # Receiver state
+        self._peer_epoch = 0
+        self._groups: collections.OrderedDict[int, _ReceiveGroup] = collections.OrderedDict()
+        self._newest_group: Optional[int] = None
+        self._expected_frames = 0
+        self._received_frames = 0
+        self._report_task: Optional[asyncio.Task] = None
+
+        self.parity_sent = 0
+        self.parity_dropped = 0
+        self.recovered_frames = 0
+        self.loss_rate = 0.0
+
+    async def connect(self) -> None:
+        """Connect wrapped transport and start loss reports"""
+        await super().connect()
+        self._report_task = asyncio.create_task(self._report_loop())
+
+    async def send_data(self, data: bytes) -> None:
+        """Send data frame, parity follows once its group is complete"""
+        group, index = self._group, len(self._frames)
+        self._frames.append(data)
+        if len(self._frames) >= self.group_size:
+            self._close_group()
+        elif index == 0:
+            self._group_timer = asyncio.get_running_loop().call_later(self.group_timeout, self._close_group)
+        await self.transport.send_data(self.HEADER.pack(self.TYPE_DATA, self._epoch, group, index, 0, 0) + data)
+
+    async def send_bulk(self, data: bytes) -> None:
+        """Send data frame over the bulk channel, without FEC"""
+        await self.transport.send_bulk(self.HEADER.pack(self.TYPE_PLAIN, self._epoch, 0, 0, 0, 0) + data)
+
+    async def disconnect(self) -> None:
+        """Stop FEC tasks and disconnect wrapped transport"""
+        self.running = False
+        if self._group_timer is not None:
+            self._group_timer.cancel()
+            self._group_timer = None
+        for task in [self._report_task, *self._parity_tasks]:
+            if task is not None:
+                task.cancel()
+        self._report_task = None
+        await super().disconnect()
+
+    def _close_group(self) -> None:
+        """Start the next group, send parity of the current one"""
+        if self._group_timer is not None:
+            self._group_timer.cancel()
+            self._group_timer = None
+        frames, group = self._frames, self._group
+        self._frames = []
+        self._group = (group + 1) % self.GROUP_MODULO
+        if frames and self.parity > 0:
+            task = asyncio.create_task(self._send_parity(group, frames, self.parity))
+            self._parity_tasks.add(task)
+            task.add_done_callback(self._parity_tasks.discard)
+
+    @classmethod
+    def _blocks(cls, frames: dict[int, bytes], length: int) -> dict[int, bytes]:
+        """Length-prefixed frames padded to length"""
+        return {
+            index: (cls.LENGTH.pack(len(frame)) + frame).ljust(length, b'\x00')
+            for index, frame in frames.items()
+        }
+
+    async def _send_parity(self, group: int, frames: list[bytes], parity_count: int) -> None:
+        length = self.LENGTH.size + max(len(frame) for frame in frames)
+        blocks = self._blocks(dict(enumerate(frames)), length)
+        # Pure Python Reed-Solomon, worth a codec process worker for large groups
+        parity = await self.codec.run(
+            ErasureCode.encode, [blocks[index] for index in range(len(frames))], parity_count,
+            size=length * len(frames)
+        )
+        for index, block in enumerate(parity):
+            header = self.HEADER.pack(self.TYPE_PARITY, self._epoch, group, index, len(frames), parity_count)
+            try:
+                # Parity is best effort, data has the messenger rate first
+                await self._submit(functools.partial(self._send_parity_block, header + block),
+                                   SendScheduler.PRIORITY_BULK)
+            except RateLimitError:
+                self.parity_dropped += parity_count - index
+                return
+            except Exception as e:
+                print(f"Error sending FEC parity: {e}")
+                return
+
+    async def _send_parity_block(self, message: bytes) -> None:
+        await self.transport.send_data(message)
+        self.parity_sent += 1
+
+    async def _handle_message(self, data: bytes) -> None:
+        """Deliver data frames and frames rebuilt from parity"""
+        if len(data) < self.HEADER.size:
+            print("Dropping message without FEC header")
+            return
+        kind, epoch, group_id, index, count, parity_count = self.HEADER.unpack_from(data)
+        payload = data[self.HEADER.size:]
+        if kind == self.TYPE_PLAIN:
+            await self._handle_incoming_data(payload)
+            return
+
+        if epoch != self._peer_epoch:
+            if self._peer_epoch and not 0 < (epoch - self._peer_epoch) % self.EPOCH_MODULO < self.EPOCH_MODULO // 2:
+                return  # Delayed frame of a previous peer instance
+            # Peer (re)started, its groups start at 0
+            self._peer_epoch = epoch
+            for group in self._groups.values():
+                self._count_loss(group)
+            self._groups.clear()
+            self._newest_group = None
+
+        group = self._receive_group(group_id)
+        if group is None:
+            return
+        if kind == self.TYPE_DATA:
+            if index in group.arrived:
+                return  # Duplicate
+            group.arrived.add(index)
+            group.highest_index = max(group.highest_index, index)
+            if index in group.blocks:
+                return  # Already rebuilt from parity
+            group.blocks[index] = payload
+            await self._handle_incoming_data(payload)
+        elif kind == self.TYPE_PARITY:
+            if group.complete:
+                return
+            group.parity[index] = payload
+            group.count = count
+        else:
+            return
+
+        for frame in self._recover(group):
+            await self._handle_incoming_data(frame)
+
+    def _receive_group(self, group_id: int) -> Optional[_ReceiveGroup]:
+        """State of a group, None for groups already dropped from the history"""
+        group = self._groups.get(group_id)
+        if group is not None:
+            return group
+
+        if self._newest_group is not None:
+            behind = (self._newest_group - group_id) % self.GROUP_MODULO
+            if behind < self.GROUP_MODULO // 2:
+                return None if behind > self.GROUP_HISTORY else self._add_group(group_id)
+        self._newest_group = group_id
+        return self._add_group(group_id)
+
+    def _add_group(self, group_id: int) -> _ReceiveGroup:
+        group = self._groups[group_id] = _ReceiveGroup()
+        while len(self._groups) > self.GROUP_HISTORY:
+            self._count_loss(self._groups.popitem(last=False)[1])
+        return group
+
+    def _recover(self, group: _ReceiveGroup) -> list[bytes]:
+        """Frames rebuilt once the group has as many frames as data frames"""
+        if group.count is None or group.complete:
+            return []
+        if len(group.blocks) >= group.count:
+            group.complete = True
+            group.parity.clear()
+            return []
+        if len(group.blocks) + len(group.parity) < group.count:
+            return []
+
+        length = len(next(iter(group.parity.values())))
+        blocks = self._blocks(group.blocks, length)
+        recovered = ErasureCode.decode(group.count, blocks, group.parity)
+        group.complete = True
+        group.parity.clear()
+        if recovered is None:
+            return []
+
+        frames = []
+        for index, block in sorted(recovered.items()):
+            (frame_length,) = self.LENGTH.unpack_from(block)
+            if frame_length > length - self.LENGTH.size:
+                print("Dropping corrupt FEC group")
+                return frames
+            frame = block[self.LENGTH.size:self.LENGTH.size + frame_length]
+            group.blocks[index] = frame
+            frames.append(frame)
+        self.recovered_frames += len(frames)
+        return frames
+
+    def _count_loss(self, group: _ReceiveGroup) -> None:
+        """Add a group that will get no more frames to the loss statistics"""
+        if group.counted:
+            return
+        group.counted = True
+        self._expected_frames += group.count if group.count is not None else group.highest_index + 1
+        self._received_frames += len(group.arrived)
+
+    async def _report_loop(self) -> None:
+        """Send the measured loss rate to the peer"""
+        while self.running:
+            await asyncio.sleep(self.REPORT_INTERVAL)
+            settled = time.monotonic() - self.REPORT_INTERVAL / 2
+            for group in self._groups.values():
+                if group.created_at < settled:
+                    self._count_loss(group)
+            if not self._expected_frames:
+                continue
+
+            loss = max(0.0, 1 - self._received_frames / self._expected_frames)
+            self._expected_frames = self._received_frames = 0
+            try:
+                await self.transport.send_control(f"{self.LOSS_REPORT} {loss:.4f}")
+            except Exception as e:
+                print(f"Error sending FEC loss report: {e}")
+
+    async def _handle_control(self, message: str) -> None:
+        """Apply peer loss reports, pass other control messages on"""
+        if not message.startswith(self.LOSS_REPORT + ' '):
+            await self._handle_incoming_control(message)
+            return
+        try:
+            self.loss_rate = float(message[len(self.LOSS_REPORT) + 1:])
+        except ValueError:
+            return
+        if self.adaptive:
+            self.parity = min(self.max_parity, math.ceil(2 * self.group_size * self.loss_rate))
@@ -0,0 +1,101 @@
+from typing import Optional
+from src.core.send_scheduler import SendJob, SendScheduler
+from src.utils.tracer import PacketTracer
+from .base_message_transport import MessageTransport
+
+
+class LayeredMessageTransport(MessageTransport):
+    """Base class for protocol layers stacked on another message transport
+
+    The layer takes over the limits of the wrapped transport, minus the
+    header_size bytes it adds to every message, and receives its data and
+    control messages. Subclasses pass received data on with
+    _handle_incoming_data and control messages with _handle_incoming_control,
+    messages of their own go through _submit.
+    """
+
+    def __init__(self, transport: MessageTransport, header_size: int):
+        super().__init__()
+        self.transport = transport
+        self._scheduler: Optional[SendScheduler] = None
+        self.header_size = header_size
+
+        # Limits of the wrapped transport
+        self.encoder = transport.encoder
+        self.codec = transport.codec
+        self.max_message_length = transport.max_message_length
+        self.flush_deadline = transport.flush_deadline
+        self.send_window = transport.send_window
+        self.rate_limit = transport.rate_limit
+        self.bulk_threshold = transport.bulk_threshold
+        self.supports_bulk = transport.supports_bulk
+        self.bulk_max_size = transport.bulk_max_size - header_size
+
+        transport.set_data_handler(self._handle_message)
+        transport.set_control_handler(self._handle_control)
+
+    async def connect(self) -> None:
+        """Connect wrapped transport"""
+        await self.transport.connect()
+        self.running = True
+
+    async def send_control(self, message: str) -> None:
+        """Send control message through the wrapped transport"""
+        await self.transport.send_control(message)
+
+    async def disconnect(self) -> None:
+        """Disconnect wrapped transport"""
+        self.running = False
+        await self.transport.disconnect()
+
+    @property
+    def throttle_events(self) -> int:
+        """Throttling reported to the wrapped transport"""
+        return self.transport.throttle_events
+
+    @property
+    def throttle_seconds(self) -> float:
+        """Wait asked for by throttling of the wrapped transport"""
+        return self.transport.throttle_seconds
+
+    @property
+    def tracer(self) -> Optional[PacketTracer]:
+        """Tracer of the wrapped transport, which makes the API calls"""
+        return self.transport.tracer
+
+    @tracer.setter
+    def tracer(self, tracer: Optional[PacketTracer]) -> None:
+        self.transport.tracer = tracer
+
+    @property
+    def scheduler(self) -> Optional[SendScheduler]:
+        """Send scheduler of the tunnel, shared with the wrapped layers"""
+        return self._scheduler
+
+    @scheduler.setter
+    def scheduler(self, scheduler: Optional[SendScheduler]) -> None:
+        self._scheduler = scheduler
+        self.transport.scheduler = scheduler
+
+    async def _submit(self, job: SendJob, priority: int = SendScheduler.PRIORITY_CONTROL) -> None:
+        """Queue a message of the layer in the send scheduler, without one send it right away
+
+        Queueing never waits, a throttled job is retried by the scheduler.
+        Sent directly, RateLimitError reaches the caller.
+        """
+        if self._scheduler is None:
+            await job()
+        else:
+            self._scheduler.submit_nowait(job, priority)
+
+    def get_max_payload_size(self) -> int:
+        """Maximum number of data bytes that fit into one message"""
+        return self.transport.get_max_payload_size() - self.header_size
+
+    async def _handle_message(self, data: bytes) -> None:
+        """Data message of the wrapped transport"""
+        await self._handle_incoming_data(data)
+
+    async def _handle_control(self, message: str) -> None:
+        """Control message of the wrapped transport"""
+        await self._handle_incoming_control(message)
@@ -0,0 +1,147 @@
+import asyncio
+import collections
+import random
+import time
+from typing import Any, Dict, Optional, Union
+from src.message_encoder.codec_pipeline import CodecPipeline
+from ..base_message_transport import MessageTransport, RateLimitError
+
+
+class LoopbackLink:
+    """In-memory messenger link between two LoopbackMessageTransport ends
+
+    Every message is delivered to the other end after latency plus a
+    uniformly random jitter of up to jitter seconds (so messages may
+    overtake each other) unless it is lost with probability loss. Like a
+    messenger, the link rejects text messages longer than
+    max_message_length characters and throttles an end that sends more than
+    rate_limit messages within one second, 0 disables either limit.
+    """
+
+    THROTTLE_DELAY = 1.0
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, loss: float = 0.0,
+                 max_message_length: int = 4096, rate_limit: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.max_message_length = max_message_length
+        self.rate_limit = rate_limit
+        self._random = random.Random(seed)
+        self.ends: list['LoopbackMessageTransport'] = []
+        self.delivered = 0
+        self.lost = 0
+        self.throttled = 0
+
+    def attach(self, end: 'LoopbackMessageTransport') -> None:
+        """Connect one of the two ends"""
+        if len(self.ends) >= 2:
+            raise ValueError("Loopback link already has two ends")
+        self.ends.append(end)
+
+    def peer_of(self, end: 'LoopbackMessageTransport') -> 'LoopbackMessageTransport':
+        return self.ends[1] if end is self.ends[0] else self.ends[0]
+
+    def check_rate(self, sent: collections.deque) -> None:
+        """Throttle an end above rate_limit messages per second
+
+        Raises:
+          RateLimitError: If the end sent too many messages within the last second
+        """
+        if not self.rate_limit:
+            return
+        now = time.monotonic()
+        while sent and now - sent[0] >= 1.0:
+            sent.popleft()
+        if len(sent) >= self.rate_limit:
+            self.throttled += 1
+            raise RateLimitError(self.THROTTLE_DELAY)
+        sent.append(now)
+
+    def transmit(self, sender: 'LoopbackMessageTransport', message: Union[str, bytes]) -> None:
+        """Deliver message to the other end of the link after the link delay"""
+        if self.loss and self._random.random() < self.loss:
+            self.lost += 1
+            return
+        delay = self.latency + (self._random.uniform(0.0, self.jitter) if self.jitter else 0.0)
+        asyncio.get_running_loop().call_later(delay, self.peer_of(sender).deliver, message)
+
+
+class LoopbackMessageTransport(MessageTransport):
+    """One end of an in-memory LoopbackLink, for tests and benchmarks
+
+    Data is encoded to text with the configured encoder, as for a real
+    messenger, so encoder cost and density count. Control messages carry
+    the '--' prefix, bulk frames travel as binary documents.
+    """
+
+    supports_bulk = True
+
+    def __init__(self, link: LoopbackLink, config: Dict[str, Any]):
+        super().__init__()
+        self.link = link
+        link.attach(self)
+        self.encoder = config.get('encoder', self.encoder)
+        self.codec = config.get('codec') or CodecPipeline(self.encoder)
+        self.max_message_length = config.get('max_message_length', link.max_message_length)
+        self.flush_deadline = config.get('flush_deadline', self.DEFAULT_FLUSH_DEADLINE)
+        self.send_window = config.get('send_window', self.DEFAULT_SEND_WINDOW)
+        self.rate_limit = config.get('rate_limit', link.rate_limit or self.DEFAULT_RATE_LIMIT)
+        self.bulk_threshold = config.get('bulk_threshold', 0)
+        self.bulk_max_size = config.get('bulk_max_size', self.DEFAULT_BULK_MAX_SIZE)
+        self._sent: collections.deque[float] = collections.deque()
+        self._tasks: set[asyncio.Task] = set()
+
+    async def connect(self) -> None:
+        """Nothing to connect, the link is in memory"""
+        self.running = True
+
+    async def send_data(self, data: bytes) -> None:
+        """Send data as an encoded text message"""
+        await self._send(await self.codec.encode_message(data))
+
+    async def send_bulk(self, data: bytes) -> None:
+        """Send data as a binary document"""
+        await self._send(await self.codec.encode_document(data))
+
+    async def send_control(self, message: str) -> None:
+        """Send control message"""
+        await self._send(f"--{message}")
+
+    async def _send(self, message: Union[str, bytes]) -> None:
+        if not self.running:
+            return
+        if isinstance(message, str) and self.link.max_message_length and \
+                len(message) > self.link.max_message_length:
+            raise ConnectionError(f"Message of {len(message)} characters exceeds the link limit")
+        self.link.check_rate(self._sent)
+        self.link.transmit(self, message)
+
+    def deliver(self, message: Union[str, bytes]) -> None:
+        """Message arrived from the other end"""
+        if not self.running:
+            return
+        self.link.delivered += 1
+        task = asyncio.create_task(self._receive(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _receive(self, message: Union[str, bytes]) -> None:
+        if self.tracer is not None:
+            self.tracer.begin_receive()
+        try:
+            if isinstance(message, bytes):
+                await self._handle_incoming_data(await self.codec.decode_document(message, self.bulk_max_size))
+            elif self.encoder.is_control_message(message):
+                await self._handle_incoming_control(message[2:])
+            else:
+                await self._handle_incoming_data(await self.codec.decode_message(message))
+        except Exception as e:
+            print(f"Error decoding loopback message: {e}")
+
+    async def disconnect(self) -> None:
+        """Stop receiving"""
+        self.running = False
+        for task in list(self._tasks):
+            task.cancel()
+        self.codec.close()
@@ -1,4 +1,5 @@
 from src.config.base_config import BaseConfig
+from src.message_encoder.codec_pipeline import CodecPipeline
 from .base_message_transport import MessageTransport
 
 
@@ -9,7 +10,51 @@ class MessageTransportFactory():
         self.base_config = base_config
 
     def get_message_transport(self) -> MessageTransport:
-        """Get message transport"""
+        """Get message transport, wrapped into the FEC and reliable delivery layers if enabled"""
+        transport = self._create_transport()
+        transport.codec = self._create_codec(transport)
+        transport = self._wrap_transport(transport)
+        transport.rate_control = self.base_config.get_config_value_safe('message_transport.rate_control', False)
+        transport.rate_report_interval = self.base_config.get_config_value_safe(
+            'message_transport.rate_report_interval', 1.0
+        )
+        return transport
+
+    def _create_codec(self, transport: MessageTransport) -> CodecPipeline:
+        """Codec pipeline of the messenger transport, inline or with a worker pool"""
+        return CodecPipeline(
+            transport.encoder,
+            executor=self.base_config.get_config_value_safe('message_transport.codec_executor', 'inline'),
+            workers=self.base_config.get_config_value_safe('message_transport.codec_workers', 0),
+            offload_threshold=self.base_config.get_config_value_safe(
+                'message_transport.codec_offload_threshold', CodecPipeline.DEFAULT_OFFLOAD_THRESHOLD
+            )
+        )
+
+    def _wrap_transport(self, transport: MessageTransport) -> MessageTransport:
+        """Stack the enabled protocol layers on the messenger transport"""
+        if self.base_config.get_config_value_safe('message_transport.fec', False):
+            from .fec_message_transport import FecMessageTransport
+            transport = FecMessageTransport(
+                transport,
+                group_size=self.base_config.get_config_value_safe('message_transport.fec_group_size', 8),
+                parity=self.base_config.get_config_value_safe('message_transport.fec_parity', 1),
+                adaptive=self.base_config.get_config_value_safe('message_transport.fec_adaptive', False),
+                max_parity=self.base_config.get_config_value_safe('message_transport.fec_max_parity', 4),
+                group_timeout=self.base_config.get_config_value_safe('message_transport.fec_group_timeout', 0.1)
+            )
+        
+        if self.base_config.get_config_value_safe('message_transport.reliable', False):
+            from .reliable_message_transport import ReliableMessageTransport
+            return ReliableMessageTransport(
+                transport,
+                window=self.base_config.get_config_value_safe('message_transport.reliable_window', 256),
+                ack_delay=self.base_config.get_config_value_safe('message_transport.reliable_ack_delay', 0.2)
+            )
+        return transport
+
+    def _create_transport(self) -> MessageTransport:
+        """Create message transport of the configured type"""
         transport_type = self.base_config.get_config_value('message_transport.type')
         
         if transport_type == 'telegram':
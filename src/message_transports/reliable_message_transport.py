@@ -0,0 +1,395 @@
+import asyncio
+import functools
+import struct
+import time
+from typing import Optional
+from .base_message_transport import MessageTransport, RateLimitError
+from .layered_message_transport import LayeredMessageTransport
+
+
+class _SentFrame:
+    """Frame waiting for acknowledgement"""
+
+    __slots__ = ('payload', 'bulk', 'sent_at', 'transmissions', 'lost', 'queued')
+
+    def __init__(self, payload: bytes, bulk: bool):
+        self.payload = payload
+        self.bulk = bulk
+        self.sent_at: Optional[float] = None
+        self.transmissions = 0
+        # Reported missing by selective ACKs, retransmitted without waiting for the timeout
+        self.lost = False
+        # Retransmission waits in the send scheduler
+        self.queued = False
+
+
+class ReliableMessageTransport(LayeredMessageTransport):
+    """ARQ layer over another message transport
+
+    Every data message gets a header: [1 byte type][1 byte transmission]
+    [4 bytes sender epoch][4 bytes sequence][4 bytes acknowledged epoch]
+    [4 bytes cumulative ACK][4 bytes selective ACK bitmap][4 bytes last
+    received sequence][1 byte its transmission]. ACKs ride on data going
+    the other way, a separate ACK message is sent only when there was no
+    data for ack_delay seconds. RTT is sampled on the last received frame
+    only, so frames held behind a gap do not inflate it, and the echoed
+    transmission number makes retransmissions usable for RTT samples.
+
+    A frame is retransmitted as soon as a frame sent more than a reorder
+    window after it is acknowledged (RACK), or after an RTT based timeout
+    (RFC 6298). The reorder window starts at a quarter of the RTT and grows
+    when the echo shows an earlier transmission arrived. Both only apply to
+    frames the selective ACK bitmap covers, frames above it have most likely
+    arrived and are acknowledged once the gap is filled. ACKs and
+    retransmissions are queued in the send scheduler at control priority.
+
+    The receiver delivers frames strictly in order and exactly once, out of
+    order frames are held in a buffer of window frames. The epoch is the
+    sender start time, a restarted peer starts a new sequence space. When
+    the peer restarts (its "ready" or a frame of a newer epoch arrives) the
+    sender starts a new epoch as well, so the fresh peer receives it from
+    sequence 0, frames in flight to the old peer are given up.
+    """
+
+    HEADER = struct.Struct('!BBIIIIIIB')
+    TYPE_DATA = 1
+    TYPE_ACK = 2
+    SEQUENCE_MODULO = 1 << 32
+    SACK_BITS = 32
+
+    INITIAL_RTO = 3.0
+    MIN_RTO = 1.0
+    MAX_RTO = 60.0
+    RETRANSMIT_CHECK_INTERVAL = 0.1
+
+    def __init__(self, transport: MessageTransport, window: int = 256, ack_delay: float = 0.2):
+        super().__init__(transport, self.HEADER.size)
+        self.window = window
+        self.ack_delay = ack_delay
+
+        # Sender state, _unacked keeps sequence order
+        self._epoch = self._new_epoch()
+        self._send_next = 0
+        self._unacked: dict[int, _SentFrame] = {}
+        # Sequence of a payload object the send scheduler may retry after
+        # throttling, the frame keeps the object so its id stays unique
+        self._sequences: dict[int, int] = {}
+        self._window_open = asyncio.Event()
+        self._window_open.set()
+        self._retransmit_wakeup = asyncio.Event()
+        self._srtt: Optional[float] = None
+        self._rttvar = 0.0
+        # Reorder window as a fraction of the smoothed RTT
+        self._reorder_fraction = 0.25
+        self.rto = self.INITIAL_RTO
+        self._backed_off_at = 0.0
+
+        # Receiver state
+        self._peer_epoch = 0
+        self._receive_next = 0
+        self._last_received = 0
+        self._last_transmission = 0
+        self._held: dict[int, bytes] = {}
+        self._ack_timer: Optional[asyncio.TimerHandle] = None
+        self._ack_task: Optional[asyncio.Task] = None
+        # ACK message queued, it carries the acknowledgement state at send time
+        self._ack_pending = False
+
+        self._retransmit_task: Optional[asyncio.Task] = None
+        self.retransmissions = 0
+        self.spurious_retransmissions = 0
+        self.duplicates = 0
+        self.acks_sent = 0
+
+    async def connect(self) -> None:
+        """Connect wrapped transport and start retransmission"""
+        await super().connect()
+        self._retransmit_task = asyncio.create_task(self._retransmit_loop())
+
+    @classmethod
+    def _new_epoch(cls, previous: int = 0) -> int:
+        """Start time based epoch, after the previous one"""
+        epoch = int(time.time() * 1000) % cls.SEQUENCE_MODULO or 1
+        if previous and not cls._is_after(epoch, previous):
+            epoch = (previous + 1) % cls.SEQUENCE_MODULO or 1
+        return epoch
+
+    def _restart_sending(self) -> None:
+        """Peer restarted: new sequence space from 0, unacknowledged frames are dropped"""
+        self._epoch = self._new_epoch(self._epoch)
+        self._send_next = 0
+        self._unacked.clear()
+        self._sequences.clear()
+        self._window_open.set()
+
+    async def send_data(self, data: bytes) -> None:
+        """Send data frame, waits while window frames are unacknowledged"""
+        await self._send(data, bulk=False)
+
+    async def send_bulk(self, data: bytes) -> None:
+        """Send data frame over the bulk channel of the wrapped transport"""
+        await self._send(data, bulk=True)
+
+    async def disconnect(self) -> None:
+        """Stop retransmission and disconnect wrapped transport"""
+        self.running = False
+        self._cancel_ack()
+        if self._retransmit_task is not None:
+            self._retransmit_task.cancel()
+            try:
+                await self._retransmit_task
+            except asyncio.CancelledError:
+                pass
+            self._retransmit_task = None
+        self._window_open.set()
+        await super().disconnect()
+
+    @property
+    def in_flight(self) -> int:
+        """Sequence numbers from the oldest unacknowledged frame on, bounded by the peer's receive buffer"""
+        if not self._unacked:
+            return 0
+        return (self._send_next - next(iter(self._unacked))) % self.SEQUENCE_MODULO
+
+    async def _send(self, data: bytes, bulk: bool) -> None:
+        sequence = self._sequences.get(id(data))
+        if sequence is None:
+            # New frame, a retried one keeps its sequence number
+            while self.in_flight >= self.window:
+                if not self.running:
+                    raise ConnectionError("Reliable transport is not running")
+                self._window_open.clear()
+                await self._window_open.wait()
+            sequence = self._send_next
+            self._send_next = (sequence + 1) % self.SEQUENCE_MODULO
+            self._unacked[sequence] = _SentFrame(data, bulk)
+            self._sequences[id(data)] = sequence
+
+        frame = self._unacked.get(sequence)
+        if frame is not None:
+            await self._transmit(sequence, frame)
+
+    async def _transmit(self, sequence: int, frame: _SentFrame) -> None:
+        """Send frame with the current acknowledgement state"""
+        frame.sent_at = time.monotonic()
+        frame.transmissions += 1
+        frame.lost = False
+        message = self.HEADER.pack(
+            self.TYPE_DATA, min(frame.transmissions, 255), self._epoch, sequence, *self._ack_fields()
+        ) + frame.payload
+        # The frame carries all ACKs, nothing left for a separate ACK message
+        self._cancel_ack()
+        if frame.bulk:
+            await self.transport.send_bulk(message)
+        else:
+            await self.transport.send_data(message)
+
+    def _ack_fields(self) -> tuple[int, int, int, int, int]:
+        """Acknowledged epoch, cumulative ACK, selective ACK bitmap, last received sequence and its transmission"""
+        sack = 0
+        if self._held:
+            for bit in range(self.SACK_BITS):
+                if (self._receive_next + 1 + bit) % self.SEQUENCE_MODULO in self._held:
+                    sack |= 1 << bit
+        return self._peer_epoch, self._receive_next, sack, self._last_received, self._last_transmission
+
+    async def _retransmit_loop(self) -> None:
+        """Resend frames that timed out or were reported lost"""
+        while self.running:
+            try:
+                await asyncio.wait_for(self._retransmit_wakeup.wait(), self.RETRANSMIT_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._retransmit_wakeup.clear()
+
+            if not self._unacked:
+                continue
+            now = time.monotonic()
+            # Timeouts are only trusted for frames the selective ACK bitmap covers,
+            # frames above it have probably arrived and wait for the gap
+            oldest = next(iter(self._unacked))
+            due = [
+                (sequence, frame) for sequence, frame in self._unacked.items()
+                if not frame.queued and (frame.lost or (
+                    frame.sent_at is not None and now - frame.sent_at >= self.rto
+                    and (sequence - oldest) % self.SEQUENCE_MODULO <= self.SACK_BITS
+                ))
+            ]
+            if any(not frame.lost and frame.sent_at >= self._backed_off_at for _, frame in due):
+                # Timeout, back off until a new RTT sample,
+                # once per round of frames sent since the last backoff
+                self.rto = min(self.rto * 2, self.MAX_RTO)
+                self._backed_off_at = now
+            for sequence, frame in due:
+                if self._unacked.get(sequence) is not frame:
+                    continue  # Acknowledged meanwhile
+                frame.queued = True
+                try:
+                    await self._submit(functools.partial(self._retransmit, sequence, frame, frame.transmissions))
+                except RateLimitError as e:
+                    await asyncio.sleep(e.retry_after)
+                    break
+                except Exception as e:
+                    print(f"Retransmission error: {e}")
+                    break
+
+    async def _retransmit(self, sequence: int, frame: _SentFrame, transmissions: int) -> None:
+        """Send job of a retransmission, skipped if the frame was acknowledged or sent again meanwhile"""
+        frame.queued = False
+        if self._unacked.get(sequence) is not frame or frame.transmissions != transmissions:
+            return
+        self.retransmissions += 1
+        await self._transmit(sequence, frame)
+
+    async def _handle_message(self, data: bytes) -> None:
+        """Process ACKs of a message and deliver its frame in order"""
+        if len(data) < self.HEADER.size:
+            print("Dropping message without reliable transport header")
+            return
+        kind, transmission, epoch, sequence, ack_epoch, ack, sack, last_received, last_transmission = \
+            self.HEADER.unpack_from(data)
+        if ack_epoch == self._epoch:
+            self._process_ack(ack, sack, last_received, last_transmission)
+        if kind != self.TYPE_DATA:
+            return
+
+        if epoch != self._peer_epoch:
+            if self._peer_epoch and not self._is_after(epoch, self._peer_epoch):
+                return  # Delayed frame of a previous peer instance
+            # Peer (re)started, its sequence space starts at 0
+            if self._peer_epoch and ack_epoch != self._epoch:
+                # A restarted peer does not know our epoch either, a peer that
+                # only restarted its sequence space acknowledges ours
+                self._restart_sending()
+            self._peer_epoch = epoch
+            self._receive_next = 0
+            self._last_received = 0
+            self._last_transmission = 0
+            self._held.clear()
+
+        distance = (sequence - self._receive_next) % self.SEQUENCE_MODULO
+        if distance >= self.SEQUENCE_MODULO // 2 or sequence in self._held:
+            # Our ACK was lost or is late, acknowledge again
+            self.duplicates += 1
+            self._schedule_ack()
+            return
+        if distance >= self.window:
+            return  # Beyond the receive buffer, the peer will retransmit
+
+        self._held[sequence] = data[self.HEADER.size:]
+        self._last_received = sequence
+        self._last_transmission = transmission
+        ready = []
+        while self._receive_next in self._held:
+            ready.append(self._held.pop(self._receive_next))
+            self._receive_next = (self._receive_next + 1) % self.SEQUENCE_MODULO
+        self._schedule_ack()
+
+        for payload in ready:
+            await self._handle_incoming_data(payload)
+
+    async def _handle_control(self, message: str) -> None:
+        """Restart sending when the peer announces a (re)start"""
+        if message == "ready":
+            self._restart_sending()
+        await self._handle_incoming_control(message)
+
+    def _process_ack(self, ack: int, sack: int, last_received: int, last_transmission: int) -> None:
+        """Forget acknowledged frames, update RTT and mark frames reported lost"""
+        if self._is_after(ack, self._send_next):
+            return  # Acknowledges frames never sent
+
+        now = time.monotonic()
+        rtt_sample = None
+        acked = []
+        for sequence in self._unacked:
+            if not self._is_after(ack, sequence):
+                break
+            acked.append(sequence)
+        for bit in range(self.SACK_BITS):
+            if sack >> bit & 1:
+                sequence = (ack + 1 + bit) % self.SEQUENCE_MODULO
+                if sequence in self._unacked:
+                    acked.append(sequence)
+
+        latest_sent_at = 0.0
+        for sequence in acked:
+            frame = self._unacked.pop(sequence)
+            self._sequences.pop(id(frame.payload), None)
+            if frame.sent_at is None:
+                continue
+            # Which transmission arrived is only known for the first one and the echoed one
+            echoed = sequence == last_received and last_transmission == min(frame.transmissions, 255)
+            if frame.transmissions == 1 or echoed:
+                latest_sent_at = max(latest_sent_at, frame.sent_at)
+            if echoed:
+                rtt_sample = now - frame.sent_at
+            elif sequence == last_received and frame.transmissions > 1:
+                # An earlier transmission arrived, the frame was only reordered
+                self.spurious_retransmissions += 1
+                self._reorder_fraction = min(self._reorder_fraction * 2, 1.0)
+        if rtt_sample is not None:
+            self._update_rto(rtt_sample)
+
+        if latest_sent_at:
+            # Frames sent before an acknowledged one are lost, allowing
+            # the reorder window for messages overtaking each other
+            lost_before = latest_sent_at - (self._srtt or 0.0) * self._reorder_fraction
+            for offset in range(self.SACK_BITS + 1):
+                frame = self._unacked.get((ack + offset) % self.SEQUENCE_MODULO)
+                if frame is not None and not frame.lost and frame.sent_at is not None \
+                        and frame.sent_at < lost_before:
+                    frame.lost = True
+                    self._retransmit_wakeup.set()
+
+        if self.in_flight < self.window:
+            self._window_open.set()
+
+    def _update_rto(self, rtt: float) -> None:
+        if self._srtt is None:
+            self._srtt = rtt
+            self._rttvar = rtt / 2
+        else:
+            self._rttvar = 0.75 * self._rttvar + 0.25 * abs(self._srtt - rtt)
+            self._srtt = 0.875 * self._srtt + 0.125 * rtt
+        self.rto = min(max(self._srtt + 4 * self._rttvar, self.MIN_RTO), self.MAX_RTO)
+
+    def _schedule_ack(self) -> None:
+        if self._ack_timer is None and not self._ack_pending and self.running:
+            self._ack_timer = asyncio.get_running_loop().call_later(self.ack_delay, self._ack_due)
+
+    def _cancel_ack(self) -> None:
+        """A data frame carries the ACKs, drop the timer and a queued ACK message"""
+        self._ack_pending = False
+        if self._ack_timer is not None:
+            self._ack_timer.cancel()
+            self._ack_timer = None
+
+    def _ack_due(self) -> None:
+        self._ack_timer = None
+        self._ack_pending = True
+        self._ack_task = asyncio.create_task(self._send_ack())
+
+    async def _send_ack(self) -> None:
+        """ACK message for a direction without data"""
+        try:
+            await self._submit(self._transmit_ack)
+        except RateLimitError as e:
+            await asyncio.sleep(e.retry_after)
+            self._schedule_ack()
+        except Exception as e:
+            print(f"Error sending ACK: {e}")
+
+    async def _transmit_ack(self) -> None:
+        """Send job of an ACK message, skipped if a data frame took the ACKs along"""
+        if not self._ack_pending:
+            return
+        self._ack_pending = False
+        message = self.HEADER.pack(self.TYPE_ACK, 0, self._epoch, 0, *self._ack_fields())
+        await self.transport.send_data(message)
+        self.acks_sent += 1
+
+    @classmethod
+    def _is_after(cls, a: int, b: int) -> bool:
+        """a is after b in 32-bit sequence space"""
+        return 0 < (a - b) % cls.SEQUENCE_MODULO < cls.SEQUENCE_MODULO // 2
@@ -0,0 +1,59 @@
+import time
+from typing import Any, Callable, Dict, Optional
+from pyrogram import Client
+
+
+class TelegramAccount:
+  """One Telegram client with its peer and send pacing state"""
+
+  # Pause before an account that failed to send is tried again
+  RETRY_DELAY = 30.0
+
+  def __init__(self, config: Dict[str, Any], api_id: int, api_hash: str,
+               client_factory: Optional[Callable[[Dict[str, Any]], Client]] = None):
+    self.peer_username = config['peer_username']
+    self.session_name = config.get('session_name', 'telegram_transport')
+    self.session_string = config.get('session_string')
+    self.rate_limit = float(config.get('rate_limit', 10))
+    self.connected = False
+    self.username: Optional[str] = None
+
+    # Monotonic time from which the next send is allowed
+    self.next_send_at = 0.0
+    # Monotonic time until which the account is throttled or broken
+    self.blocked_until = 0.0
+
+    if client_factory is not None:
+      # Stand-in client, e.g. of the Telegram emulator
+      self.client = client_factory(config)
+    elif self.session_string:
+      self.client = Client(
+        name=self.session_name,
+        api_id=api_id,
+        api_hash=api_hash,
+        session_string=self.session_string,
+        in_memory=True,
+      )
+    else:
+      self.client = Client(self.session_name, api_id, api_hash)
+
+
+
+  def available_at(self) -> float:
+    """Monotonic time when the account may send next message"""
+    return max(self.next_send_at, self.blocked_until)
+
+
+
+  def reserve(self) -> float:
+    """Take the next send slot, returns seconds to wait for it"""
+    now = time.monotonic()
+    start = max(now, self.available_at())
+    self.next_send_at = start + 1.0 / self.rate_limit
+    return start - now
+
+
+
+  def block(self, seconds: float) -> None:
+    """Keep the account out of rotation for some time"""
+    self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
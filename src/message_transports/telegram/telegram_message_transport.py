@@ -1,48 +1,113 @@
-import base64
-from typing import Dict, Any
-from pyrogram import Client, filters
+import asyncio
+import io
+import time
+from typing import Any, Awaitable, Callable, Dict
+from pyrogram import Client, enums, filters
+from pyrogram.errors import FloodWait, Forbidden, InternalServerError, ServiceUnavailable, Unauthorized
 from pyrogram.handlers import MessageHandler
-from ..base_message_transport import MessageTransport
+from src.message_encoder.codec_pipeline import CodecPipeline
+from ..base_message_transport import MessageTransport, RateLimitError
+from .telegram_account import TelegramAccount
 
 class TelegramMessageTransport(MessageTransport):
   """Telegram implementation of MessageTransport"""
+  
+  # Errors of an account or its connection, another account may still send;
+  # other errors (too long, malformed) fail the message on any account
+  ACCOUNT_ERRORS = (Unauthorized, Forbidden, InternalServerError, ServiceUnavailable, OSError)
+  supports_bulk = True
     
   def __init__(self, config: Dict[str, Any]):
     super().__init__()
     self.api_id = config['api_id']
     self.api_hash = config['api_hash']
-    self.peer_username = config['peer_username']
-    self.session_string = config.get('session_string')
-    self.session_name = config.get('session_name', 'telegram_transport')
-    
-    # Создание клиента
-    if self.session_string:
-      self.client = Client(
-        name=self.session_name,
-        api_id=self.api_id,
-        api_hash=self.api_hash,
-        session_string=self.session_string,
-        in_memory=True,
-      )
-    else:
-      self.client = Client(self.session_name, self.api_id, self.api_hash)
+    self.encoder = config.get('encoder', self.encoder)
+    self.codec = config.get('codec') or CodecPipeline(self.encoder)
+    self.max_message_length = config.get('max_message_length', self.DEFAULT_MAX_MESSAGE_LENGTH)
+    self.flush_deadline = config.get('flush_deadline', self.DEFAULT_FLUSH_DEADLINE)
+    self.send_window = config.get('send_window', self.DEFAULT_SEND_WINDOW)
+    self.bulk_threshold = config.get('bulk_threshold', 0)
+    self.bulk_max_size = config.get('bulk_max_size', self.DEFAULT_BULK_MAX_SIZE)
+    
+    # Every account is a separate client with its own flood limits,
+    # outbound frames are striped across all of them
+    self.accounts = [
+      TelegramAccount(account_config, self.api_id, self.api_hash, config.get('client_factory'))
+      for account_config in config['accounts']
+    ]
+    if not self.accounts:
+      raise ValueError("At least one Telegram account is required")
+    self.peer_usernames = {account.peer_username for account in self.accounts}
+    self.rate_limit = sum(account.rate_limit for account in self.accounts)
 
 
 
   async def connect(self) -> None:
     """Connect to Telegram"""
-    await self.client.start()
+    for account in self.accounts:
+      try:
+        await account.client.start()
+      except Exception as e:
+        print(f"Error connecting Telegram account {account.session_name}: {e}")
+        continue
+      
+      # Register message handler, documents carry the bulk channel
+      message_handler = MessageHandler(
+        self._telegram_message_handler,
+        filters.text | filters.document
+      )
+      
+      account.client.add_handler(message_handler)
+      account.connected = True
+      account.username = (await account.client.get_me()).username
+      print(f"Connected to Telegram as {account.username}")
     
-    # Register message handler
-    message_handler = MessageHandler(
-      self._telegram_message_handler,
-      filters.text
-    )
-
-    self.client.add_handler(message_handler)
+    if not any(account.connected for account in self.accounts):
+      raise ConnectionError("No Telegram account could connect")
     self.running = True
+
+
+
+  async def _send_striped(self, send: Callable[[TelegramAccount], Awaitable[Any]]) -> None:
+    """Send through the account that can send soonest, fall back to others on account errors
+
+    Raises:
+      RateLimitError: If every account is throttled or out of rotation
+      RPCError: If Telegram rejected the message itself
+    """
+    for _ in range(len(self.accounts)):
+      connected = [account for account in self.accounts if account.connected]
+      if not connected:
+        break
+      
+      account = min(connected, key=TelegramAccount.available_at)
+      blocked_for = account.blocked_until - time.monotonic()
+      if blocked_for > 0:
+        # Let the send scheduler back off instead of stalling here
+        raise RateLimitError(blocked_for, "All Telegram accounts are throttled")
+      
+      delay = account.reserve()
+      if delay > 0:
+        await asyncio.sleep(delay)
+      
+      try:
+        started = time.monotonic()
+        await send(account)
+        if self.tracer is not None:
+          self.tracer.mark('api', time.monotonic() - started)
+        return
+      except FloodWait as e:
+        print(f"Telegram account {account.session_name} throttled for {e.value}s")
+        account.block(e.value)
+        self.record_throttle(e.value)
+      except self.ACCOUNT_ERRORS as e:
+        print(f"Telegram account {account.session_name} send error: {e}")
+        account.block(TelegramAccount.RETRY_DELAY)
     
-    print(f"Connected to Telegram as {(await self.client.get_me()).username}")    
+    if any(account.connected for account in self.accounts):
+      retry_after = min(account.available_at() for account in self.accounts) - time.monotonic()
+      raise RateLimitError(max(0.0, retry_after), "All Telegram accounts are throttled")
+    raise ConnectionError("No Telegram account available for sending")
 
 
 
@@ -51,9 +116,28 @@ class TelegramMessageTransport(MessageTransport):
     if not self.running:
       return
     
-    # Codec data to base64
-    encoded_data = base64.b64encode(data).decode('utf-8')
-    await self.client.send_message(self.peer_username, encoded_data)
+    # Encoded text must reach the peer verbatim, so markup parsing is off
+    encoded_data = await self.codec.encode_message(data)
+    await self._send_striped(lambda account: account.client.send_message(
+      account.peer_username, encoded_data, parse_mode=enums.ParseMode.DISABLED
+    ))
+  
+
+
+
+  async def send_bulk(self, data: bytes) -> None:
+    """Send large payload as an in-memory binary document"""
+    if not self.running:
+      return
+    
+    document_data = await self.codec.encode_document(data)
+    
+    async def send_document(account: TelegramAccount) -> None:
+      document = io.BytesIO(document_data)
+      document.name = "frames.bin"
+      await account.client.send_document(account.peer_username, document)
+    
+    await self._send_striped(send_document)
   
 
 
@@ -64,33 +148,69 @@ class TelegramMessageTransport(MessageTransport):
       return
     
     control_message = f"--{message}"
-    await self.client.send_message(self.peer_username, control_message)
+    await self._send_striped(lambda account: account.client.send_message(
+      account.peer_username, control_message, parse_mode=enums.ParseMode.DISABLED
+    ))
   
 
 
   
   async def _telegram_message_handler(self, client, message):
     """Telegram message handler - ALL TELEGRAM LOGIC IS HERE"""
-    if not (message.from_user and message.from_user.username == self.peer_username and message.text):
+    if not (message.from_user and message.from_user.username in self.peer_usernames):
+      return
+    if self.tracer is not None:
+      self.tracer.begin_receive()
+    
+    # Process bulk documents
+    if message.document:
+      await self._handle_document(client, message)
+      return
+    
+    if not message.text:
       return
     
     # Process control messages
-    if message.text.startswith('--'):
+    if self.encoder.is_control_message(message.text):
       control_msg = message.text[2:]  # Убираем "--"
       await self._handle_incoming_control(control_msg)
       return
     
     # Process data
     try:
-      data = base64.b64decode(message.text)
+      data = await self.codec.decode_message(message.text)
       await self._handle_incoming_data(data)
     except Exception as e:
       print(f"Error decoding Telegram message: {e}")
     
 
     
+  async def _handle_document(self, client: Client, message) -> None:
+    """Download bulk document in memory and pass its payload as data"""
+    if message.document.file_size and message.document.file_size > self.bulk_max_size + 1:
+      print(f"Ignoring Telegram document of {message.document.file_size} bytes")
+      return
+    
+    try:
+      started = time.monotonic()
+      document = await client.download_media(message, in_memory=True)
+      if self.tracer is not None:
+        self.tracer.mark('download', time.monotonic() - started)
+      data = await self.codec.decode_document(bytes(document.getbuffer()), self.bulk_max_size)
+      await self._handle_incoming_data(data)
+    except Exception as e:
+      print(f"Error decoding Telegram document: {e}")
+    
+
+    
   async def disconnect(self) -> None:
     """Disconnect from Telegram"""
     self.running = False
-    if self.client:
-      await self.client.stop()
+    self.codec.close()
+    for account in self.accounts:
+      if account.connected:
+        account.connected = False
+        try:
+          await account.client.stop()
+        except Exception as e:
+          print(f"Error disconnecting Telegram account {account.session_name}: {e}")
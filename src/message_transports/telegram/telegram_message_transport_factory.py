@@ -1,5 +1,6 @@
 from typing import Any
 from src.config.base_config import BaseConfig
+from src.message_encoder.message_encoder_factory import MessageEncoderFactory
 from .telegram_message_transport import TelegramMessageTransport
 
 class TelegramMessageTransportFactory():
@@ -22,14 +23,51 @@ class TelegramMessageTransportFactory():
 
 
 
+  def get_accounts_config(self) -> list[dict[str, Any]]:
+    """Accounts to stripe traffic over: 'accounts' list or the single top-level account"""
+    session_name = self.get_config_value_safe("session_name", "telegram_transport")
+    rate_limit = self.get_config_value_safe("rate_limit", 10)
+    accounts = self.get_config_value_safe("accounts")
+    
+    if not accounts:
+      return [{
+        'session_string': self.get_config_value("session_string"),
+        'session_name': session_name,
+        'peer_username': self.get_config_value("peer_username"),
+        'rate_limit': rate_limit
+      }]
+    
+    if not isinstance(accounts, list):
+      raise ValueError("message_transport.telegram.accounts must be a list")
+    
+    return [
+      {
+        'session_string': account.get('session_string'),
+        'session_name': account.get('session_name', f"{session_name}_{index}"),
+        'peer_username': account['peer_username'],
+        'rate_limit': account.get('rate_limit', rate_limit)
+      }
+      for index, account in enumerate(accounts)
+    ]
+
+
+
   def create_transport(self) -> TelegramMessageTransport:
     """Creates and returns TelegramMessageTransport instance"""
     config = {
       'api_id': self.get_config_value("api_id"),
       'api_hash': self.get_config_value("api_hash"),
-      'session_string': self.get_config_value("session_string"),
-      'session_name': self.get_config_value_safe("session_name", "telegram_transport"),
-      'peer_username': self.get_config_value("peer_username") 
+      'accounts': self.get_accounts_config(),
+      'max_message_length': self.get_config_value_safe("max_message_length", 4096),
+      'flush_deadline': self.get_config_value_safe("flush_deadline", 0.02),
+      'send_window': self.get_config_value_safe("send_window", 4),
+      'bulk_threshold': self.get_config_value_safe("bulk_threshold", 0),
+      'bulk_max_size': self.get_config_value_safe("bulk_max_size", 4 * 1024 * 1024),
+      'encoder': MessageEncoderFactory.create_encoder(
+        self.get_config_value_safe("encoder", "base64"),
+        self.get_config_value_safe("compression", "none"),
+        self.get_config_value_safe("compression_level", 6)
+      )
     }
       
     return TelegramMessageTransport(config)
@@ -1,22 +1,62 @@
 import aiohttp
-import base64
-from typing import Dict, Any
-from ..base_message_transport import MessageTransport
+import asyncio
+import collections
+import html
+import json
+import random
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from src.core.token_bucket import TokenBucket
+from src.message_encoder.codec_pipeline import CodecPipeline
+from ..base_message_transport import MessageTransport, RateLimitError
 
 class VKMessageTransport(MessageTransport):
     """VK implementation of MessageTransport"""
     
+    API_URL = 'https://api.vk.com/method/'
+    # VK error codes: 6 - too many requests per second, 9 - flood control
+    ERROR_TOO_MANY_REQUESTS = 6
+    ERROR_FLOOD_CONTROL = 9
+    TOO_MANY_REQUESTS_DELAY = 1.0
+    FLOOD_CONTROL_DELAY = 10.0
+    # execute runs up to 25 API calls in one request
+    EXECUTE_MAX_CALLS = 25
+    # User Long Poll: event 4 - new message, flag 2 - outgoing message
+    LONG_POLL_VERSION = 3
+    LONG_POLL_WAIT = 25
+    LONG_POLL_MODE = 2
+    EVENT_NEW_MESSAGE = 4
+    FLAG_OUTBOX = 2
+    LONG_POLL_RETRY_DELAY = 1.0
+    
     def __init__(self, config: Dict[str, Any]):
         super().__init__()
         self.access_token = config['access_token']
         self.peer_id = config['peer_id']
         self.api_version = config.get('api_version', '5.131')
+        self.encoder = config.get('encoder', self.encoder)
+        self.codec = config.get('codec') or CodecPipeline(self.encoder)
+        self.max_message_length = config.get('max_message_length', self.DEFAULT_MAX_MESSAGE_LENGTH)
+        self.flush_deadline = config.get('flush_deadline', self.DEFAULT_FLUSH_DEADLINE)
+        self.send_window = config.get('send_window', self.EXECUTE_MAX_CALLS * 2)
+        # VK limits API requests per second, one execute request carries many
+        # messages; rate_limit is messages per second as for other messengers
+        self.request_rate = config.get('request_rate', 3)
+        self.rate_limit = config.get('rate_limit') or self.request_rate * self.EXECUTE_MAX_CALLS
+        self.api_url = config.get('api_url', self.API_URL)
         self.session = None
+        self._request_bucket = TokenBucket(self.request_rate, max_rate=self.request_rate)
+        self._pending: collections.deque[Tuple[str, int, asyncio.Future]] = collections.deque()
+        self._pending_ready = asyncio.Event()
+        self._send_task: Optional[asyncio.Task] = None
+        self._long_poll_task: Optional[asyncio.Task] = None
     
     async def connect(self) -> None:
-        """Connect to VK"""
+        """Connect to VK and start sending and receiving messages"""
         self.session = aiohttp.ClientSession()
         self.running = True
+        self._send_task = asyncio.create_task(self._send_loop())
+        self._long_poll_task = asyncio.create_task(self._long_poll_loop())
         print("Connected to VK")
     
     async def send_data(self, data: bytes) -> None:
@@ -24,44 +64,259 @@ class VKMessageTransport(MessageTransport):
         if not self.running or not self.session:
             return
         
-        # VK specific encoding
-        encoded_data = base64.b64encode(data).decode('utf-8')
+        await self._send_message(await self.codec.encode_message(data))
+    
+    async def send_control(self, message: str) -> None:
+        """Send control message via VK"""
+        # VK specific logic for control messages
+        if self.session:
+            await self._send_message(f"--{message}")
+    
+    async def _send_message(self, message: str) -> None:
+        """Queue message for the next API request and wait until it is sent
         
-        params = {
-            'access_token': self.access_token,
-            'v': self.api_version,
+        Raises:
+          RateLimitError: If VK throttled the request or this call
+          ConnectionError: If VK rejected the message
+        """
+        future = asyncio.get_running_loop().create_future()
+        # Unique random_id, VK drops messages with a repeated one
+        self._pending.append((message, random.getrandbits(31), future))
+        self._pending_ready.set()
+        started = time.monotonic()
+        await future
+        if self.tracer is not None:
+            # Wait for the next request slot included, messages are sent in batches
+            self.tracer.mark('api', time.monotonic() - started)
+    
+    async def _send_loop(self) -> None:
+        """Send queued messages, several at once via execute
+        
+        One request is in flight at a time, messages queued meanwhile go
+        into the next one. The request rate is kept under the VK limit.
+        """
+        while True:
+            await self._pending_ready.wait()
+            self._pending_ready.clear()
+            
+            while self._pending:
+                count = min(len(self._pending), self.EXECUTE_MAX_CALLS)
+                batch = [self._pending.popleft() for _ in range(count)]
+                await self._request_bucket.acquire()
+                try:
+                    if len(batch) == 1:
+                        await self._send_single(batch[0])
+                    else:
+                        await self._send_execute(batch)
+                except asyncio.CancelledError:
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(ConnectionError("VK transport disconnected"))
+                    raise
+                except Exception as e:
+                    if isinstance(e, RateLimitError):
+                        self._request_bucket.on_throttled(e.retry_after)
+                        self.record_throttle(e.retry_after)
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+    
+    def _message_params(self, message: str, random_id: int) -> Dict[str, Any]:
+        return {
             'peer_id': self.peer_id,
-            'message': encoded_data,
-            'random_id': 0  # VK reqirement the random_id
+            'message': message,
+            'random_id': random_id
         }
+    
+    async def _send_single(self, item: Tuple[str, int, asyncio.Future]) -> None:
+        """Send one message via messages.send"""
+        message, random_id, future = item
+        params = self._message_params(message, random_id)
+        params.update({'access_token': self.access_token, 'v': self.api_version})
+        await self._call_api('messages.send', params)
+        self._request_bucket.on_success()
+        if not future.done():
+            future.set_result(None)
+    
+    async def _send_execute(self, batch: List[Tuple[str, int, asyncio.Future]]) -> None:
+        """Send up to EXECUTE_MAX_CALLS messages in one execute request
+        
+        Every messages.send call succeeds or fails on its own: a failed
+        call returns false and its error is listed in execute_errors.
+        """
+        calls = ', '.join(
+            'API.messages.send(' + json.dumps(self._message_params(message, random_id), ensure_ascii=False) + ')'
+            for message, random_id, _ in batch
+        )
+        result = await self._request('execute', {
+            'access_token': self.access_token,
+            'v': self.api_version,
+            'code': f"return [{calls}];"
+        })
+        self._raise_for_error(result.get('error'))
+        self._request_bucket.on_success()
         
+        responses = result.get('response') or []
+        errors = iter(result.get('execute_errors') or [])
+        for index, (_, _, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index < len(responses) and responses[index] is not False:
+                future.set_result(None)
+                continue
+            try:
+                self._raise_for_error(next(errors, None) or {'error_msg': 'message was not sent'})
+            except Exception as e:
+                if isinstance(e, RateLimitError):
+                    self._request_bucket.on_throttled(e.retry_after)
+                    self.record_throttle(e.retry_after)
+                future.set_exception(e)
+    
+    async def _request(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """POST API method and return the raw result"""
         async with self.session.post(
-            'https://api.vk.com/method/messages.send', 
-            params=params
+            self.api_url + method,
+            data=params  # Form body, long messages do not fit into URL
         ) as response:
-            pass  # Process response
+            return await response.json(content_type=None)
     
-    async def send_control(self, message: str) -> None:
-        """Send control message via VK"""
-        # VK specific logic for control messages
-        control_message = f"--{message}"
-        params = {
+    def _raise_for_error(self, error: Optional[Dict[str, Any]]) -> None:
+        """Raise exception for VK API error, if any
+        
+        Raises:
+          RateLimitError: If VK throttled the call
+          ConnectionError: If VK returned any other error
+        """
+        if not error:
+            return
+        code = error.get('error_code')
+        message = error.get('error_msg', 'unknown error')
+        if code == self.ERROR_TOO_MANY_REQUESTS:
+            raise RateLimitError(self.TOO_MANY_REQUESTS_DELAY, f"VK: {message}")
+        if code == self.ERROR_FLOOD_CONTROL:
+            raise RateLimitError(self.FLOOD_CONTROL_DELAY, f"VK: {message}")
+        raise ConnectionError(f"VK API error {code}: {message}")
+    
+    async def _call_api(self, method: str, params: Dict[str, Any]) -> Any:
+        """Call VK API method and return its response
+        
+        Raises:
+          RateLimitError: If VK throttled the call
+          ConnectionError: If VK returned any other error
+        """
+        result = await self._request(method, params)
+        self._raise_for_error(result.get('error'))
+        return result.get('response')
+    
+    async def _get_long_poll_server(self) -> Tuple[str, str, int]:
+        """Request Long Poll server, key and ts"""
+        response = await self._call_api('messages.getLongPollServer', {
             'access_token': self.access_token,
             'v': self.api_version,
-            'peer_id': self.peer_id,
-            'message': control_message,
-            'random_id': 0
-        }
+            'lp_version': self.LONG_POLL_VERSION
+        })
+        server = response['server']
+        if '://' not in server:
+            server = 'https://' + server
+        return server, response['key'], int(response['ts'])
+    
+    async def _long_poll_loop(self) -> None:
+        """Receive messages via user Long Poll
         
-        if self.session:
-            async with self.session.post(
-                'https://api.vk.com/method/messages.send', 
-                params=params
-            ) as response:
-                pass
+        One poll returns all events queued since ts, they are handled as
+        one batch. An expired key or ts is refreshed right away, network
+        errors are retried after a short delay with a new server.
+        """
+        server = key = None
+        ts = 0
+        while self.running:
+            try:
+                if server is None:
+                    server, key, ts = await self._get_long_poll_server()
+                
+                async with self.session.get(server, params={
+                    'act': 'a_check',
+                    'key': key,
+                    'ts': ts,
+                    'wait': self.LONG_POLL_WAIT,
+                    'mode': self.LONG_POLL_MODE,
+                    'version': self.LONG_POLL_VERSION
+                }, timeout=aiohttp.ClientTimeout(total=self.LONG_POLL_WAIT + 10)) as response:
+                    result = await response.json(content_type=None)
+                
+                failed = result.get('failed')
+                if failed == 1:
+                    # History is partially lost, continue from the new ts
+                    ts = int(result['ts'])
+                elif failed == 2:
+                    # Key expired, ts is still valid
+                    _, key, _ = await self._get_long_poll_server()
+                elif failed:
+                    # Key and ts expired
+                    server = None
+                else:
+                    ts = int(result['ts'])
+                    await self._handle_updates(result.get('updates', []))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not self.running:
+                    break
+                print(f"VK Long Poll error: {e}")
+                server = None
+                await asyncio.sleep(self.LONG_POLL_RETRY_DELAY)
+    
+    async def _handle_updates(self, updates: List[list]) -> None:
+        """Decode all messages from the peer in the batch, then dispatch them in order
+        
+        Data messages of the batch are decoded concurrently, on the codec
+        workers when they are large enough.
+        """
+        texts = []
+        for update in updates:
+            if len(update) < 6 or update[0] != self.EVENT_NEW_MESSAGE:
+                continue
+            flags, peer_id = update[2], update[3]
+            if flags & self.FLAG_OUTBOX or str(peer_id) != str(self.peer_id):
+                continue
+            # Long Poll returns HTML-escaped text
+            texts.append(html.unescape(str(update[5]).replace('<br>', '\n')))
+        
+        decoded = await asyncio.gather(*(self._decode_text(text) for text in texts), return_exceptions=True)
+        for result in decoded:
+            if isinstance(result, Exception):
+                print(f"Error decoding VK message: {result}")
+                continue
+            is_control, value, marks = result
+            if is_control:
+                await self._handle_incoming_control(value)
+            else:
+                if self.tracer is not None:
+                    self.tracer.resume(marks)
+                await self._handle_incoming_data(value)
+    
+    async def _decode_text(self, text: str) -> Tuple[bool, Any, Optional[list]]:
+        """Control message or decoded data, with the trace marks of the message"""
+        if self.encoder.is_control_message(text):
+            return True, text[2:], None
+        marks = self.tracer.begin_receive() if self.tracer is not None else None
+        return False, await self.codec.decode_message(text), marks
     
     async def disconnect(self) -> None:
         """Disconnect from VK"""
         self.running = False
+        for task in (self._send_task, self._long_poll_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._send_task = self._long_poll_task = None
+        while self._pending:
+            _, _, future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError("VK transport disconnected"))
+        self.codec.close()
         if self.session:
             await self.session.close()
\ No newline at end of file
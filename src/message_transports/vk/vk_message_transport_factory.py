@@ -1,6 +1,7 @@
 from typing import Any
 from .vk_message_transport import VKMessageTransport
 from src.config.base_config import BaseConfig
+from src.message_encoder.message_encoder_factory import MessageEncoderFactory
 
 
 class VKMessageTransportFactory():
@@ -22,7 +23,18 @@ class VKMessageTransportFactory():
         config = {
             'access_token': self.get_config_value("access_token"),
             'peer_id': self.get_config_value("peer_id"),
-            'api_version': self.get_config_value_safe("api_version", "5.131")
+            'api_version': self.get_config_value_safe("api_version", "5.131"),
+            'api_url': self.get_config_value_safe("api_url", VKMessageTransport.API_URL),
+            'max_message_length': self.get_config_value_safe("max_message_length", 4096),
+            'flush_deadline': self.get_config_value_safe("flush_deadline", 0.02),
+            'send_window': self.get_config_value_safe("send_window", 50),
+            'request_rate': self.get_config_value_safe("request_rate", 3),
+            'rate_limit': self.get_config_value_safe("rate_limit", 0),
+            'encoder': MessageEncoderFactory.create_encoder(
+                self.get_config_value_safe("encoder", "base64"),
+                self.get_config_value_safe("compression", "none"),
+                self.get_config_value_safe("compression_level", 6)
+            )
         }
         
         return VKMessageTransport(config)
\ No newline at end of file
@@ -0,0 +1,121 @@
+import asyncio
+from typing import Optional
+from src.utils.statistics import TunnelStatistics
+
+
+class MetricsServer:
+    """Serves tunnel statistics in the Prometheus text format
+
+    Minimal HTTP listener: GET /metrics answers with the counters, the
+    per-second rates, the gauges and the stage latency histograms of the
+    statistics, every other request gets 404. Rates are recomputed every
+    rate_interval seconds.
+    """
+
+    PREFIX = 'messtun_'
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+    # Request line and headers are read up to that size
+    MAX_REQUEST_SIZE = 8192
+    READ_TIMEOUT = 5.0
+
+    COUNTERS = (
+        ('sent_bytes_total', "Payload bytes sent", 'bytes_sent'),
+        ('received_bytes_total', "Payload bytes received", 'bytes_received'),
+        ('sent_messages_total', "Messages sent", 'messages_sent'),
+        ('received_messages_total', "Messages received", 'messages_received'),
+        ('sent_packets_total', "Packets sent", 'packets_sent'),
+        ('received_packets_total', "Packets received", 'packets_received'),
+        ('write_queue_drops_total', "Packets dropped by the inbound write queue", 'write_queue_drops'),
+        ('acks_thinned_total', "Queued pure ACKs replaced by newer ones", 'acks_thinned'),
+        ('retransmits_dropped_total', "Retransmitted segments dropped while queued", 'retransmits_dropped'),
+    )
+
+    def __init__(self, stats: TunnelStatistics, host: str = '127.0.0.1', port: int = 9464,
+                 rate_interval: float = 5.0):
+        self.stats = stats
+        self.host = host
+        self.port = port
+        self.rate_interval = rate_interval
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._rate_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Start listening"""
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self._rate_task = asyncio.create_task(self._rate_loop())
+        print(f"Metrics available at http://{self.host}:{self.port}/metrics")
+
+    async def close(self) -> None:
+        """Stop listening"""
+        if self._rate_task is not None:
+            self._rate_task.cancel()
+            self._rate_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _rate_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.rate_interval)
+            self.stats.update_rates()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.READ_TIMEOUT)
+            if len(request) > self.MAX_REQUEST_SIZE:
+                raise ValueError("Request too large")
+            method, path, _ = request.split(b'\r\n', 1)[0].decode('latin-1').split(' ', 2)
+            if method == 'GET' and path.split('?', 1)[0] == '/metrics':
+                status, body = '200 OK', self.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'Not found\n'
+            writer.write((f"HTTP/1.1 {status}\r\n"
+                          f"Content-Type: {self.CONTENT_TYPE}\r\n"
+                          f"Content-Length: {len(body)}\r\n"
+                          f"Connection: close\r\n\r\n").encode('latin-1') + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        except Exception as e:
+            print(f"Metrics request error: {e}")
+        finally:
+            writer.close()
+
+    def render(self) -> str:
+        """Statistics in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name: str, kind: str, description: str) -> str:
+            name = self.PREFIX + name
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            return name
+
+        for name, description, attribute in self.COUNTERS:
+            lines.append(f"{metric(name, 'counter', description)} {getattr(self.stats, attribute)}")
+
+        name = metric('uptime_seconds', 'gauge', "Seconds since the tunnel started")
+        lines.append(f"{name} {self.stats.uptime():.3f}")
+
+        for rate, value in sorted(self.stats.rates.items()):
+            name = metric(f"{rate}_per_second", 'gauge', f"Rate of {rate.replace('_', ' ')} per second")
+            lines.append(f"{name} {value:.3f}")
+
+        for gauge, (description, read) in sorted(self.stats.gauges.items()):
+            try:
+                value = float(read())
+            except Exception as e:
+                print(f"Error reading metric {gauge}: {e}")
+                continue
+            lines.append(f"{metric(gauge, 'gauge', description)} {value:g}")
+
+        name = metric('stage_latency_seconds', 'histogram', "Latency of tunnel pipeline stages")
+        for stage, histogram in self.stats.latency.items():
+            for bound, count in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
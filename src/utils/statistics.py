@@ -1,28 +1,129 @@
+import bisect
 import time
+from typing import Callable
+
+
+class LatencyHistogram:
+    """Latency distribution with fixed buckets, in the Prometheus histogram layout"""
+    
+    BOUNDS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+    
+    def __init__(self):
+        # Last bucket collects everything above the highest bound
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, seconds: float) -> None:
+        """Add one measurement"""
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+    
+    def cumulative(self) -> list[tuple[float, int]]:
+        """(upper bound, measurements up to it) pairs, the last bound is infinity"""
+        result = []
+        total = 0
+        for bound, count in zip(self.BOUNDS + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
 
 class TunnelStatistics:
     """Class for collecting tunnel statistics"""
     
+    # Pipeline stages with latency histograms: outbound queue wait, text
+    # encoding, send job queue and API call, inbound reorder wait, text
+    # decoding, data transport write
+    STAGES = ('read', 'encode', 'send', 'receive', 'decode', 'write')
+    
     def __init__(self):
         self.start_time = time.time()
         self.bytes_sent = 0
         self.bytes_received = 0
         self.messages_sent = 0
         self.messages_received = 0
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.write_queue_drops = 0
+        self.write_queue_dropped_bytes = 0
+        self.write_queue_high_water = 0
+        self.acks_thinned = 0
+        self.retransmits_dropped = 0
+        self.thinned_bytes = 0
+        self.latency = {stage: LatencyHistogram() for stage in self.STAGES}
+        # Current values read when metrics are exported (queue depths, rates)
+        self.gauges: dict[str, tuple[str, Callable[[], float]]] = {}
+        self.rates: dict[str, float] = {}
+        self._rate_sample = (time.monotonic(), self._rate_counters())
     
-    def add_sent(self, bytes_count: int) -> None:
+    def observe(self, stage: str, seconds: float) -> None:
+        """Add latency measurement of a pipeline stage"""
+        self.latency[stage].observe(seconds)
+    
+    def add_gauge(self, name: str, description: str, read: Callable[[], float]) -> None:
+        """Register value read at export time"""
+        self.gauges[name] = (description, read)
+    
+    def _rate_counters(self) -> dict[str, int]:
+        return {
+            'sent_bytes': self.bytes_sent,
+            'received_bytes': self.bytes_received,
+            'sent_messages': self.messages_sent,
+            'received_messages': self.messages_received
+        }
+    
+    def update_rates(self) -> None:
+        """Per-second rates since the previous call"""
+        now, counters = time.monotonic(), self._rate_counters()
+        sampled_at, previous = self._rate_sample
+        elapsed = now - sampled_at
+        if elapsed > 0:
+            self.rates = {name: (counters[name] - previous[name]) / elapsed for name in counters}
+        self._rate_sample = (now, counters)
+    
+    def add_sent(self, bytes_count: int, packets_count: int = 1) -> None:
         """Add sent data"""
         self.bytes_sent += bytes_count
         self.messages_sent += 1
+        self.packets_sent += packets_count
     
-    def add_received(self, bytes_count: int) -> None:
+    def add_received(self, bytes_count: int, packets_count: int = 1) -> None:
         """Add received data"""
         self.bytes_received += bytes_count
         self.messages_received += 1
+        self.packets_received += packets_count
+    
+    def add_write_drop(self, bytes_count: int) -> None:
+        """Add packet dropped by the inbound write queue"""
+        self.write_queue_drops += 1
+        self.write_queue_dropped_bytes += bytes_count
+    
+    def update_write_queue_high_water(self, depth: int) -> None:
+        """Track the high-water mark of the inbound write queue, the current depth is a gauge"""
+        if depth > self.write_queue_high_water:
+            self.write_queue_high_water = depth
+    
+    def add_thinned_ack(self, bytes_count: int) -> None:
+        """Add queued pure ACK replaced by a newer one"""
+        self.acks_thinned += 1
+        self.thinned_bytes += bytes_count
+    
+    def add_dropped_retransmit(self, bytes_count: int) -> None:
+        """Add retransmitted segment dropped while its original was queued"""
+        self.retransmits_dropped += 1
+        self.thinned_bytes += bytes_count
+    
+    def uptime(self) -> float:
+        """Seconds since the statistics were created"""
+        return time.time() - self.start_time
     
     def get_summary(self) -> str:
         """Get statistics summary"""
-        uptime = time.time() - self.start_time
+        uptime = self.uptime()
         return (f"Uptime: {uptime:.1f}s, "
-                f"Sent: {self.bytes_sent} bytes ({self.messages_sent} msgs), "
-                f"Received: {self.bytes_received} bytes ({self.messages_received} msgs)")
+                f"Sent: {self.bytes_sent} bytes ({self.packets_sent} packets in {self.messages_sent} msgs), "
+                f"Received: {self.bytes_received} bytes ({self.packets_received} packets in {self.messages_received} msgs), "
+                f"Write queue: {self.write_queue_drops} drops, high-water {self.write_queue_high_water}, "
+                f"Saved: {self.acks_thinned} ACKs, {self.retransmits_dropped} retransmits ({self.thinned_bytes} bytes)")
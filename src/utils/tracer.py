@@ -0,0 +1,135 @@
+import collections
+import contextvars
+import json
+import os
+import random
+import time
+from typing import Any, Iterable, Optional, Union
+
+# Trace context of the current task: the trace ID of the frame being sent,
+# or the stage marks of the message being received until the tunnel reads
+# the trace ID from the frame header
+_context: contextvars.ContextVar[Union[int, list, None]] = contextvars.ContextVar('messtun_trace', default=None)
+
+
+class PacketTracer:
+    """Sampling per-frame tracer exported in the Chrome trace event format
+
+    The sending tunnel samples sample_rate of its frames and carries their
+    trace ID in the frame header (see PacketFramer), every stage on the way
+    records a span under that ID: coalescing, send scheduling, encoding and
+    the messenger API call on the sender, download, decoding, reordering
+    and the data transport write on the receiver. Frames traced by the peer
+    are recorded whenever tracing is on, so the receiver may sample 0.
+
+    Spans are stored as monotonic times and exported with wall-clock
+    timestamps, so the files of both peers can be merged into one view for
+    Perfetto or chrome://tracing. Up to max_events spans are kept, older
+    ones are dropped, without a path they are only read through events.
+    Components hold None instead of a tracer when tracing is off.
+    """
+
+    TRACE_ID_MASK = 0xFFFFFFFF
+
+    def __init__(self, path: Optional[str], sample_rate: float = 0.01, max_events: int = 100000,
+                 name: Optional[str] = None, pid: Optional[int] = None):
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(f"Trace sample rate must be between 0 and 1, received: {sample_rate}")
+        self.path = path
+        self.sample_rate = sample_rate
+        self.pid = pid if pid is not None else os.getpid()
+        self.name = name or f"messtun {self.pid}"
+        self._random = random.Random()
+        # Random start, so trace IDs of the two peers do not collide
+        self._next_id = self._random.getrandbits(32)
+        self._spans: collections.deque[tuple] = collections.deque(maxlen=max_events)
+        self._wall_offset = time.time() - time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def sample(self) -> Optional[int]:
+        """Trace ID for a new frame if it is sampled"""
+        if self._random.random() >= self.sample_rate:
+            return None
+        self._next_id = (self._next_id + 1) & self.TRACE_ID_MASK
+        return self._next_id
+
+    def span(self, trace_id: int, stage: str, started: float, ended: Optional[float] = None,
+             args: Optional[dict[str, Any]] = None) -> None:
+        """Record a stage of a traced frame between monotonic times"""
+        self._spans.append((trace_id, stage, started, time.monotonic() if ended is None else ended, args))
+
+    @staticmethod
+    def enter(trace_id: int) -> None:
+        """Make trace_id the frame sent by the current task"""
+        _context.set(trace_id)
+
+    @staticmethod
+    def begin_receive() -> list:
+        """Collect stage marks of the message received by the current task
+
+        Returns the marks, to resume them with resume when the message is
+        handed over later.
+        """
+        marks: list = []
+        _context.set(marks)
+        return marks
+
+    @staticmethod
+    def resume(marks: Optional[list]) -> None:
+        """Continue with marks of begin_receive"""
+        _context.set(marks)
+
+    def mark(self, stage: str, duration: float) -> None:
+        """Stage that just took duration seconds in the current task"""
+        context = _context.get()
+        if context is None:
+            return
+        ended = time.monotonic()
+        if isinstance(context, list):
+            context.append((stage, ended - duration, ended))
+        else:
+            self._spans.append((context, stage, ended - duration, ended, None))
+
+    def claim(self, trace_id: int, args: Optional[dict[str, Any]] = None) -> None:
+        """Record the receive marks of the current task for the traced frame"""
+        context = _context.get()
+        if isinstance(context, list):
+            for stage, started, ended in context:
+                self._spans.append((trace_id, stage, started, ended, args))
+                args = None
+            _context.set(None)
+
+    def events(self) -> list[dict[str, Any]]:
+        """Spans as Chrome trace async events, one track per traced frame"""
+        events = [{'ph': 'M', 'name': 'process_name', 'pid': self.pid, 'args': {'name': self.name}}]
+        for trace_id, stage, started, ended, args in self._spans:
+            event = {'cat': 'frame', 'name': stage, 'id': f"0x{trace_id:08x}", 'pid': self.pid, 'tid': self.pid}
+            begin = dict(event, ph='b', ts=(started + self._wall_offset) * 1e6)
+            if args:
+                begin['args'] = args
+            events.append(begin)
+            events.append(dict(event, ph='e', ts=(ended + self._wall_offset) * 1e6))
+        return events
+
+    def export(self, path: Optional[str] = None) -> None:
+        """Write the trace file, if there is a path"""
+        path = path or self.path
+        if path:
+            self.save(path, self.events())
+            print(f"Trace of {len(self._spans)} spans written to {path}")
+
+    @staticmethod
+    def save(path: str, events: Iterable[dict[str, Any]]) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': list(events), 'displayTimeUnit': 'ms'}, f)
+
+    @classmethod
+    def merge(cls, paths: Iterable[str], output: str) -> None:
+        """Combine trace files, e.g. of both peers, into one"""
+        events = []
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                events.extend(json.load(f)['traceEvents'])
+        cls.save(output, events)
@@ -0,0 +1,54 @@
+import asyncio
+import socket
+
+import pytest
+
+from src.data_transports.socks import socks5_protocol as socks5
+from src.data_transports.socks.dns_cache import DnsCache
+
+
+def test_malformed_name_fails_all_waiters():
+    async def run():
+        cache = DnsCache()
+        # A label over 63 characters fails in idna
+        host = 'a' * 70 + '.example'
+        results = await asyncio.wait_for(
+            asyncio.gather(cache.resolve(host, 80), cache.resolve(host, 80), return_exceptions=True), 5
+        )
+        assert all(isinstance(result, UnicodeError) for result in results)
+        assert not cache._pending
+        return results[0]
+
+    error = asyncio.run(run())
+    assert socks5.reply_code_for_error(error) == socks5.REP_HOST_UNREACHABLE
+
+
+def test_cancelled_lookup_handed_to_waiter():
+    async def run():
+        cache = DnsCache()
+        release = asyncio.Event()
+        calls = []
+
+        async def lookup(host, port):
+            calls.append(host)
+            if len(calls) == 1:
+                await asyncio.Event().wait()
+            await release.wait()
+            return [(socket.AF_INET, '192.0.2.1')]
+
+        cache._lookup = lookup
+        owner = asyncio.create_task(cache.resolve('example.test', 80))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.resolve('example.test', 80))
+        await asyncio.sleep(0)
+        owner.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        result = await asyncio.wait_for(waiter, 5)
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return result, calls
+
+    result, calls = asyncio.run(run())
+    assert result == [(socket.AF_INET, '192.0.2.1')]
+    assert calls == ['example.test', 'example.test']
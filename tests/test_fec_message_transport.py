@@ -0,0 +1,117 @@
+import asyncio
+import functools
+from src.core.send_scheduler import SendScheduler
+from src.message_transports.fec_message_transport import FecMessageTransport
+from src.message_transports.loopback.loopback_message_transport import LoopbackLink, LoopbackMessageTransport
+
+
+async def start_end(link: LoopbackLink, received: list, **options) -> FecMessageTransport:
+    transport = FecMessageTransport(LoopbackMessageTransport(link, {}), **options)
+
+    async def handle(data: bytes) -> None:
+        received.append(data)
+
+    transport.set_data_handler(handle)
+    await transport.connect()
+    return transport
+
+
+def drop_data_frames(fec: FecMessageTransport, indexes: set[int]) -> None:
+    """Lose the data frames with these send positions"""
+    send_data = fec.transport.send_data
+    sent = 0
+
+    async def lossy_send(message: bytes) -> None:
+        nonlocal sent
+        if message[0] == FecMessageTransport.TYPE_DATA:
+            sent += 1
+            if sent - 1 in indexes:
+                return
+        await send_data(message)
+
+    fec.transport.send_data = lossy_send
+
+
+async def wait_for(condition, timeout: float = 5.0) -> None:
+    async def poll() -> None:
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_lost_frame_rebuilt_from_parity():
+    async def run() -> None:
+        link = LoopbackLink(latency=0.01)
+        received: list[bytes] = []
+        a = await start_end(link, [], group_size=4, parity=1)
+        b = await start_end(link, received)
+        drop_data_frames(a, {2})
+        sent = [b"frame%d" % i for i in range(4)]
+        for data in sent:
+            await a.send_data(data)
+        await wait_for(lambda: sorted(received) == sorted(sent))
+        assert b.recovered_frames == 1
+        await a.disconnect()
+        await b.disconnect()
+
+    asyncio.run(run())
+
+
+def test_sender_restart_starts_new_groups():
+    async def run() -> None:
+        link = LoopbackLink(latency=0.01)
+        received: list[bytes] = []
+        a = await start_end(link, [], group_size=4, parity=1)
+        b = await start_end(link, received, group_size=4, parity=1)
+        for i in range(40):
+            await a.send_data(b"old%d" % i)
+        await wait_for(lambda: len(received) == 40)
+
+        # Restarted sender numbers its groups from 0 again
+        await a.disconnect()
+        link.ends.remove(a.transport)
+        await asyncio.sleep(0.002)
+        a = await start_end(link, [], group_size=4, parity=1)
+        received.clear()
+        drop_data_frames(a, {1})
+        sent = [b"new%d" % i for i in range(8)]
+        for data in sent:
+            await a.send_data(data)
+        await wait_for(lambda: sorted(received) == sorted(sent))
+        assert b.recovered_frames == 1
+        await a.disconnect()
+        await b.disconnect()
+
+    asyncio.run(run())
+
+
+def test_parity_goes_through_scheduler():
+    async def run() -> None:
+        link = LoopbackLink(latency=0.01)
+        received: list[bytes] = []
+        a = await start_end(link, [], group_size=4, parity=2)
+        b = await start_end(link, received)
+        # Parity is paced by the scheduler, not by a reduced data rate
+        assert a.rate_limit == a.transport.rate_limit
+
+        scheduler = SendScheduler(rate=100, window=4)
+        scheduler.start()
+        a.scheduler = scheduler
+        priorities = []
+        submit_nowait = scheduler.submit_nowait
+
+        def record(job, priority: int) -> None:
+            priorities.append(priority)
+            submit_nowait(job, priority)
+
+        scheduler.submit_nowait = record
+        sent = [b"frame%d" % i for i in range(4)]
+        for data in sent:
+            await scheduler.submit(functools.partial(a.send_data, data), SendScheduler.PRIORITY_INTERACTIVE)
+        await wait_for(lambda: a.parity_sent == 2)
+        assert priorities == [SendScheduler.PRIORITY_BULK] * 2
+        await scheduler.close()
+        await a.disconnect()
+        await b.disconnect()
+
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+import asyncio
+import functools
+import struct
+from src.core.flow_lanes import FlowLanes
+from src.core.packet_coalescer import PacketCoalescer
+from src.core.send_scheduler import SendScheduler
+from src.message_encoder.packet_framer import PacketFramer
+
+
+def tcp_packet(source_port: int, seq: int, payload_length: int) -> bytes:
+    """IPv4 TCP segment from 10.0.0.1 to 10.0.0.2:80, checksums left zero"""
+    total_length = 40 + payload_length
+    ip_header = struct.pack('!BBHHHBBH4s4s', 0x45, 0, total_length, 0, 0, 64, 6, 0,
+                            bytes([10, 0, 0, 1]), bytes([10, 0, 0, 2]))
+    tcp_header = struct.pack('!HHIIBBHHH', source_port, 80, seq, 0, 5 << 4, 0x18, 65535, 0, 0)
+    return ip_header + tcp_header + bytes(payload_length)
+
+
+def test_flow_kept_on_lane_of_unsent_frames():
+    lanes = FlowLanes()
+    bulk_flow, other_flow = ('bulk',), ('other',)
+    lanes.pin({bulk_flow}, SendScheduler.PRIORITY_BULK)
+    assert lanes.lane_for({bulk_flow}, SendScheduler.PRIORITY_INTERACTIVE) == SendScheduler.PRIORITY_BULK
+    assert lanes.lane_for({other_flow}, SendScheduler.PRIORITY_INTERACTIVE) == SendScheduler.PRIORITY_INTERACTIVE
+    # A flow pinned to the interactive lane only moves down
+    lanes.pin({other_flow}, SendScheduler.PRIORITY_INTERACTIVE)
+    assert lanes.lane_for({bulk_flow, other_flow}, SendScheduler.PRIORITY_INTERACTIVE) == SendScheduler.PRIORITY_BULK
+    lanes.release({bulk_flow})
+    assert lanes.lane_for({bulk_flow}, SendScheduler.PRIORITY_INTERACTIVE) == SendScheduler.PRIORITY_INTERACTIVE
+    lanes.release({other_flow})
+    assert len(lanes) == 0
+
+
+def test_in_flow_order_kept_across_frame_sizes():
+    """A small frame does not overtake the queued large frame of its flow"""
+    async def run() -> tuple[list[int], list[int]]:
+        coalescer = PacketCoalescer(max_payload_size=1300, flush_deadline=0.01)
+        scheduler = SendScheduler(rate=100.0, window=1)
+        lanes = FlowLanes()
+        sent: list[int] = []
+
+        async def send(flows: frozenset, seqs: list[int]) -> None:
+            sent.extend(seqs)
+            lanes.release(flows)
+
+        # One flow: a full-size segment, then a small one, then a small one of another flow
+        for packet in (tcp_packet(1000, 1, 1200), tcp_packet(1000, 1201, 100), tcp_packet(2000, 1, 100)):
+            await coalescer.put(packet)
+
+        frame_lanes = []
+        while coalescer.qsize():
+            packets = await coalescer.get_batch()
+            payload_size = sum(PacketFramer.record_size(packet) for packet in packets)
+            flows = frozenset(coalescer.batch_flows)
+            lane = lanes.lane_for(flows, SendScheduler.priority_for(payload_size))
+            lanes.pin(flows, lane)
+            frame_lanes.append(lane)
+            seqs = [struct.unpack_from('!I', packet, 24)[0] for packet in packets]
+            await scheduler.submit(functools.partial(send, flows, seqs), lane)
+
+        scheduler.start()
+        while len(sent) < 3:
+            await asyncio.sleep(0.01)
+        await scheduler.close()
+        return frame_lanes, sent
+
+    frame_lanes, sent = asyncio.run(run())
+    assert frame_lanes[0] == SendScheduler.PRIORITY_BULK
+    # The second segment of the flow and the small one batched with it stay in the bulk lane
+    assert frame_lanes[1] == SendScheduler.PRIORITY_BULK
+    assert sent.index(1) < sent.index(1201)
@@ -0,0 +1,99 @@
+import os
+import random
+import struct
+from src.message_encoder.header_compressor import HeaderCompressor
+
+PACKETS_FILE = os.path.join(os.path.dirname(__file__), 'data', 'tcp_packets.txt')
+# TUN packet information header of an IPv4 packet
+PACKET_INFO_IPV4 = b'\x00\x00\x08\x00'
+
+
+def recorded_packets() -> list[bytes]:
+    with open(PACKETS_FILE, 'r', encoding='utf-8') as f:
+        return [bytes.fromhex(line) for line in f if line.strip() and not line.startswith('#')]
+
+
+def compressor(refresh_packets: int = HeaderCompressor.REFRESH_PACKETS) -> HeaderCompressor:
+    instance = HeaderCompressor()
+    instance.REFRESH_PACKETS = refresh_packets
+    return instance
+
+
+def through_lanes(records: list[bytes], rng: random.Random, lanes: int, max_lag: int) -> list[bytes]:
+    """Arrival order of records sent over random lanes, in order within a lane,
+    each lane delayed by up to max_lag records"""
+    lags = [rng.randint(0, max_lag) for _ in range(lanes)]
+    sent = [(index + lags[lane], lane, index) for index, lane in
+            ((index, rng.randrange(lanes)) for index in range(len(records)))]
+    return [records[index] for _, _, index in sorted(sent)]
+
+
+def test_round_trip_in_order():
+    packets = recorded_packets()
+    sender, receiver = compressor(), compressor()
+    restored = []
+    for packet in packets:
+        restored.extend(receiver.decompress(sender.compress(packet)))
+    assert restored == packets
+    assert sender.bytes_saved > 0
+    assert receiver.context_misses == 0
+
+
+def test_round_trip_with_packet_information_header():
+    packets = [PACKET_INFO_IPV4 + packet for packet in recorded_packets() if packet[0] >> 4 == 4]
+    sender, receiver = compressor(), compressor()
+    restored = []
+    for packet in packets:
+        restored.extend(receiver.decompress(sender.compress(packet)))
+    assert restored == packets
+
+
+def test_rebuilt_ipv4_header_checksum():
+    sender, receiver = compressor(), compressor()
+    for packet in recorded_packets():
+        for restored in receiver.decompress(sender.compress(packet)):
+            if restored[0] >> 4 == 4:
+                header = restored[:20]
+                assert sum(struct.unpack('!10H', header)) % 0xFFFF == 0
+
+
+def test_round_trip_across_lanes():
+    packets = recorded_packets()
+    for seed in range(200):
+        rng = random.Random(seed)
+        refresh_packets = rng.choice([4, 8, HeaderCompressor.REFRESH_PACKETS])
+        sender, receiver = compressor(refresh_packets), compressor()
+        records = [sender.compress(packet) for packet in packets]
+        restored = []
+        for record in through_lanes(records, rng, lanes=rng.randint(2, 3), max_lag=refresh_packets):
+            restored.extend(receiver.decompress(record))
+        assert sorted(restored) == sorted(packets), f"seed {seed}"
+        assert receiver.context_misses == 0, f"seed {seed}"
+
+
+def test_lost_records_never_corrupt():
+    packets = recorded_packets()
+    for seed in range(100):
+        rng = random.Random(seed)
+        sender, receiver = compressor(rng.choice([4, 16])), compressor()
+        records = [sender.compress(packet) for packet in packets]
+        arrived = [record for record in records if rng.random() >= 0.2]
+        restored = []
+        for record in through_lanes(arrived, rng, lanes=2, max_lag=4):
+            restored.extend(receiver.decompress(record))
+        assert set(restored) <= set(packets), f"seed {seed}"
+        assert len(restored) == len(set(restored))
+
+
+def test_reset_forgets_contexts():
+    packets = [packet for packet in recorded_packets() if packet[0] >> 4 == 4 and packet[9] == 6]
+    sender, receiver = compressor(), compressor()
+    for packet in packets[:10]:
+        receiver.decompress(sender.compress(packet))
+    # Restarted receiver only decodes what follows a new full record
+    receiver = compressor()
+    record = sender.compress(packets[10])
+    assert record[0] == HeaderCompressor.COMPRESSED
+    assert receiver.decompress(record) == []
+    sender.reset()
+    assert receiver.decompress(sender.compress(packets[11])) == [packets[11]]
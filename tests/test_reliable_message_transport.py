@@ -0,0 +1,150 @@
+import asyncio
+import functools
+from src.core.send_scheduler import SendScheduler
+from src.message_transports.loopback.loopback_message_transport import LoopbackLink, LoopbackMessageTransport
+from src.message_transports.reliable_message_transport import ReliableMessageTransport
+
+
+async def start_end(link: LoopbackLink, received: list) -> ReliableMessageTransport:
+    transport = ReliableMessageTransport(LoopbackMessageTransport(link, {}), ack_delay=0.01)
+
+    async def handle(data: bytes) -> None:
+        received.append(data)
+
+    transport.set_data_handler(handle)
+    await transport.connect()
+    return transport
+
+
+async def restart(link: LoopbackLink, end: ReliableMessageTransport, received: list) -> ReliableMessageTransport:
+    """Replace end by a fresh instance, as a restarted peer process"""
+    await end.disconnect()
+    link.ends.remove(end.transport)
+    received.clear()
+    return await start_end(link, received)
+
+
+async def wait_for(condition, timeout: float = 5.0) -> None:
+    async def poll() -> None:
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+async def exchange_after_restart(announce: bool) -> None:
+    link = LoopbackLink(latency=0.01)
+    received_a: list[bytes] = []
+    received_b: list[bytes] = []
+    a = await start_end(link, received_a)
+    b = await start_end(link, received_b)
+
+    for i in range(20):
+        await a.send_data(b"a%d" % i)
+        await b.send_data(b"b%d" % i)
+    await wait_for(lambda: len(received_a) == 20 and len(received_b) == 20)
+
+    b = await restart(link, b, received_b)
+    if announce:
+        await b.send_control("ready")
+        await asyncio.sleep(0.05)
+    else:
+        # Without "ready" the first frame of the new epoch resynchronises
+        await b.send_data(b"hello")
+        await wait_for(lambda: received_a[-1:] == [b"hello"])
+
+    # More than a window of frames proves nothing is dropped beyond the receive buffer
+    sent = [b"after%d" % i for i in range(a.window + 50)]
+    await asyncio.wait_for(asyncio.gather(*(a.send_data(data) for data in sent)), 5.0)
+    await wait_for(lambda: received_b == sent)
+    await b.send_data(b"reply")
+    await wait_for(lambda: received_a[-1:] == [b"reply"])
+    await wait_for(lambda: a.in_flight == 0 and b.in_flight == 0)
+
+    await a.disconnect()
+    await b.disconnect()
+
+
+def test_in_order_delivery_with_loss():
+    async def run() -> None:
+        link = LoopbackLink(latency=0.01, jitter=0.02, loss=0.1, seed=1)
+        received_a: list[bytes] = []
+        received_b: list[bytes] = []
+        a = await start_end(link, received_a)
+        b = await start_end(link, received_b)
+        a.rto = b.rto = a.MIN_RTO = b.MIN_RTO = 0.1
+        sent = [b"frame%d" % i for i in range(100)]
+        for data in sent:
+            await a.send_data(data)
+        await wait_for(lambda: received_b == sent, 20.0)
+        await a.disconnect()
+        await b.disconnect()
+
+    asyncio.run(run())
+
+
+def test_peer_restart_with_ready():
+    asyncio.run(exchange_after_restart(announce=True))
+
+
+def test_peer_restart_without_ready():
+    asyncio.run(exchange_after_restart(announce=False))
+
+
+def test_identical_payloads_get_own_sequences():
+    async def run() -> None:
+        link = LoopbackLink(latency=0.01)
+        received_a: list[bytes] = []
+        received_b: list[bytes] = []
+        a = await start_end(link, received_a)
+        b = await start_end(link, received_b)
+        # Equal but distinct payload objects, as frames of a repeated packet
+        sent = [bytes(bytearray(b"same")) for _ in range(5)]
+        await asyncio.gather(*(a.send_data(data) for data in sent))
+        await wait_for(lambda: len(received_b) == 5)
+        assert received_b == sent
+        await a.disconnect()
+        await b.disconnect()
+
+    asyncio.run(run())
+
+
+def test_acks_and_retransmissions_go_through_scheduler():
+    async def run() -> None:
+        link = LoopbackLink(latency=0.01, loss=0.2, seed=3)
+        received_a: list[bytes] = []
+        received_b: list[bytes] = []
+        a = await start_end(link, received_a)
+        b = await start_end(link, received_b)
+        a.rto = b.rto = a.MIN_RTO = b.MIN_RTO = 0.1
+        schedulers = []
+        for end in (a, b):
+            end.scheduler = SendScheduler(rate=200, window=4)
+            end.scheduler.start()
+            schedulers.append(end.scheduler)
+        # The scheduler is shared with the wrapped transport
+        assert a.transport.scheduler is schedulers[0]
+
+        submitted = []
+        submit_nowait = SendScheduler.submit_nowait
+
+        def record(scheduler: SendScheduler, job, priority: int) -> None:
+            submitted.append((job.func.__name__ if hasattr(job, 'func') else job.__name__, priority))
+            submit_nowait(scheduler, job, priority)
+
+        for scheduler in schedulers:
+            scheduler.submit_nowait = functools.partial(record, scheduler)
+
+        sent = [b"frame%d" % i for i in range(50)]
+        for data in sent:
+            await schedulers[0].submit(functools.partial(a.send_data, data), SendScheduler.PRIORITY_INTERACTIVE)
+        await wait_for(lambda: received_b == sent, 20.0)
+
+        kinds = {name for name, _ in submitted}
+        assert kinds == {'_retransmit', '_transmit_ack'}
+        assert {priority for _, priority in submitted} == {SendScheduler.PRIORITY_CONTROL}
+        for scheduler in schedulers:
+            await scheduler.close()
+        await a.disconnect()
+        await b.disconnect()
+
+    asyncio.run(run())
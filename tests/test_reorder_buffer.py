@@ -0,0 +1,50 @@
+from src.core.reorder_buffer import ReorderBuffer
+
+
+def test_first_frame_overtaken():
+    buffer = ReorderBuffer()
+    assert buffer.push(1, 'b') == []
+    assert buffer.push(0, 'a') == ['a', 'b']
+    assert buffer.late_frames == 0
+
+
+def test_first_frame_overtaken_after_reset():
+    buffer = ReorderBuffer()
+    assert buffer.push(0, 'a') == ['a']
+    buffer.reset()
+    assert buffer.push(1, 'y') == []
+    assert buffer.push(0, 'x') == ['x', 'y']
+
+
+def test_late_duplicate_dropped():
+    buffer = ReorderBuffer()
+    assert buffer.push(0, 'a') == ['a']
+    assert buffer.push(0, 'a') == []
+    assert buffer.late_frames == 1
+
+
+def test_peer_already_sending():
+    buffer = ReorderBuffer()
+    # Numbering already wrapped around when this side started, it starts there
+    start = ReorderBuffer.SEQUENCE_MODULO - 2
+    assert buffer.push(start, 'a') == ['a']
+    assert buffer.push(0, 'c') == []
+    assert buffer.push(start + 1, 'b') == ['b', 'c']
+    assert buffer.push(start - 1, 'z') == []
+    assert buffer.late_frames == 1
+
+
+def test_gap_skipped_after_timeout():
+    buffer = ReorderBuffer(gap_timeout=1.0)
+    assert buffer.push(5, 'f') == []
+    assert buffer.expire(buffer.next_expiry()) == ['f']
+    assert buffer.skipped_frames == 5
+
+
+def test_gap_skipped_over_capacity():
+    buffer = ReorderBuffer(capacity=2)
+    assert buffer.push(0, 'a') == ['a']
+    assert buffer.push(2, 'c') == []
+    assert buffer.push(3, 'd') == []
+    assert buffer.push(4, 'e') == ['c', 'd', 'e']
+    assert buffer.skipped_frames == 1
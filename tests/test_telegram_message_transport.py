@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from pyrogram.errors import MessageTooLong, Unauthorized
+from src.emulator.telegram_emulator import TelegramEmulator
+from src.message_transports.telegram.telegram_message_transport import TelegramMessageTransport
+
+
+async def start_transport(emulator: TelegramEmulator, accounts: list[str]) -> TelegramMessageTransport:
+    transport = TelegramMessageTransport({
+        'api_id': 0, 'api_hash': '', 'client_factory': emulator.create_client,
+        'accounts': [{'session_name': name, 'peer_username': 'peer', 'rate_limit': 100} for name in accounts],
+    })
+    await transport.connect()
+    return transport
+
+
+def test_message_error_does_not_block_account():
+    async def run() -> None:
+        emulator = TelegramEmulator(max_message_length=10)
+        emulator.create_client({'session_name': 'peer'})
+        transport = await start_transport(emulator, ['a', 'b'])
+        attempts = []
+        for account in transport.accounts:
+            def counted(send_message):
+                async def send(*args, **kwargs):
+                    attempts.append(1)
+                    return await send_message(*args, **kwargs)
+                return send
+            account.client.send_message = counted(account.client.send_message)
+
+        with pytest.raises(MessageTooLong):
+            await transport.send_control("x" * 20)
+        # Not retried on the other account, and no account is blocked
+        assert len(attempts) == 1
+        assert all(account.blocked_until == 0.0 for account in transport.accounts)
+        await transport.send_control("ok")
+        assert emulator.messages_sent == 1
+        await transport.disconnect()
+        await emulator.stop()
+
+    asyncio.run(run())
+
+
+def test_account_error_falls_back_to_next_account():
+    async def run() -> None:
+        emulator = TelegramEmulator()
+        emulator.create_client({'session_name': 'peer'})
+        transport = await start_transport(emulator, ['a', 'b'])
+        broken = transport.accounts[0]
+
+        async def unauthorized(*args, **kwargs):
+            raise Unauthorized()
+
+        broken.client.send_message = unauthorized
+        await transport.send_control("first")
+        await transport.send_control("second")
+        assert broken.blocked_until > 0.0
+        assert transport.accounts[1].blocked_until == 0.0
+        assert emulator.messages_sent == 2
+        await transport.disconnect()
+        await emulator.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+from src.core.tunnel_manager import TunnelManager
+from src.data_transports.loopback.loopback_data_transport import LoopbackDataTransport
+from src.message_transports.base_message_transport import MessageTransport
+from src.message_transports.loopback.loopback_message_transport import LoopbackLink, LoopbackMessageTransport
+from src.message_transports.reliable_message_transport import ReliableMessageTransport
+
+
+class TextOnlyTransport(LoopbackMessageTransport):
+    """Loopback end without a bulk channel, like VK"""
+
+    supports_bulk = False
+    send_bulk = MessageTransport.send_bulk
+
+
+def test_bulk_threshold_needs_bulk_channel():
+    link = LoopbackLink()
+    transport = TextOnlyTransport(link, {'bulk_threshold': 64})
+    with pytest.raises(ValueError):
+        TunnelManager(transport, LoopbackDataTransport({}))
+    with pytest.raises(ConnectionError):
+        asyncio.run(transport.send_bulk(b'frame'))
+
+
+def test_layer_takes_bulk_channel_of_wrapped_transport():
+    link = LoopbackLink()
+    text_only = ReliableMessageTransport(TextOnlyTransport(link, {}))
+    with_bulk = ReliableMessageTransport(LoopbackMessageTransport(link, {'bulk_threshold': 64}))
+    assert not text_only.supports_bulk
+    assert with_bulk.supports_bulk
+    TunnelManager(with_bulk, LoopbackDataTransport({}))
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import socket
+from src.emulator.vk_api_emulator import VKApiEmulator
+from src.message_transports.vk.vk_message_transport import VKMessageTransport
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for(condition, timeout: float = 5.0) -> None:
+    async def poll() -> None:
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+class Peers:
+    """Emulator with a sending transport of user 1 and a receiving one of user 2"""
+
+    def __init__(self, **emulator_options):
+        self.emulator = VKApiEmulator('127.0.0.1', free_port(), **emulator_options)
+        self.sender = VKMessageTransport({'access_token': '1', 'peer_id': 2, 'api_url': self.emulator.api_url})
+        self.receiver = VKMessageTransport({'access_token': '2', 'peer_id': 1, 'api_url': self.emulator.api_url})
+        # Short polls, the emulator finishes open polls before it stops
+        self.sender.LONG_POLL_WAIT = self.receiver.LONG_POLL_WAIT = 1
+        self.received: list = []
+        self.batches: list[int] = []
+        self.server_requests = 0
+
+        async def handle_data(data: bytes) -> None:
+            self.received.append(data)
+
+        async def handle_control(message: str) -> None:
+            self.received.append(message)
+
+        self.receiver.set_data_handler(handle_data)
+        self.receiver.set_control_handler(handle_control)
+
+        handle_updates = self.receiver._handle_updates
+
+        async def count_batch(updates: list) -> None:
+            self.batches.append(len(updates))
+            await handle_updates(updates)
+
+        self.receiver._handle_updates = count_batch
+
+        get_server = self.emulator._method_messages_getLongPollServer
+
+        async def count_server_requests(user, params):
+            if user.user_id == 2:
+                self.server_requests += 1
+            return await get_server(user, params)
+
+        self.emulator._method_messages_getLongPollServer = count_server_requests
+
+        # ts and failed code of the receiver's polls
+        self.polls: list[tuple[int, int]] = []
+        # Called with the failed code after a receiver poll was answered
+        self.after_poll = None
+        handle_long_poll = self.emulator._handle_long_poll
+
+        async def record_poll(request):
+            user = self.emulator._find_user_by_key(request.query.get('key', ''))
+            response = await handle_long_poll(request)
+            if user is not None and user.user_id == 2:
+                failed = json.loads(response.text).get('failed', 0)
+                self.polls.append((int(request.query['ts']), failed))
+                if self.after_poll is not None:
+                    await self.after_poll(failed)
+            return response
+
+        self.emulator._handle_long_poll = record_poll
+
+    async def __aenter__(self) -> 'Peers':
+        await self.emulator.start()
+        await self.sender.connect()
+        await self.receiver.connect()
+        await wait_for(lambda: self.server_requests == 1)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.sender.disconnect()
+        await self.receiver.disconnect()
+        await self.emulator.stop()
+
+    async def send(self, *payloads: bytes) -> None:
+        await asyncio.gather(*(self.sender.send_data(payload) for payload in payloads))
+
+
+def test_batch_decoded_in_order():
+    async def run() -> None:
+        async with Peers() as peers:
+            sent = [b"frame%d" % i for i in range(20)]
+            # One execute request, its messages arrive in one poll
+            await asyncio.gather(
+                *(peers.sender.send_data(data) for data in sent[:10]),
+                peers.sender.send_control("ping"),
+                *(peers.sender.send_data(data) for data in sent[10:])
+            )
+            await wait_for(lambda: len(peers.received) == 21)
+            assert peers.received == sent[:10] + ["ping"] + sent[10:]
+            assert max(peers.batches) > 1
+
+    asyncio.run(run())
+
+
+def test_history_lost_continues_from_new_ts():
+    async def run() -> None:
+        async with Peers(max_events=5) as peers:
+            # More events than the emulator keeps arrive before the poll answers: failed=1
+            await peers.send(*(b"lost%d" % i for i in range(20)))
+            await peers.send(b"after")
+            await wait_for(lambda: peers.received[-1:] == [b"after"])
+            assert len(peers.received) < 21
+            # Same server and key, only ts moved on
+            assert peers.server_requests == 1
+
+    asyncio.run(run())
+
+
+def test_expired_key_refreshed_without_loss():
+    async def run() -> None:
+        async with Peers(key_lifetime=0.2) as peers:
+            sent = []
+
+            async def send_on_expiry(failed: int) -> None:
+                # A message arriving while the key is refreshed must not be skipped
+                if failed == 2 and b"refresh" not in sent:
+                    sent.append(b"refresh")
+                    await peers.emulator._method_messages_send(peers.emulator.users[1], {
+                        'peer_id': '2', 'random_id': '1', 'message': peers.sender.encoder.encode_message(b"refresh")
+                    })
+
+            peers.after_poll = send_on_expiry
+            for i in range(5):
+                sent.append(b"frame%d" % i)
+                await peers.send(sent[-1])
+                await asyncio.sleep(0.3)
+            # Every poll after the key lifetime gets failed=2, ts stays valid
+            await wait_for(lambda: sorted(peers.received) == sorted(sent))
+            assert b"refresh" in sent
+            assert peers.server_requests > 1
+            expired = [index for index, (_, failed) in enumerate(peers.polls[:-1]) if failed == 2]
+            assert expired
+            for index in expired:
+                assert peers.polls[index + 1][0] == peers.polls[index][0]
+
+    asyncio.run(run())
+
+
+def test_expired_ts_gets_new_server():
+    async def run() -> None:
+        async with Peers() as peers:
+            await peers.send(b"before")
+            await wait_for(lambda: peers.received == [b"before"])
+            # The server lost the event log, the client ts is ahead of it: failed=3
+            user = peers.emulator.users[2]
+            user.events.clear()
+            user.first_ts = 1
+            await wait_for(lambda: peers.server_requests == 2)
+            await peers.send(b"after")
+            await wait_for(lambda: peers.received == [b"before", b"after"])
+
+    asyncio.run(run())